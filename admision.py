@@ -0,0 +1,103 @@
+"""
+Control de admisión de peticiones HTTP
+Limita cuántas peticiones de cada clase (autenticación, escrituras, lecturas)
+se atienden a la vez y rechaza de inmediato las que exceden el límite con 503 y
+Retry-After, para que una ráfaga de logins no ocupe todos los hilos del
+servidor. Las sondas de salud no se limitan nunca.
+"""
+
+import threading
+
+from flask import g, jsonify
+
+class Clase:
+    """Contadores de una clase de peticiones"""
+
+    def __init__(self):
+        self.en_curso = 0
+        self.maximo_en_curso = 0
+        self.admitidas = 0
+        self.rechazadas = 0
+
+    def estado(self, limite):
+        """Contadores de la clase junto con su límite"""
+        return {
+            'limite': limite or None,
+            'en_curso': self.en_curso,
+            'maximo_en_curso': self.maximo_en_curso,
+            'admitidas': self.admitidas,
+            'rechazadas': self.rechazadas
+        }
+
+class ControlAdmision:
+    """Admite o rechaza peticiones de una aplicación Flask según su clase.
+
+    `clasificar()` se llama dentro de la petición y devuelve el nombre de la
+    clase, o None para las peticiones que se atienden siempre.
+    """
+
+    def __init__(self, app=None, clasificar=None):
+        self.clasificar = clasificar
+        self.clases = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registra la configuración por defecto y los hooks de admisión"""
+        app.config.setdefault('ADMISION_LIMITES', {})
+        app.config.setdefault('ADMISION_REINTENTO', 1)
+        self.app = app
+        app.extensions['admision'] = self
+        app.before_request(self._admitir)
+        app.teardown_request(self._liberar)
+
+    def entrar(self, nombre):
+        """Ocupa un lugar de la clase; devuelve False si está llena"""
+        # ADMISION_LIMITES: {clase: máximo en curso}; 0 o ausente es sin límite
+        limite = self.app.config['ADMISION_LIMITES'].get(nombre)
+        with self._lock:
+            clase = self.clases.get(nombre)
+            if clase is None:
+                clase = self.clases[nombre] = Clase()
+            if limite and clase.en_curso >= limite:
+                clase.rechazadas += 1
+                return False
+            clase.en_curso += 1
+            clase.admitidas += 1
+            clase.maximo_en_curso = max(clase.maximo_en_curso, clase.en_curso)
+            return True
+
+    def salir(self, nombre):
+        """Libera el lugar ocupado con entrar()"""
+        with self._lock:
+            self.clases[nombre].en_curso -= 1
+
+    def _admitir(self):
+        """Hook before_request: rechaza la petición si su clase está llena"""
+        nombre = self.clasificar() if self.clasificar else None
+        if nombre is None:
+            return None
+        if not self.entrar(nombre):
+            reintento = self.app.config['ADMISION_REINTENTO']
+            respuesta = jsonify({
+                'error': 'Servidor saturado, reintente en unos segundos',
+                'clase': nombre
+            })
+            respuesta.status_code = 503
+            respuesta.headers['Retry-After'] = str(reintento)
+            return respuesta
+        g.clase_admision = nombre
+        return None
+
+    def _liberar(self, error=None):
+        """Hook teardown_request: libera el lugar de la petición admitida"""
+        nombre = g.pop('clase_admision', None)
+        if nombre is not None:
+            self.salir(nombre)
+
+    def estado(self):
+        """Contadores de todas las clases"""
+        with self._lock:
+            limites = self.app.config['ADMISION_LIMITES']
+            return {nombre: clase.estado(limites.get(nombre)) for nombre, clase in self.clases.items()}
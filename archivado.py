@@ -0,0 +1,132 @@
+"""
+Archivado de tareas completadas antiguas
+Mueve por lotes las tareas completadas hace más de N días desde los shards a
+un archivo SQLite frío, y recupera espacio con VACUUM incremental
+"""
+
+import particionado
+
+# Columnas copiadas de tareas al archivo, en el mismo orden en ambas tablas
+COLUMNAS = ("id, usuario_id, titulo, descripcion, completada, fecha_creacion, "
+            "fecha_completada, prioridad, vence")
+
+# Columnas agregadas a tareas después de crear el archivo, con su tipo
+COLUMNAS_AGREGADAS = [('prioridad', 'INTEGER'), ('vence', 'TIMESTAMP')]
+
+class Archivador:
+    """Traslada tareas completadas antiguas al archivo frío"""
+
+    def __init__(self, shards, ruta_archivo, dias=30, lote=500, paginas_vacuum=1000,
+                 al_archivar=None):
+        self.shards = shards
+        self.ruta_archivo = ruta_archivo
+        self.dias = dias
+        self.lote = lote
+        self.paginas_vacuum = paginas_vacuum
+        # Función (conexión del shard, filas) llamada en la transacción de cada lote
+        self.al_archivar = al_archivar
+
+    def init_archivo(self):
+        """Crea la tabla de tareas archivadas"""
+        conn = particionado.conectar(self.ruta_archivo)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tareas_archivadas (
+                id INTEGER PRIMARY KEY,
+                usuario_id INTEGER NOT NULL,
+                titulo TEXT NOT NULL,
+                descripcion TEXT,
+                completada BOOLEAN,
+                fecha_creacion TIMESTAMP,
+                fecha_completada TIMESTAMP,
+                fecha_archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                prioridad INTEGER,
+                vence TIMESTAMP
+            )
+        ''')
+        # Archivos creados con una versión anterior de la tabla
+        existentes = {fila[1] for fila in cursor.execute("PRAGMA table_info(tareas_archivadas)")}
+        for columna, tipo in COLUMNAS_AGREGADAS:
+            if columna not in existentes:
+                cursor.execute(f"ALTER TABLE tareas_archivadas ADD COLUMN {columna} {tipo}")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_archivadas_usuario "
+            "ON tareas_archivadas (usuario_id, id)"
+        )
+        conn.commit()
+        conn.close()
+
+    def archivar_shard(self, ruta):
+        """Archiva por lotes las tareas antiguas de un shard; devuelve cuántas movió.
+
+        Cada lote se escribe y confirma primero en el archivo y después se borra
+        del shard, manteniendo el bloqueo de escritura del shard durante todo el
+        lote. Si el proceso se interrumpe entre ambos pasos, la siguiente
+        ejecución vuelve a insertar (sin duplicar) y completa el borrado.
+        """
+        conn = particionado.conectar(ruta)
+        archivo = particionado.conectar(self.ruta_archivo)
+        total = 0
+        try:
+            while True:
+                # Cada lote es una transacción corta para no bloquear escrituras
+                conn.execute("BEGIN IMMEDIATE")
+                filas = conn.execute(
+                    f"SELECT {COLUMNAS} FROM tareas "
+                    "WHERE completada = 1 AND fecha_completada < datetime('now', ?) "
+                    "LIMIT ?",
+                    (f'-{self.dias} days', self.lote)
+                ).fetchall()
+                if not filas:
+                    conn.rollback()
+                    break
+
+                archivo.executemany(
+                    f"INSERT OR IGNORE INTO tareas_archivadas ({COLUMNAS}) "
+                    f"VALUES ({', '.join('?' * len(filas[0]))})",
+                    filas
+                )
+                archivo.commit()
+
+                conn.executemany("DELETE FROM tareas WHERE id = ?", [(fila[0],) for fila in filas])
+                if self.al_archivar:
+                    self.al_archivar(conn, filas)
+                conn.commit()
+                total += len(filas)
+
+            # Devolver al sistema de archivos parte de las páginas liberadas
+            libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if libres:
+                # execute() avanza la sentencia un solo paso (una página liberada);
+                # executescript() la ejecuta hasta el final
+                conn.executescript(f"PRAGMA incremental_vacuum({int(self.paginas_vacuum)})")
+        finally:
+            archivo.close()
+            conn.close()
+
+        return total
+
+    def archivar(self):
+        """Archiva las tareas antiguas de todos los shards"""
+        return sum(self.archivar_shard(ruta) for ruta in self.shards.shards)
+
+    def eliminar_usuario(self, usuario_id):
+        """Borra las tareas archivadas de un usuario dado de baja"""
+        conn = particionado.conectar(self.ruta_archivo)
+        try:
+            conn.execute("DELETE FROM tareas_archivadas WHERE usuario_id = ?", (usuario_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def listar(self, usuario_id):
+        """Filas archivadas de un usuario, con las columnas de la API de tareas"""
+        conn = particionado.conectar(self.ruta_archivo)
+        try:
+            return conn.execute(
+                "SELECT id, titulo, descripcion, completada, fecha_creacion, fecha_completada, "
+                "prioridad, vence FROM tareas_archivadas WHERE usuario_id = ? ORDER BY id",
+                (usuario_id,)
+            ).fetchall()
+        finally:
+            conn.close()
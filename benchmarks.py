@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del Sistema de Gestión de Tareas
+Mide operaciones sueltas (bcrypt, conexión a la base, plantillas) y cada ruta
+con el cliente de pruebas de Flask, guarda una línea base en JSON y compara
+ejecuciones nuevas contra ella. Sale con código 1 si alguna medición empeora
+más allá del umbral y del ruido observado.
+
+    python benchmarks.py --guardar      # registrar la línea base
+    python benchmarks.py                # comparar contra la línea base
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Ruta de la línea base por defecto (depende de la máquina: no se versiona)
+ARCHIVO_BASE = 'benchmarks_base.json'
+
+# Directorio del proyecto (para importar servidor en un proceso nuevo)
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Escala de la MAD para estimar la desviación estándar con datos normales
+ESCALA_MAD = 1.4826
+
+class Benchmark:
+    """Una operación a medir: `iteraciones` llamadas por repetición"""
+
+    def __init__(self, nombre, funcion, iteraciones=100):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.iteraciones = iteraciones
+
+    def medir(self, repeticiones=7):
+        """Tiempo por llamada (segundos) de cada repetición, tras una vuelta de calentamiento"""
+        muestras = []
+        for vuelta in range(repeticiones + 1):
+            inicio = time.perf_counter()
+            for _ in range(self.iteraciones):
+                self.funcion()
+            duracion = (time.perf_counter() - inicio) / self.iteraciones
+            if vuelta:
+                muestras.append(duracion)
+        return muestras
+
+def resumir(muestras):
+    """Mediana, dispersión robusta (MAD escalada) y mínimo de las muestras"""
+    mediana = statistics.median(muestras)
+    mad = statistics.median(abs(m - mediana) for m in muestras) * ESCALA_MAD
+    return {'mediana': mediana, 'mad': mad, 'minimo': min(muestras), 'muestras': muestras}
+
+def comparar(base, actual, umbral=0.10, sigmas=3.0):
+    """Clasifica una medición frente a la línea base.
+
+    Es regresión si la mediana empeora más que `umbral` (relativo) y además la
+    diferencia supera `sigmas` veces el ruido combinado de ambas ejecuciones.
+    """
+    diferencia = actual['mediana'] - base['mediana']
+    relativo = diferencia / base['mediana'] if base['mediana'] else 0.0
+    ruido = sigmas * (base['mad'] ** 2 + actual['mad'] ** 2) ** 0.5
+
+    if relativo > umbral and diferencia > ruido:
+        veredicto = 'regresion'
+    elif -relativo > umbral and -diferencia > ruido:
+        veredicto = 'mejora'
+    else:
+        veredicto = 'igual'
+    return {'relativo': relativo, 'veredicto': veredicto}
+
+def importar_en_proceso_nuevo(directorio, *opciones):
+    """Importa servidor en un intérprete nuevo (arranque en frío) y devuelve su stderr"""
+    resultado = subprocess.run(
+        [sys.executable, *opciones, '-c', 'import servidor'],
+        cwd=directorio, capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONPATH=DIRECTORIO)
+    )
+    return resultado.stderr
+
+def perfil_importacion(limite=15):
+    """Muestra los módulos que más tardan en importarse al cargar servidor"""
+    with tempfile.TemporaryDirectory() as directorio:
+        salida = importar_en_proceso_nuevo(directorio, '-X', 'importtime')
+
+    # Formato: "import time: propio | acumulado | módulo" (microsegundos)
+    modulos = []
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, modulo = linea[len('import time:'):].split('|')
+        modulos.append((int(acumulado), int(propio), modulo.rstrip()))
+
+    print(f"{'Módulo':<50} {'Propio (ms)':>12} {'Acumulado (ms)':>15}")
+    print("-" * 79)
+    for acumulado, propio, modulo in sorted(modulos, reverse=True)[:limite]:
+        print(f"{modulo:<50} {propio / 1000:12.2f} {acumulado / 1000:15.2f}")
+
+def crear_benchmarks(directorio):
+    """Prepara una base de datos temporal con un usuario y devuelve los benchmarks"""
+    import servidor
+    import particionado
+
+    servidor.configurar_bd(
+        os.path.join(directorio, 'tareas.db'),
+        rutas_shards=[os.path.join(directorio, 'tareas.db')],
+        ruta_archivo=os.path.join(directorio, 'tareas_archivo.db')
+    )
+    servidor.preparar()
+    servidor.app.config['TESTING'] = True
+
+    credenciales = {'usuario': 'bench', 'contraseña': 'bench1234'}
+    hash_guardado = servidor.hash_password(credenciales['contraseña'])
+
+    anonimo = servidor.app.test_client()
+    anonimo.post('/registro', json=credenciales)
+    autenticado = servidor.app.test_client()
+    autenticado.post('/login', json=credenciales)
+    for i in range(50):
+        autenticado.post('/api/tareas', json={
+            'titulo': f'Tarea {i}', 'descripcion': 'benchmark', 'prioridad': i % 4,
+            'vence': f'2030-01-{i % 28 + 1:02d}' if i % 2 else None
+        })
+
+    token = autenticado.post('/api/tokens', json={'nombre': 'bench'}).get_json()['token']
+    con_token = servidor.app.test_client()
+
+    # Lote de actualizaciones (no hace crecer la base entre iteraciones)
+    tareas = autenticado.get('/api/tareas').get_json()['tareas']
+    lote = {'operaciones': [{'op': 'actualizar', 'id': t['id'], 'prioridad': 1} for t in tareas]}
+
+    def conectar():
+        particionado.conectar(servidor.DB_NAME).close()
+
+    def renderizar():
+        with servidor.app.test_request_context():
+            servidor.render_template(
+                'tareas.html', usuario='bench',
+                fecha_actual=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
+
+    def ruta(cliente, metodo, url, **kwargs):
+        def pedir():
+            respuesta = cliente.open(url, method=metodo, **kwargs)
+            if respuesta.status_code >= 500:
+                raise RuntimeError(f"{metodo} {url}: HTTP {respuesta.status_code}")
+        return pedir
+
+    return [
+        # Arranque
+        Benchmark('importar servidor (proceso)', lambda: importar_en_proceso_nuevo(directorio), 1),
+        Benchmark('init_db (esquema al día)', servidor.init_db, 20),
+        # Micro
+        Benchmark('hash_password', lambda: servidor.hash_password(credenciales['contraseña']), 1),
+        Benchmark('verify_password', lambda: servidor.verify_password(credenciales['contraseña'], hash_guardado), 1),
+        Benchmark('conexion_bd', conectar, 200),
+        Benchmark('plantilla_tareas', renderizar, 100),
+        # Macro (rutas completas)
+        Benchmark('GET /', ruta(anonimo, 'GET', '/'), 50),
+        Benchmark('GET /status', ruta(anonimo, 'GET', '/status'), 50),
+        Benchmark('POST /login', ruta(anonimo, 'POST', '/login', json=credenciales), 1),
+        Benchmark('GET /tareas', ruta(autenticado, 'GET', '/tareas'), 50),
+        Benchmark('GET /api/tareas', ruta(autenticado, 'GET', '/api/tareas'), 50),
+        Benchmark('GET /api/tareas (token)',
+                  ruta(con_token, 'GET', '/api/tareas', headers={'Authorization': f'Bearer {token}'}), 50),
+        Benchmark('GET /api/tareas/siguientes', ruta(autenticado, 'GET', '/api/tareas/siguientes?k=10'), 50),
+        Benchmark('GET /api/estadisticas', ruta(autenticado, 'GET', '/api/estadisticas'), 50),
+        Benchmark('GET /api/tareas (gzip)',
+                  ruta(autenticado, 'GET', '/api/tareas', headers={'Accept-Encoding': 'gzip'}), 50),
+        Benchmark('POST /api/tareas/lote', ruta(autenticado, 'POST', '/api/tareas/lote', json=lote), 20),
+        *benchmarks_msgpack(autenticado, ruta, lote),
+        # Último: cada iteración agrega una tarea a las listas de los anteriores
+        Benchmark('POST /api/tareas', ruta(autenticado, 'POST', '/api/tareas', json={'titulo': 'Nueva'}), 50),
+    ]
+
+def benchmarks_msgpack(autenticado, ruta, lote):
+    """Las mismas rutas de listas y lotes en MessagePack (si está instalado)"""
+    import negociacion
+    if not negociacion.disponible():
+        return []
+    msgpack = negociacion.msgpack
+    accept = {'Accept': negociacion.MIMETYPE_MSGPACK}
+    return [
+        Benchmark('GET /api/tareas (msgpack)', ruta(autenticado, 'GET', '/api/tareas', headers=accept), 50),
+        Benchmark('POST /api/tareas/lote (msgpack)',
+                  ruta(autenticado, 'POST', '/api/tareas/lote', data=msgpack.packb(lote),
+                       content_type=negociacion.MIMETYPE_MSGPACK, headers=accept), 20),
+    ]
+
+def comparar_formatos(cantidad=500):
+    """Tamaño y tiempo de codificar/decodificar una lista de tareas en JSON y MessagePack"""
+    import gzip
+    import negociacion
+
+    tareas = {'tareas': [{
+        'id': i, 'titulo': f'Tarea {i}', 'descripcion': 'Descripción de la tarea de prueba',
+        'completada': bool(i % 3), 'fecha_creacion': '2030-01-01 12:00:00', 'fecha_completada': None,
+        'prioridad': i % 4, 'vence': '2030-02-01T00:00:00', 'etiquetas': ['trabajo', 'urgente']
+    } for i in range(cantidad)]}
+    formatos = {'json': (lambda d: json.dumps(d).encode('utf-8'), json.loads)}
+    if negociacion.disponible():
+        formatos['msgpack'] = (negociacion.msgpack.packb, negociacion.msgpack.unpackb)
+    else:
+        print("⚠️  msgpack no está instalado: solo se mide JSON")
+
+    print(f"\n{'Formato':<10} {'Bytes':>10} {'gzip':>10} {'Codificar (ms)':>15} {'Decodificar (ms)':>17}")
+    print("-" * 66)
+    for nombre, (codificar, decodificar) in formatos.items():
+        cuerpo = codificar(tareas)
+        tiempo_codificar = statistics.median(Benchmark(nombre, lambda: codificar(tareas), 20).medir())
+        tiempo_decodificar = statistics.median(Benchmark(nombre, lambda: decodificar(cuerpo), 20).medir())
+        print(f"{nombre:<10} {len(cuerpo):>10} {len(gzip.compress(cuerpo)):>10} "
+              f"{tiempo_codificar * 1000:>15.3f} {tiempo_decodificar * 1000:>17.3f}")
+
+def entorno():
+    """Datos de la máquina y configuración que condicionan los tiempos"""
+    import servidor
+    return {
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'bcrypt_rounds': servidor.BCRYPT_ROUNDS,
+    }
+
+def ejecutar(repeticiones, filtro=None):
+    """Ejecuta los benchmarks y devuelve {nombre: resumen}"""
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        for benchmark in crear_benchmarks(directorio):
+            if filtro and filtro not in benchmark.nombre:
+                continue
+            resultados[benchmark.nombre] = resumir(benchmark.medir(repeticiones))
+            print(f"  {benchmark.nombre:<32} {resultados[benchmark.nombre]['mediana'] * 1000:10.3f} ms")
+    return resultados
+
+def mostrar_comparacion(base, resultados, umbral, sigmas):
+    """Imprime la tabla de comparación y devuelve la lista de regresiones"""
+    iconos = {'regresion': '❌', 'mejora': '🚀', 'igual': '✅'}
+    regresiones = []
+
+    print(f"\n{'Benchmark':<32} {'Base (ms)':>10} {'Actual (ms)':>12} {'Cambio':>8}")
+    print("-" * 66)
+    for nombre, actual in resultados.items():
+        if nombre not in base['resultados']:
+            print(f"{nombre:<32} {'-':>10} {actual['mediana'] * 1000:12.3f} {'nuevo':>8}")
+            continue
+        anterior = base['resultados'][nombre]
+        comparacion = comparar(anterior, actual, umbral, sigmas)
+        print(f"{nombre:<32} {anterior['mediana'] * 1000:10.3f} {actual['mediana'] * 1000:12.3f} "
+              f"{comparacion['relativo']:+8.1%} {iconos[comparacion['veredicto']]}")
+        if comparacion['veredicto'] == 'regresion':
+            regresiones.append(nombre)
+    return regresiones
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmarks y control de regresiones de rendimiento")
+    parser.add_argument('--base', default=ARCHIVO_BASE, help=f"Archivo JSON de línea base (por defecto {ARCHIVO_BASE})")
+    parser.add_argument('--guardar', action='store_true', help="Guarda esta ejecución como nueva línea base")
+    parser.add_argument('--umbral', type=float, default=0.10,
+                        help="Empeoramiento relativo tolerado antes de fallar (por defecto 0.10)")
+    parser.add_argument('--sigmas', type=float, default=3.0,
+                        help="Veces el ruido combinado que debe superar la diferencia (por defecto 3)")
+    parser.add_argument('--repeticiones', type=int, default=7, help="Repeticiones por benchmark")
+    parser.add_argument('--filtro', help="Ejecuta solo los benchmarks cuyo nombre contenga este texto")
+    parser.add_argument('--formatos', action='store_true',
+                        help="Compara tamaño y CPU de JSON y MessagePack con una lista de tareas y termina")
+    parser.add_argument('--perfil-importacion', action='store_true',
+                        help="Muestra el tiempo de importación por módulo y termina")
+    args = parser.parse_args()
+
+    if args.perfil_importacion:
+        perfil_importacion()
+        return 0
+
+    if args.formatos:
+        comparar_formatos()
+        return 0
+
+    print("⏱️  Ejecutando benchmarks...")
+    resultados = ejecutar(args.repeticiones, args.filtro)
+    actual = {
+        'fecha': datetime.datetime.now().isoformat(),
+        'entorno': entorno(),
+        'resultados': resultados
+    }
+
+    if args.guardar:
+        with open(args.base, 'w', encoding='utf-8') as archivo:
+            json.dump(actual, archivo, indent=2)
+        print(f"\n💾 Línea base guardada en {args.base}")
+        return 0
+
+    if not os.path.exists(args.base):
+        print(f"\n❌ No existe la línea base {args.base}. Ejecuta primero con --guardar")
+        return 2
+
+    with open(args.base, encoding='utf-8') as archivo:
+        base = json.load(archivo)
+
+    if base.get('entorno') != actual['entorno']:
+        print("\n⚠️  La línea base se tomó en otro entorno; la comparación puede no ser válida")
+        for clave, valor in actual['entorno'].items():
+            if base.get('entorno', {}).get(clave) != valor:
+                print(f"   {clave}: {base.get('entorno', {}).get(clave)} -> {valor}")
+
+    regresiones = mostrar_comparacion(base, resultados, args.umbral, args.sigmas)
+    if regresiones:
+        print(f"\n❌ Regresiones de rendimiento: {', '.join(regresiones)}")
+        return 1
+    print("\n✅ Sin regresiones de rendimiento")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
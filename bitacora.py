@@ -0,0 +1,172 @@
+"""
+Registro estructurado (JSON por línea) del servidor
+Los registros se encolan con un QueueHandler y un QueueListener los escribe en
+un hilo propio, así ninguna petición espera al disco. Cada petición recibe un
+identificador (X-Request-ID) que acompaña a su línea de acceso, con la
+duración, y a todo lo que se registre mientras se atiende. Las peticiones
+exitosas pueden muestrearse; los errores y las lentas se registran siempre.
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+# Atributos propios de LogRecord: lo demás se agregó con extra= y va en la línea
+_ATRIBUTOS_ESTANDAR = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'id_peticion'}
+
+# Identificadores recibidos en X-Request-ID que se aceptan tal cual
+_ID_VALIDO = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro con fecha, nivel, logger, mensaje y campos extra"""
+
+    def format(self, record):
+        linea = {
+            'fecha': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        if getattr(record, 'id_peticion', None):
+            linea['id_peticion'] = record.id_peticion
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_ESTANDAR:
+                linea[clave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            linea['excepcion'] = record.exc_text
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+class FiltroPeticion(logging.Filter):
+    """Agrega a cada registro el identificador de la petición en curso"""
+
+    def filter(self, record):
+        if has_request_context() and 'id_peticion' in g:
+            record.id_peticion = g.id_peticion
+        return True
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) los registros si la cola está llena"""
+
+    descartados = 0
+
+    def prepare(self, record):
+        # Como QueueHandler.prepare, pero la excepción queda aparte del mensaje
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+def configurar(destino=None, nivel=logging.INFO, capacidad=10000):
+    """Envía los registros del proceso a `destino` (archivo o stderr) a través de una cola.
+
+    Devuelve el QueueListener ya iniciado; `detener` (también llamada al salir)
+    vacía la cola y lo detiene.
+    """
+    if destino:
+        salida = logging.handlers.WatchedFileHandler(destino, encoding='utf-8')
+    else:
+        salida = logging.StreamHandler(sys.stderr)
+    salida.setFormatter(FormatoJSON())
+
+    cola = queue.Queue(capacidad)
+    manejador = ManejadorCola(cola)
+    manejador.addFilter(FiltroPeticion())
+
+    raiz = logging.getLogger()
+    _quitar_manejadores(raiz)
+    raiz.addHandler(manejador)
+    raiz.setLevel(nivel)
+
+    oyente = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    oyente.start()
+    atexit.register(detener, oyente)
+    return oyente
+
+def detener(oyente):
+    """Deja de encolar registros, escribe los pendientes y detiene el hilo del oyente"""
+    _quitar_manejadores(logging.getLogger())
+    if oyente._thread is not None:
+        oyente.stop()
+        for manejador in oyente.handlers:
+            manejador.close()
+
+def _quitar_manejadores(logger):
+    """Quita de un logger los manejadores de cola instalados por configurar()"""
+    for manejador in [h for h in logger.handlers if isinstance(h, ManejadorCola)]:
+        logger.removeHandler(manejador)
+
+class Bitacora:
+    """Identificador por petición y línea de acceso (logger 'acceso') en una aplicación Flask"""
+
+    def __init__(self, app=None):
+        self.logger = logging.getLogger('acceso')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registra la configuración por defecto y los hooks de la petición.
+
+        Conviene registrarla antes que las demás extensiones: su after_request
+        corre al final y ve la respuesta ya comprimida.
+        """
+        # Fracción de las peticiones exitosas que se registran (errores y lentas, todas)
+        app.config.setdefault('BITACORA_MUESTREO', 1.0)
+        app.config.setdefault('BITACORA_LENTA_MS', 500)
+        self.app = app
+        app.extensions['bitacora'] = self
+        app.before_request(self._iniciar)
+        app.after_request(self._registrar)
+
+    def _iniciar(self):
+        """Hook before_request: asigna el identificador y toma el tiempo de inicio"""
+        recibido = request.headers.get('X-Request-ID', '')
+        g.id_peticion = recibido if _ID_VALIDO.match(recibido) else uuid.uuid4().hex
+        g.inicio_peticion = time.perf_counter()
+
+    def _registrar(self, response):
+        """Hook after_request: devuelve el identificador y registra la línea de acceso"""
+        if 'id_peticion' not in g:
+            return response
+        response.headers['X-Request-ID'] = g.id_peticion
+
+        ms = (time.perf_counter() - g.inicio_peticion) * 1000
+        exitosa = response.status_code < 400 and ms < self.app.config['BITACORA_LENTA_MS']
+        if exitosa and random.random() >= self.app.config['BITACORA_MUESTREO']:
+            return response
+        if not self.logger.isEnabledFor(logging.INFO):
+            return response
+
+        usuario = g.get('usuario')
+        self.logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'metodo': request.method,
+            'ruta': request.path,
+            'endpoint': request.endpoint,
+            'estado': response.status_code,
+            'ms': round(ms, 2),
+            'bytes': response.calculate_content_length(),
+            'usuario_id': usuario.id if usuario is not None else None,
+            'ip': request.remote_addr,
+        })
+        return response
@@ -0,0 +1,398 @@
+"""
+Caché local y cola de escritura diferida para el cliente de consola
+Guarda en un SQLite local las tareas y el estado del servidor (lecturas
+stale-while-revalidate) y encola las modificaciones de tareas para enviarlas
+agrupadas en segundo plano mediante /api/tareas/lote
+"""
+
+import collections
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from tareas_sdk import ESTADOS_REINTENTABLES, ClienteAPI, ErrorAPI, ErrorConexion
+
+# Errores tras los que un lote se reenvía igual y con la misma clave: 401 (se
+# envía de nuevo tras volver a iniciar sesión), 409 (el primer envío sigue en
+# curso en el servidor) y los de saturación. Los 5xx también se reenvían; el
+# resto de los 4xx son definitivos y el lote pasa a la tabla rechazadas
+ESTADOS_REENVIO = (401, 409) + ESTADOS_REINTENTABLES
+
+# Mensajes de error de la sincronización que se conservan
+MAX_ERRORES = 50
+
+class CacheCliente:
+    """Caché de lecturas y cola persistente de escrituras del cliente"""
+
+    def __init__(self, api: ClienteAPI, ruta: str = 'cliente_cache.db',
+                 ttl: float = 30.0, intervalo_envio: float = 2.0, lote: int = 100):
+        self.api = api
+        self.ttl = ttl
+        self.intervalo_envio = intervalo_envio
+        self.lote = lote
+        self.usuario: Optional[str] = None
+        self.errores: Deque[str] = collections.deque(maxlen=MAX_ERRORES)
+
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._refrescando = set()
+        self._envio = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = False
+        self._init_db()
+
+        self._hilo = threading.Thread(target=self._bucle, name='cola-cliente', daemon=True)
+        self._hilo.start()
+
+    def _init_db(self) -> None:
+        """Crea las tablas de la caché local"""
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    actualizado REAL NOT NULL
+                )
+            ''')
+            # Operaciones pendientes de enviar; los ids negativos son tareas
+            # creadas localmente que aún no tienen id del servidor. Las filas de
+            # un lote ya enviado guardan su Idempotency-Key (clave)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cola (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    usuario TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    tarea_id INTEGER,
+                    datos TEXT NOT NULL DEFAULT '{}',
+                    enviando INTEGER NOT NULL DEFAULT 0,
+                    clave TEXT
+                )
+            ''')
+            # Cachés creadas antes de la columna clave
+            columnas = {fila[1] for fila in self._conn.execute("PRAGMA table_info(cola)")}
+            if 'clave' not in columnas:
+                self._conn.execute("ALTER TABLE cola ADD COLUMN clave TEXT")
+            # Operaciones que el servidor rechazó de forma definitiva (4xx), con
+            # el motivo; quedan para consultarlas en lugar de reenviarse siempre
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS rechazadas (
+                    id INTEGER PRIMARY KEY,
+                    usuario TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    tarea_id INTEGER,
+                    datos TEXT NOT NULL,
+                    error TEXT NOT NULL
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS ids_temporales (
+                    temporal INTEGER PRIMARY KEY,
+                    real INTEGER NOT NULL
+                )
+            ''')
+            # Un lote interrumpido pudo llegar al servidor: se reenvía tal cual con
+            # su clave. Los que no tienen clave nunca se enviaron
+            self._conn.execute("UPDATE cola SET enviando = 0 WHERE clave IS NULL")
+
+    def usar_usuario(self, usuario: Optional[str]) -> None:
+        """Asocia la caché y la cola al usuario con sesión iniciada"""
+        self.usuario = usuario
+        if usuario:
+            self._despertar.set()
+
+    # Lecturas (stale-while-revalidate)
+
+    def _leer(self, clave: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT valor, actualizado FROM cache WHERE clave = ?", (clave,)
+            ).fetchone()
+        if fila is None:
+            return None
+        return json.loads(fila[0]), time.time() - fila[1]
+
+    def _guardar(self, clave: str, valor: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (clave, valor, actualizado) VALUES (?, ?, ?)",
+                (clave, json.dumps(valor), time.time())
+            )
+
+    def _revalidar(self, clave: str, cargar: Callable[[], Any]) -> None:
+        """Recarga una clave desde el servidor; los errores dejan la copia actual"""
+        try:
+            self._guardar(clave, cargar())
+        except (ErrorAPI, ErrorConexion):
+            pass
+        finally:
+            with self._lock:
+                self._refrescando.discard(clave)
+
+    def obtener(self, clave: str, cargar: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Devuelve (valor, desde_cache).
+
+        Si hay copia local se devuelve de inmediato y, cuando superó el TTL, se
+        revalida en segundo plano. Sin copia local se consulta al servidor.
+        """
+        guardado = self._leer(clave)
+        if guardado is None:
+            valor = cargar()
+            self._guardar(clave, valor)
+            return valor, False
+
+        valor, antiguedad = guardado
+        if antiguedad > self.ttl:
+            with self._lock:
+                lanzar = clave not in self._refrescando
+                self._refrescando.add(clave)
+            if lanzar:
+                threading.Thread(target=self._revalidar, args=(clave, cargar), daemon=True).start()
+        return valor, True
+
+    def estado(self) -> Tuple[Dict[str, Any], bool]:
+        """Estado del sistema"""
+        return self.obtener('status', self.api.estado)
+
+    def tareas(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Tareas del usuario, con las modificaciones pendientes ya aplicadas"""
+        lista, desde_cache = self.obtener(f'tareas:{self.usuario}', self.api.listar_tareas)
+        return self._aplicar_pendientes(lista), desde_cache
+
+    def _aplicar_pendientes(self, lista: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Vista optimista: aplica la cola local sobre la última copia del servidor"""
+        tareas = {tarea['id']: dict(tarea) for tarea in lista}
+        for op, tarea_id, datos in self._pendientes():
+            if op == 'crear':
+                tareas[tarea_id] = dict(datos, id=tarea_id, completada=bool(datos.get('completada')),
+                                        pendiente=True)
+            elif op == 'actualizar' and tarea_id in tareas:
+                tareas[tarea_id].update(datos, pendiente=True)
+            elif op == 'eliminar':
+                tareas.pop(tarea_id, None)
+        return list(tareas.values())
+
+    # Escrituras diferidas
+
+    def _pendientes(self) -> List[Tuple[str, int, Dict[str, Any]]]:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT op, tarea_id, datos FROM cola WHERE usuario = ? ORDER BY id",
+                (self.usuario,)
+            ).fetchall()
+        return [(op, tarea_id, json.loads(datos)) for op, tarea_id, datos in filas]
+
+    def cantidad_pendientes(self) -> int:
+        """Operaciones del usuario que aún no se enviaron"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cola WHERE usuario = ?", (self.usuario,)
+            ).fetchone()[0]
+
+    def _resolver_id(self, tarea_id: int) -> int:
+        """Traduce un id temporal ya confirmado por el servidor a su id real"""
+        if tarea_id >= 0:
+            return tarea_id
+        fila = self._conn.execute(
+            "SELECT real FROM ids_temporales WHERE temporal = ?", (tarea_id,)
+        ).fetchone()
+        return fila[0] if fila else tarea_id
+
+    def crear_tarea(self, titulo: str, descripcion: Optional[str] = None) -> int:
+        """Encola la creación de una tarea y devuelve su id temporal (negativo)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO cola (usuario, op, datos) VALUES (?, 'crear', ?)",
+                (self.usuario, json.dumps({'titulo': titulo, 'descripcion': descripcion}))
+            )
+            temporal = -cursor.lastrowid
+            self._conn.execute("UPDATE cola SET tarea_id = ? WHERE id = ?", (temporal, cursor.lastrowid))
+        self._despertar.set()
+        return temporal
+
+    def actualizar_tarea(self, tarea_id: int, **campos: Any) -> None:
+        """Encola una modificación, combinándola con otra pendiente si es posible"""
+        with self._lock:
+            tarea_id = self._resolver_id(tarea_id)
+            # Se combina con la creación o actualización pendiente que no se esté enviando
+            fila = self._conn.execute(
+                "SELECT id, datos FROM cola WHERE usuario = ? AND tarea_id = ? "
+                "AND op IN ('crear', 'actualizar') AND enviando = 0 ORDER BY id DESC LIMIT 1",
+                (self.usuario, tarea_id)
+            ).fetchone()
+            if fila:
+                datos = dict(json.loads(fila[1]), **campos)
+                self._conn.execute("UPDATE cola SET datos = ? WHERE id = ?", (json.dumps(datos), fila[0]))
+            else:
+                self._conn.execute(
+                    "INSERT INTO cola (usuario, op, tarea_id, datos) VALUES (?, 'actualizar', ?, ?)",
+                    (self.usuario, tarea_id, json.dumps(campos))
+                )
+        self._despertar.set()
+
+    def eliminar_tarea(self, tarea_id: int) -> None:
+        """Encola el borrado; si la tarea aún no llegó al servidor se descarta localmente"""
+        with self._lock:
+            tarea_id = self._resolver_id(tarea_id)
+            creacion = self._conn.execute(
+                "SELECT id FROM cola WHERE usuario = ? AND tarea_id = ? AND op = 'crear' AND enviando = 0",
+                (self.usuario, tarea_id)
+            ).fetchone()
+            self._conn.execute(
+                "DELETE FROM cola WHERE usuario = ? AND tarea_id = ? AND enviando = 0",
+                (self.usuario, tarea_id)
+            )
+            if not creacion:
+                self._conn.execute(
+                    "INSERT INTO cola (usuario, op, tarea_id) VALUES (?, 'eliminar', ?)",
+                    (self.usuario, tarea_id)
+                )
+        self._despertar.set()
+
+    def _tomar_lote(self) -> Tuple[Optional[str], List[Tuple[int, str, int, Dict[str, Any]]]]:
+        """Devuelve (clave, lote): el lote ya enviado sin confirmar o el próximo a enviar.
+
+        Un lote nuevo se marca como 'enviando' con una Idempotency-Key propia;
+        sus filas ya no se combinan ni se descartan, así que un reenvío con la
+        misma clave lleva exactamente el mismo cuerpo.
+        """
+        with self._lock:
+            pendiente = self._conn.execute(
+                "SELECT clave FROM cola WHERE usuario = ? AND clave IS NOT NULL ORDER BY id LIMIT 1",
+                (self.usuario,)
+            ).fetchone()
+            if pendiente:
+                filas = self._conn.execute(
+                    "SELECT id, op, tarea_id, datos FROM cola WHERE usuario = ? AND clave = ? ORDER BY id",
+                    (self.usuario, pendiente[0])
+                ).fetchall()
+                return pendiente[0], [(f, op, t, json.loads(d)) for f, op, t, d in filas]
+
+            filas = self._conn.execute(
+                "SELECT id, op, tarea_id, datos FROM cola "
+                "WHERE usuario = ? AND enviando = 0 ORDER BY id LIMIT ?",
+                (self.usuario, self.lote)
+            ).fetchall()
+
+            lote = []
+            for fila_id, op, tarea_id, datos in filas:
+                # Una operación sobre una tarea cuyo id real aún no se conoce
+                # corta el lote; se enviará cuando vuelva la creación
+                if op != 'crear' and tarea_id < 0:
+                    break
+                lote.append((fila_id, op, tarea_id, json.loads(datos)))
+
+            if not lote:
+                return None, lote
+            clave = uuid.uuid4().hex
+            self._conn.executemany(
+                "UPDATE cola SET enviando = 1, clave = ? WHERE id = ?",
+                [(clave, fila[0]) for fila in lote]
+            )
+        return clave, lote
+
+    def vaciar(self) -> int:
+        """Envía las operaciones pendientes en lotes; devuelve cuántas se enviaron"""
+        enviadas = 0
+        with self._envio:
+            while self.usuario:
+                clave, lote = self._tomar_lote()
+                if not lote:
+                    break
+
+                operaciones = []
+                for _, op, tarea_id, datos in lote:
+                    operacion = dict(datos, op=op)
+                    if op != 'crear':
+                        operacion['id'] = tarea_id
+                    operaciones.append(operacion)
+
+                try:
+                    resultados = self.api.lote_tareas(operaciones, clave_idempotencia=clave)
+                except ErrorConexion:
+                    # Un timeout de lectura puede llegar después de que el servidor
+                    # aplicó el lote: queda con su clave para reenviarlo sin duplicar
+                    break
+                except ErrorAPI as e:
+                    if e.status in ESTADOS_REENVIO or e.status >= 500:
+                        break
+                    # Un 4xx se repetiría igual en cada envío y trabaría la cola
+                    apartadas = self._apartar(lote, e.mensaje)
+                    self.errores.append(
+                        f"Sincronización rechazada ({e.status}): {e.mensaje}; "
+                        f"{apartadas} operación(es) apartadas"
+                    )
+                    continue
+
+                with self._lock:
+                    for (fila_id, op, tarea_id, _), resultado in zip(lote, resultados):
+                        if resultado['status'] >= 400:
+                            self.errores.append(f"{op} {tarea_id}: {resultado.get('error')}")
+                        elif op == 'crear':
+                            real = resultado['tarea']['id']
+                            self._conn.execute(
+                                "INSERT OR REPLACE INTO ids_temporales (temporal, real) VALUES (?, ?)",
+                                (tarea_id, real)
+                            )
+                            self._conn.execute(
+                                "UPDATE cola SET tarea_id = ? WHERE tarea_id = ?", (real, tarea_id)
+                            )
+                        self._conn.execute("DELETE FROM cola WHERE id = ?", (fila_id,))
+                enviadas += len(lote)
+
+            if enviadas:
+                self._revalidar(f'tareas:{self.usuario}', self.api.listar_tareas)
+        return enviadas
+
+    def _apartar(self, lote: List[Tuple[int, str, int, Dict[str, Any]]], error: str) -> int:
+        """Pasa a `rechazadas` un lote que el servidor no aceptó; devuelve cuántas operaciones.
+
+        Las operaciones encoladas sobre tareas creadas en el lote nunca tendrán
+        id real, así que se apartan con él.
+        """
+        ids = [fila[0] for fila in lote]
+        temporales = [tarea_id for _, op, tarea_id, _ in lote if op == 'crear']
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                condicion = (f"usuario = ? AND (id IN ({', '.join('?' * len(ids))}) "
+                             f"OR tarea_id IN ({', '.join('?' * len(temporales)) or 'NULL'}))")
+                parametros = (self.usuario, *ids, *temporales)
+                apartadas = self._conn.execute(
+                    "INSERT INTO rechazadas (id, usuario, op, tarea_id, datos, error) "
+                    f"SELECT id, usuario, op, tarea_id, datos, ? FROM cola WHERE {condicion}",
+                    (error, *parametros)
+                ).rowcount
+                self._conn.execute(f"DELETE FROM cola WHERE {condicion}", parametros)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return apartadas
+
+    def _bucle(self) -> None:
+        """Envía la cola periódicamente o cuando hay escrituras nuevas"""
+        while not self._detener:
+            self._despertar.wait(self.intervalo_envio)
+            self._despertar.clear()
+            # Pequeña espera para agrupar ráfagas de escrituras en un solo lote
+            time.sleep(0.2)
+            try:
+                self.vaciar()
+            except Exception as e:
+                self.errores.append(f"Error inesperado en la sincronización: {e}")
+
+    def cerrar(self) -> None:
+        """Intenta un último envío y cierra la caché"""
+        self._detener = True
+        self._despertar.set()
+        self._hilo.join(timeout=5)
+        try:
+            self.vaciar()
+        except Exception:
+            pass
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,84 @@
+"""
+Caché de usuarios autenticados del servidor
+LRU acotada con vencimiento por entrada para que las peticiones autenticadas no
+consulten la tabla usuarios. Los cambios de contraseña y las bajas incrementan
+un sello de versión en la base de datos; cada proceso lo relee como mucho una
+vez por intervalo y, si cambió, descarta su caché.
+"""
+
+import collections
+import threading
+import time
+
+class CacheUsuarios:
+    """Registros de usuario por usuario_id con LRU, TTL y sello de versión global"""
+
+    def __init__(self, cargar, leer_sello, capacidad=1024, ttl=60.0, intervalo_sello=1.0):
+        # cargar(usuario_id) -> registro o None; leer_sello() -> versión global
+        self.cargar = cargar
+        self.leer_sello = leer_sello
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.intervalo_sello = intervalo_sello
+        self._lock = threading.Lock()
+        self._entradas = collections.OrderedDict()
+        self._sello = None
+        self._proxima_verificacion = 0.0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, usuario_id):
+        """Registro del usuario (None si no existe), desde la caché si está vigente"""
+        ahora = time.monotonic()
+        self._verificar_sello(ahora)
+
+        with self._lock:
+            entrada = self._entradas.get(usuario_id)
+            if entrada is not None and entrada[1] > ahora:
+                self._entradas.move_to_end(usuario_id)
+                self.aciertos += 1
+                return entrada[0]
+            self.fallos += 1
+
+        # Los usuarios inexistentes no se guardan: una baja no debe quedar en caché
+        registro = self.cargar(usuario_id)
+        if registro is not None:
+            with self._lock:
+                self._entradas[usuario_id] = (registro, ahora + self.ttl)
+                self._entradas.move_to_end(usuario_id)
+                while len(self._entradas) > self.capacidad:
+                    self._entradas.popitem(last=False)
+        return registro
+
+    def invalidar(self, usuario_id):
+        """Descarta el registro de un usuario en este proceso"""
+        with self._lock:
+            self._entradas.pop(usuario_id, None)
+
+    def vaciar(self):
+        """Descarta todos los registros y fuerza a releer el sello"""
+        with self._lock:
+            self._entradas.clear()
+            self._proxima_verificacion = 0.0
+
+    def _verificar_sello(self, ahora):
+        """Relee el sello de versión si pasó el intervalo; si cambió, vacía la caché"""
+        if ahora < self._proxima_verificacion:
+            return
+        sello = self.leer_sello()
+        with self._lock:
+            if sello != self._sello:
+                self._entradas.clear()
+                self._sello = sello
+            self._proxima_verificacion = ahora + self.intervalo_sello
+
+    def estado(self):
+        """Tamaño y efectividad de la caché"""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'capacidad': self.capacidad,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'sello': self._sello
+            }
@@ -4,16 +4,22 @@ Cliente de consola para el Sistema de Gestión de Tareas
 Permite probar la API desde la línea de comandos
 """
 
-import requests
-import json
+import argparse
+import shlex
 import sys
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from cache_cliente import CacheCliente
+from tareas_sdk import ClienteAPI, ErrorAPI, ErrorConexion
 
 class ClienteTareas:
-    def __init__(self, base_url: str = "http://localhost:5000"):
+    def __init__(self, base_url: str = "http://localhost:5000", formato: str = 'json'):
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        self.session.headers.update({'Content-Type': 'application/json'})
+        self.api = ClienteAPI(self.base_url, formato=formato)
+        self.cache = CacheCliente(self.api)
     
     def mostrar_menu(self):
         """Muestra el menú principal"""
@@ -24,8 +30,11 @@ class ClienteTareas:
         print("2. 🔐 Iniciar sesión")
         print("3. 📋 Ver página de tareas")
         print("4. 📊 Ver estado del sistema")
-        print("5. 🚪 Cerrar sesión")
-        print("6. ❌ Salir")
+        print("5. 🗂️  Listar mis tareas")
+        print("6. ➕ Crear tarea")
+        print("7. ✔️  Completar tarea")
+        print("8. 🚪 Cerrar sesión")
+        print("9. ❌ Salir")
         print("="*50)
     
     def registrar_usuario(self):
@@ -43,24 +52,15 @@ class ClienteTareas:
             print("❌ La contraseña debe tener al menos 4 caracteres")
             return
         
-        data = {
-            "usuario": usuario,
-            "contraseña": contraseña
-        }
-        
         try:
-            response = self.session.post(f"{self.base_url}/registro", json=data)
-            
-            if response.status_code == 201:
-                result = response.json()
-                print(f"✅ {result['mensaje']}")
-                print(f"👤 Usuario: {result['usuario']}")
-                print(f"📅 Fecha: {result['fecha_registro']}")
-            else:
-                error = response.json().get('error', 'Error desconocido')
-                print(f"❌ Error: {error}")
+            result = self.api.registrar(usuario, contraseña)
+            print(f"✅ {result['mensaje']}")
+            print(f"👤 Usuario: {result['usuario']}")
+            print(f"📅 Fecha: {result['fecha_registro']}")
                 
-        except requests.exceptions.ConnectionError:
+        except ErrorAPI as e:
+            print(f"❌ Error: {e.mensaje}")
+        except ErrorConexion:
             print("❌ Error: No se puede conectar al servidor. ¿Está ejecutándose?")
         except Exception as e:
             print(f"❌ Error inesperado: {e}")
@@ -73,24 +73,16 @@ class ClienteTareas:
         usuario = input("Usuario: ").strip()
         contraseña = input("Contraseña: ").strip()
         
-        data = {
-            "usuario": usuario,
-            "contraseña": contraseña
-        }
-        
         try:
-            response = self.session.post(f"{self.base_url}/login", json=data)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ {result['mensaje']}")
-                print(f"👤 Usuario: {result['usuario']}")
-                print(f"🕐 Sesión iniciada: {result['sesion_iniciada']}")
-            else:
-                error = response.json().get('error', 'Error desconocido')
-                print(f"❌ Error: {error}")
+            result = self.api.iniciar_sesion(usuario, contraseña)
+            self.cache.usar_usuario(result['usuario'])
+            print(f"✅ {result['mensaje']}")
+            print(f"👤 Usuario: {result['usuario']}")
+            print(f"🕐 Sesión iniciada: {result['sesion_iniciada']}")
                 
-        except requests.exceptions.ConnectionError:
+        except ErrorAPI as e:
+            print(f"❌ Error: {e.mensaje}")
+        except ErrorConexion:
             print("❌ Error: No se puede conectar al servidor")
         except Exception as e:
             print(f"❌ Error inesperado: {e}")
@@ -100,20 +92,18 @@ class ClienteTareas:
         print("\n📋 ACCEDIENDO A TAREAS...")
         
         try:
-            response = self.session.get(f"{self.base_url}/tareas")
-            
-            if response.status_code == 200:
-                print("✅ Acceso exitoso a la página de tareas")
-                print("🌐 Abre tu navegador en: http://localhost:5000/tareas")
-                print("📄 La página HTML está disponible para visualización")
-            elif response.status_code == 401:
-                error = response.json().get('error', 'No autenticado')
-                print(f"❌ Error de autenticación: {error}")
+            self.api.pagina_tareas()
+            print("✅ Acceso exitoso a la página de tareas")
+            print(f"🌐 Abre tu navegador en: {self.base_url}/tareas")
+            print("📄 La página HTML está disponible para visualización")
+                
+        except ErrorAPI as e:
+            if e.status == 401:
+                print(f"❌ Error de autenticación: {e.mensaje}")
                 print("💡 Sugerencia: Inicia sesión primero")
             else:
-                print(f"❌ Error HTTP {response.status_code}")
-                
-        except requests.exceptions.ConnectionError:
+                print(f"❌ Error HTTP {e.status}")
+        except ErrorConexion:
             print("❌ Error: No se puede conectar al servidor")
         except Exception as e:
             print(f"❌ Error inesperado: {e}")
@@ -124,50 +114,114 @@ class ClienteTareas:
         print("-" * 25)
         
         try:
-            response = self.session.get(f"{self.base_url}/status")
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"🟢 Estado: {result['status']}")
-                print(f"💾 Base de datos: {result['database']}")
-                print(f"👥 Usuarios registrados: {result['usuarios_registrados']}")
-                print(f"📋 Tareas totales: {result['tareas_totales']}")
-                print(f"🕐 Timestamp: {result['timestamp']}")
-                print(f"📦 Versión: {result['version']}")
-            else:
-                print(f"❌ Error al obtener estado: HTTP {response.status_code}")
+            result, desde_cache = self.cache.estado()
+            if desde_cache:
+                print("💾 (datos en caché local, actualizándose en segundo plano)")
+            print(f"🟢 Estado: {result['status']}")
+            print(f"💾 Base de datos: {result['database']}")
+            print(f"👥 Usuarios registrados: {result['usuarios_registrados']}")
+            print(f"📋 Tareas totales: {result['tareas_totales']}")
+            print(f"🕐 Timestamp: {result['timestamp']}")
+            print(f"📦 Versión: {result['version']}")
                 
-        except requests.exceptions.ConnectionError:
+        except ErrorAPI as e:
+            print(f"❌ Error al obtener estado: HTTP {e.status}")
+        except ErrorConexion:
             print("❌ Error: No se puede conectar al servidor")
         except Exception as e:
             print(f"❌ Error inesperado: {e}")
     
+    def listar_tareas(self):
+        """Muestra las tareas del usuario desde la caché local"""
+        print("\n🗂️  MIS TAREAS")
+        print("-" * 25)
+        
+        if not self.cache.usuario:
+            print("💡 Inicia sesión primero")
+            return
+        
+        try:
+            tareas, desde_cache = self.cache.tareas()
+            if desde_cache:
+                print("💾 (datos en caché local, actualizándose en segundo plano)")
+            
+            if not tareas:
+                print("📭 No tienes tareas")
+            for tarea in tareas:
+                marca = "✅" if tarea.get('completada') else "⬜"
+                pendiente = " ⏳" if tarea.get('pendiente') else ""
+                print(f"{marca} [{tarea['id']}] {tarea['titulo']}{pendiente}")
+            
+            pendientes = self.cache.cantidad_pendientes()
+            if pendientes:
+                print(f"\n⏳ {pendientes} cambio(s) pendientes de sincronizar")
+            for error in list(self.cache.errores)[-3:]:
+                print(f"⚠️  {error}")
+                
+        except ErrorAPI as e:
+            print(f"❌ Error: {e.mensaje}")
+        except ErrorConexion:
+            print("❌ Error: No se puede conectar al servidor")
+    
+    def crear_tarea(self):
+        """Crea una tarea (se envía al servidor en segundo plano)"""
+        print("\n➕ NUEVA TAREA")
+        print("-" * 25)
+        
+        if not self.cache.usuario:
+            print("💡 Inicia sesión primero")
+            return
+        
+        titulo = input("Título: ").strip()
+        if not titulo:
+            print("❌ El título no puede estar vacío")
+            return
+        descripcion = input("Descripción (opcional): ").strip() or None
+        
+        tarea_id = self.cache.crear_tarea(titulo, descripcion)
+        print(f"✅ Tarea creada localmente (id temporal {tarea_id}), sincronizando...")
+    
+    def completar_tarea(self):
+        """Marca una tarea como completada (se envía en segundo plano)"""
+        print("\n✔️  COMPLETAR TAREA")
+        print("-" * 25)
+        
+        if not self.cache.usuario:
+            print("💡 Inicia sesión primero")
+            return
+        
+        try:
+            tarea_id = int(input("Id de la tarea: ").strip())
+        except ValueError:
+            print("❌ Id inválido")
+            return
+        
+        self.cache.actualizar_tarea(tarea_id, completada=True)
+        print("✅ Tarea marcada como completada, sincronizando...")
+    
     def cerrar_sesion(self):
         """Cierra la sesión actual"""
         print("\n🚪 CERRANDO SESIÓN...")
         
+        # Enviar los cambios pendientes antes de perder la sesión
+        self.cache.vaciar()
+        
         try:
-            response = self.session.post(f"{self.base_url}/logout")
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ {result['mensaje']}")
-                print(f"🕐 Fecha logout: {result['fecha_logout']}")
-            else:
-                print("❌ Error al cerrar sesión")
+            result = self.api.cerrar_sesion()
+            self.cache.usar_usuario(None)
+            print(f"✅ {result['mensaje']}")
+            print(f"🕐 Fecha logout: {result['fecha_logout']}")
                 
-        except requests.exceptions.ConnectionError:
+        except ErrorAPI:
+            print("❌ Error al cerrar sesión")
+        except ErrorConexion:
             print("❌ Error: No se puede conectar al servidor")
         except Exception as e:
             print(f"❌ Error inesperado: {e}")
     
     def probar_servidor(self):
         """Verifica si el servidor está disponible"""
-        try:
-            response = self.session.get(f"{self.base_url}/status")
-            return response.status_code == 200
-        except:
-            return False
+        return self.api.disponible()
     
     def ejecutar(self):
         """Bucle principal del cliente"""
@@ -175,7 +229,7 @@ class ClienteTareas:
         
         # Verificar conexión al servidor
         if not self.probar_servidor():
-            print("❌ No se puede conectar al servidor en http://localhost:5000")
+            print(f"❌ No se puede conectar al servidor en {self.base_url}")
             print("💡 Asegúrate de que el servidor esté ejecutándose:")
             print("   python servidor.py")
             sys.exit(1)
@@ -185,7 +239,7 @@ class ClienteTareas:
         while True:
             try:
                 self.mostrar_menu()
-                opcion = input("\n👉 Selecciona una opción (1-6): ").strip()
+                opcion = input("\n👉 Selecciona una opción (1-9): ").strip()
                 
                 if opcion == '1':
                     self.registrar_usuario()
@@ -196,12 +250,18 @@ class ClienteTareas:
                 elif opcion == '4':
                     self.ver_estado()
                 elif opcion == '5':
-                    self.cerrar_sesion()
+                    self.listar_tareas()
                 elif opcion == '6':
+                    self.crear_tarea()
+                elif opcion == '7':
+                    self.completar_tarea()
+                elif opcion == '8':
+                    self.cerrar_sesion()
+                elif opcion == '9':
                     print("\n👋 ¡Hasta luego!")
                     break
                 else:
-                    print("❌ Opción inválida. Selecciona 1-6.")
+                    print("❌ Opción inválida. Selecciona 1-9.")
                 
                 input("\n⏸️  Presiona Enter para continuar...")
                 
@@ -211,11 +271,177 @@ class ClienteTareas:
             except Exception as e:
                 print(f"❌ Error inesperado: {e}")
                 input("⏸️  Presiona Enter para continuar...")
+        
+        self.cache.cerrar()
+
+class ModoScript:
+    """Ejecuta un archivo de comandos sin interacción, opcionalmente para varios usuarios.
+
+    Cada línea es un comando (`registro`, `login`, `crear`, `completar`,
+    `eliminar`, `listar`, `status`, `logout`); `{usuario}` y `{contraseña}` se
+    reemplazan por las credenciales del usuario en curso y `$ultima` por el id
+    de la última tarea creada. Las líneas vacías y las que empiezan con `#` se
+    ignoran.
+    """
+
+    COMANDOS = ('registro', 'login', 'crear', 'completar', 'eliminar', 'listar', 'status', 'logout')
+
+    # Argumentos obligatorios de cada comando
+    ARGUMENTOS = {'registro': 2, 'login': 2, 'crear': 1, 'completar': 1, 'eliminar': 1}
+
+    def __init__(self, base_url: str, comandos: List[List[str]], detener_en_error: bool = False,
+                 formato: str = 'json'):
+        self.base_url = base_url
+        self.comandos = comandos
+        self.formato = formato
+        self.detener_en_error = detener_en_error
+        self.tiempos: Dict[str, List[float]] = {}
+        self.errores: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_archivo(cls, ruta: str, base_url: str, **kwargs) -> 'ModoScript':
+        """Lee y valida un archivo de comandos"""
+        comandos = []
+        with open(ruta, encoding='utf-8') as archivo:
+            for numero, linea in enumerate(archivo, 1):
+                linea = linea.strip()
+                if not linea or linea.startswith('#'):
+                    continue
+                try:
+                    partes = shlex.split(linea)
+                except ValueError as e:
+                    raise ValueError(f"Línea {numero}: {e}") from e
+                if partes[0] not in cls.COMANDOS:
+                    raise ValueError(f"Línea {numero}: comando desconocido '{partes[0]}'")
+                comandos.append(partes)
+        return cls(base_url, comandos, **kwargs)
+
+    def _registrar_tiempo(self, comando: str, segundos: float, ok: bool) -> None:
+        with self._lock:
+            self.tiempos.setdefault(comando, []).append(segundos)
+            if not ok:
+                self.errores[comando] = self.errores.get(comando, 0) + 1
+
+    def _ejecutar_comando(self, api: ClienteAPI, partes: List[str], contexto: Dict[str, str]) -> str:
+        """Ejecuta un comando y devuelve una línea de resultado"""
+        comando, args = partes[0], []
+        for arg in partes[1:]:
+            # Solo se reemplazan las credenciales; cualquier otra llave queda tal cual
+            arg = arg.replace('{usuario}', contexto['usuario']).replace('{contraseña}', contexto['contraseña'])
+            args.append(contexto.get('ultima', arg) if arg == '$ultima' else arg)
+        minimo = self.ARGUMENTOS.get(comando, 0)
+        if len(args) < minimo:
+            raise ValueError(f"'{comando}' requiere {minimo} argumento(s)")
+
+        if comando == 'registro':
+            return api.registrar(args[0], args[1])['mensaje']
+        if comando == 'login':
+            return api.iniciar_sesion(args[0], args[1])['mensaje']
+        if comando == 'crear':
+            tarea = api.crear_tarea(args[0], args[1] if len(args) > 1 else None)
+            contexto['ultima'] = str(tarea['id'])
+            return f"Tarea {tarea['id']} creada"
+        if comando == 'completar':
+            api.actualizar_tarea(int(args[0]), completada=True)
+            return f"Tarea {args[0]} completada"
+        if comando == 'eliminar':
+            return api.eliminar_tarea(int(args[0]))['mensaje']
+        if comando == 'listar':
+            return f"{len(api.listar_tareas())} tarea(s)"
+        if comando == 'status':
+            estado = api.estado()
+            return f"{estado['usuarios_registrados']} usuarios, {estado['tareas_totales']} tareas"
+        return api.cerrar_sesion()['mensaje']
+
+    def ejecutar_para(self, usuario: Optional[str] = None, contraseña: Optional[str] = None) -> bool:
+        """Ejecuta todo el script en una única sesión keep-alive"""
+        contexto = {'usuario': usuario or '', 'contraseña': contraseña or ''}
+        prefijo = f"[{usuario}] " if usuario else ""
+        exito = True
+
+        with ClienteAPI(self.base_url, formato=self.formato) as api:
+            for partes in self.comandos:
+                inicio = time.perf_counter()
+                try:
+                    resultado = self._ejecutar_comando(api, partes, contexto)
+                    ok = True
+                except (ErrorAPI, ErrorConexion, ValueError) as e:
+                    resultado = f"Error: {e}"
+                    ok = False
+                self._registrar_tiempo(partes[0], time.perf_counter() - inicio, ok)
+
+                print(f"{'✅' if ok else '❌'} {prefijo}{' '.join(partes)} → {resultado}")
+                if not ok:
+                    exito = False
+                    if self.detener_en_error:
+                        break
+        return exito
+
+    def ejecutar(self, usuarios: Optional[List[Tuple[str, str]]] = None, paralelo: int = 1) -> bool:
+        """Ejecuta el script una vez, o una vez por usuario repartido en hilos"""
+        if not usuarios:
+            return self.ejecutar_para()
+
+        with ThreadPoolExecutor(max_workers=max(1, paralelo)) as ejecutor:
+            resultados = list(ejecutor.map(lambda credenciales: self.ejecutar_para(*credenciales), usuarios))
+        return all(resultados)
+
+    def mostrar_resumen(self, total: float) -> None:
+        """Imprime cantidad, errores y latencias por comando"""
+        print("\n" + "=" * 72)
+        print("📊 RESUMEN DE TIEMPOS")
+        print("=" * 72)
+        print(f"{'Comando':<12}{'N':>6}{'Errores':>9}{'Media ms':>11}{'p50 ms':>10}{'p95 ms':>10}{'Máx ms':>10}")
+        for comando, tiempos in sorted(self.tiempos.items()):
+            ordenados = sorted(tiempos)
+            p50 = ordenados[len(ordenados) // 2]
+            p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+            print(f"{comando:<12}{len(tiempos):>6}{self.errores.get(comando, 0):>9}"
+                  f"{sum(tiempos) / len(tiempos) * 1000:>11.1f}{p50 * 1000:>10.1f}"
+                  f"{p95 * 1000:>10.1f}{ordenados[-1] * 1000:>10.1f}")
+        operaciones = sum(len(t) for t in self.tiempos.values())
+        print(f"\n⏱️  Tiempo total: {total:.2f}s — {operaciones} operaciones "
+              f"({operaciones / total if total else 0:.1f} op/s)")
+
+def leer_usuarios(valor: str) -> List[Tuple[str, str]]:
+    """Convierte 'ana:1234,bob:5678' en una lista de credenciales"""
+    usuarios = []
+    for par in valor.split(','):
+        if par.strip():
+            usuario, _, contraseña = par.strip().partition(':')
+            usuarios.append((usuario, contraseña))
+    return usuarios
 
 def main():
     """Función principal"""
-    cliente = ClienteTareas()
-    cliente.ejecutar()
+    parser = argparse.ArgumentParser(description="Cliente del Sistema de Gestión de Tareas")
+    parser.add_argument('--url', default="http://localhost:5000", help="URL base del servidor")
+    parser.add_argument('--script', help="Archivo de comandos a ejecutar sin interacción")
+    parser.add_argument('--usuarios', help="Credenciales usuario:contraseña separadas por comas; "
+                                           "el script se ejecuta una vez por usuario")
+    parser.add_argument('--paralelo', type=int, default=1, help="Usuarios ejecutados en paralelo")
+    parser.add_argument('--detener-en-error', action='store_true', help="Corta cada ejecución en el primer error")
+    parser.add_argument('--formato', choices=('json', 'msgpack'), default='json',
+                        help="Formato de las peticiones y respuestas (msgpack requiere el paquete msgpack)")
+    args = parser.parse_args()
+
+    if not args.script:
+        cliente = ClienteTareas(args.url, args.formato)
+        cliente.ejecutar()
+        return
+
+    try:
+        modo = ModoScript.desde_archivo(args.script, args.url, detener_en_error=args.detener_en_error,
+                                        formato=args.formato)
+    except (OSError, ValueError) as e:
+        print(f"❌ No se puede leer el script: {e}")
+        sys.exit(2)
+
+    inicio = time.perf_counter()
+    exito = modo.ejecutar(leer_usuarios(args.usuarios or ''), args.paralelo)
+    modo.mostrar_resumen(time.perf_counter() - inicio)
+    sys.exit(0 if exito else 1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,103 @@
+"""
+Middleware de compresión de respuestas HTTP
+Comprime con gzip/deflate las respuestas que superan un tamaño mínimo cuando
+el cliente lo acepta, reutilizando prefijos estáticos ya comprimidos
+"""
+
+import zlib
+
+from flask import request
+
+# wbits de zlib para cada codificación de Content-Encoding
+CODIFICACIONES = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+TIPOS_COMPRIMIBLES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/x-ndjson',
+    'application/msgpack',
+)
+
+class Compresor:
+    """Comprime respuestas de una aplicación Flask en un hook after_request"""
+
+    def __init__(self, app=None):
+        self._prefijos = []
+        self._estados = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registra la configuración por defecto y el hook de compresión"""
+        app.config.setdefault('COMPRESION_TAMAÑO_MINIMO', 500)
+        app.config.setdefault('COMPRESION_NIVEL', 6)
+        self.app = app
+        app.extensions['compresion'] = self
+        app.after_request(self._procesar_respuesta)
+
+    def registrar_prefijo(self, texto):
+        """Registra la porción estática inicial de una página para precomprimirla"""
+        prefijo = texto.encode('utf-8') if isinstance(texto, str) else texto
+        if prefijo and prefijo not in self._prefijos:
+            self._prefijos.append(prefijo)
+            # Los prefijos más largos se prueban primero
+            self._prefijos.sort(key=len, reverse=True)
+
+    def _estado_prefijo(self, prefijo, codificacion, nivel):
+        """Devuelve los bytes comprimidos del prefijo y el compresor que lo continúa"""
+        clave = (prefijo, codificacion, nivel)
+        estado = self._estados.get(clave)
+        if estado is None:
+            compresor = zlib.compressobj(nivel, zlib.DEFLATED, CODIFICACIONES[codificacion])
+            estado = (compresor.compress(prefijo), compresor)
+            self._estados[clave] = estado
+        return estado
+
+    def comprimir(self, cuerpo, codificacion, nivel=None):
+        """Comprime un cuerpo completo, aprovechando un prefijo precomprimido si coincide"""
+        if nivel is None:
+            nivel = self.app.config['COMPRESION_NIVEL']
+
+        for prefijo in self._prefijos:
+            if cuerpo.startswith(prefijo):
+                inicio, base = self._estado_prefijo(prefijo, codificacion, nivel)
+                compresor = base.copy()
+                return inicio + compresor.compress(cuerpo[len(prefijo):]) + compresor.flush()
+
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, CODIFICACIONES[codificacion])
+        return compresor.compress(cuerpo) + compresor.flush()
+
+    def _es_comprimible(self, response):
+        """Indica si la respuesta admite compresión según estado, tipo y cabeceras"""
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        mimetype = response.mimetype or ''
+        return mimetype.startswith(TIPOS_COMPRIMIBLES)
+
+    def _procesar_respuesta(self, response):
+        """Hook after_request: negocia la codificación y comprime el cuerpo"""
+        if not self._es_comprimible(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        codificacion = request.accept_encodings.best_match(list(CODIFICACIONES))
+        if codificacion is None:
+            return response
+
+        cuerpo = response.get_data()
+        if len(cuerpo) < self.app.config['COMPRESION_TAMAÑO_MINIMO']:
+            return response
+
+        response.set_data(self.comprimir(cuerpo, codificacion))
+        response.headers['Content-Encoding'] = codificacion
+        return response
@@ -0,0 +1,67 @@
+"""
+Fixtures de pytest para probar la API en proceso con el cliente de pruebas de Flask
+Cada prueba usa sus propios archivos SQLite temporales, por lo que la suite
+puede repartirse entre núcleos con pytest-xdist (pytest -n auto)
+"""
+
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import servidor
+
+USUARIO = "testuser"
+CONTRASEÑA = "test1234"
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Aplicación configurada sobre una base de datos temporal y bcrypt de bajo costo"""
+    monkeypatch.setattr(servidor, 'BCRYPT_ROUNDS', 4)
+    servidor.configurar_bd(
+        str(tmp_path / 'tareas.db'),
+        rutas_shards=[str(tmp_path / 'tareas.db')],
+        ruta_archivo=str(tmp_path / 'tareas_archivo.db')
+    )
+    servidor.preparar()
+    servidor.app.config['TESTING'] = True
+    return servidor.app
+
+@pytest.fixture
+def cliente(app):
+    """Cliente HTTP de pruebas sin sesión"""
+    return app.test_client()
+
+@pytest.fixture
+def usuario(cliente):
+    """Credenciales de un usuario ya registrado"""
+    datos = {"usuario": USUARIO, "contraseña": CONTRASEÑA}
+    respuesta = cliente.post('/registro', json=datos)
+    assert respuesta.status_code == 201
+    return datos
+
+@pytest.fixture
+def sesion(cliente, usuario):
+    """Cliente de pruebas con la sesión del usuario iniciada"""
+    respuesta = cliente.post('/login', json=usuario)
+    assert respuesta.status_code == 200
+    return cliente
+
+@pytest.fixture
+def admin(cliente, monkeypatch):
+    """Credenciales de un administrador ya registrado (ADMIN_USUARIOS lo incluye)"""
+    monkeypatch.setattr(servidor, 'ADMIN_USUARIOS', {"admin"})
+    datos = {"usuario": "admin", "contraseña": "admin123"}
+    respuesta = cliente.post('/registro', json=datos)
+    assert respuesta.status_code == 201
+    return datos
+
+@pytest.fixture
+def url_servidor(app):
+    """URL de la aplicación servida por HTTP en un puerto libre, para el SDK y el cliente"""
+    http = make_server('127.0.0.1', 0, app, threaded=True)
+    hilo = threading.Thread(target=http.serve_forever, daemon=True)
+    hilo.start()
+    yield f'http://127.0.0.1:{http.server_port}'
+    http.shutdown()
+    hilo.join()
@@ -0,0 +1,206 @@
+"""
+Cuerpos de las peticiones: límite de tamaño por ruta y lectura incremental
+Rechaza con 413 las peticiones cuyo Content-Length supera el límite de su ruta
+antes de leer el cuerpo, acota también los cuerpos enviados sin Content-Length
+y ofrece lectores que devuelven los elementos de un arreglo JSON o las líneas
+de un NDJSON a medida que llegan, sin cargar el cuerpo entero en memoria.
+"""
+
+import codecs
+import json
+import re
+
+from flask import jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import LimitedStream
+
+# Bytes leídos del flujo en cada lectura
+TAMAÑO_BLOQUE = 64 * 1024
+
+_ESPACIOS = re.compile(r'[ \t\n\r]*')
+
+# Caracteres que pueden seguir a un número sin terminarlo ('' es el final del búfer)
+_CONTINUA_NUMERO = ('', '.', 'e', 'E', '+', '-', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9')
+
+class ErrorCuerpo(ValueError):
+    """Cuerpo de la petición mal formado"""
+
+class _FlujoAcotado(LimitedStream):
+    """Flujo sin Content-Length acotado a `limit` bytes.
+
+    LimitedStream con is_max=True falla al leer después del límite, pero su
+    readall() devuelve el cuerpo truncado; aquí ambos fallan con 413 solo si el
+    cuerpo realmente continúa después del límite.
+    """
+
+    def on_exhausted(self):
+        if self._stream.read(1):
+            raise RequestEntityTooLarge()
+
+    def readall(self):
+        datos = super().readall()
+        if self.is_exhausted:
+            self.on_exhausted()
+        return datos
+
+class LimiteCuerpo:
+    """Límite de tamaño del cuerpo de las peticiones de una aplicación Flask.
+
+    `limite_de()` se llama dentro de la petición y devuelve el máximo en bytes
+    para su ruta, o None para usar CUERPO_MAXIMO.
+    """
+
+    def __init__(self, app=None, limite_de=None):
+        self.limite_de = limite_de
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registra la configuración por defecto, el hook y la respuesta 413"""
+        app.config.setdefault('CUERPO_MAXIMO', 64 * 1024)
+        self.app = app
+        app.extensions['cuerpos'] = self
+        app.before_request(self._verificar)
+        app.register_error_handler(RequestEntityTooLarge, self._demasiado_grande)
+
+    def limite(self):
+        """Máximo en bytes del cuerpo de la petición actual"""
+        limite = self.limite_de() if self.limite_de else None
+        return limite if limite is not None else self.app.config['CUERPO_MAXIMO']
+
+    def _verificar(self):
+        """Hook before_request: rechaza por Content-Length o acota el flujo sin él"""
+        limite = self.limite()
+        if request.content_length is not None:
+            if request.content_length > limite:
+                return self._demasiado_grande()
+        elif 'wsgi.input_terminated' in request.environ:
+            # Cuerpo sin Content-Length (chunked): la lectura falla al pasar el límite
+            request.environ['wsgi.input'] = _FlujoAcotado(
+                request.environ['wsgi.input'], limite, is_max=True
+            )
+        return None
+
+    def _demasiado_grande(self, error=None):
+        """Respuesta 413 en JSON con el límite de la ruta"""
+        respuesta = jsonify({'error': f'El cuerpo supera el máximo de {self.limite()} bytes'})
+        respuesta.status_code = 413
+        return respuesta
+
+class LectorJSON:
+    """Valores JSON consecutivos leídos de un flujo de bytes por bloques"""
+
+    def __init__(self, flujo, tamaño_bloque=TAMAÑO_BLOQUE):
+        self.flujo = flujo
+        self.tamaño_bloque = tamaño_bloque
+        self._decodificador = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._texto = ''
+        self._pos = 0
+        self._fin = False
+
+    def _leer(self):
+        """Agrega el próximo bloque al búfer; False si el flujo ya terminó"""
+        if self._fin:
+            return False
+        bloque = self.flujo.read(self.tamaño_bloque)
+        self._fin = not bloque
+        try:
+            texto = self._decodificador.decode(bloque, final=self._fin)
+        except UnicodeDecodeError as e:
+            raise ErrorCuerpo('El cuerpo no es UTF-8 válido') from e
+        # Lo ya consumido se descarta para que el búfer no crezca con el cuerpo
+        self._texto = self._texto[self._pos:] + texto
+        self._pos = 0
+        return not self._fin
+
+    def siguiente(self):
+        """Próximo carácter que no es espacio, sin consumirlo ('' al final del cuerpo)"""
+        while True:
+            self._pos = _ESPACIOS.match(self._texto, self._pos).end()
+            if self._pos < len(self._texto):
+                return self._texto[self._pos]
+            if not self._leer():
+                return ''
+
+    def esperar(self, caracter):
+        """Consume `caracter` o lanza ErrorCuerpo"""
+        if self.siguiente() != caracter:
+            raise ErrorCuerpo(f"JSON inválido: se esperaba '{caracter}'")
+        self._pos += 1
+
+    def valor(self):
+        """Decodifica el próximo valor JSON, leyendo bloques hasta tenerlo completo"""
+        while True:
+            self.siguiente()
+            try:
+                valor, fin = self._json.raw_decode(self._texto, self._pos)
+            except json.JSONDecodeError as e:
+                if self._leer():
+                    continue
+                raise ErrorCuerpo(f'JSON inválido: {e.msg}') from e
+            # Un número cortado por el bloque ("12." o "1e") se decodifica a medias
+            if (isinstance(valor, (int, float)) and not isinstance(valor, bool)
+                    and self._texto[fin:fin + 1] in _CONTINUA_NUMERO and self._leer()):
+                continue
+            self._pos = fin
+            return valor
+
+    def terminar(self):
+        """Verifica que no queden datos después del último valor"""
+        if self.siguiente():
+            raise ErrorCuerpo('JSON inválido: datos después del final')
+
+def leer_arreglo_json(flujo, campo):
+    """Genera los elementos del arreglo `campo` de un objeto JSON a medida que se leen.
+
+    Los demás campos del objeto se decodifican y se descartan.
+    """
+    lector = LectorJSON(flujo)
+    lector.esperar('{')
+    encontrado = False
+    if lector.siguiente() == '}':
+        lector.esperar('}')
+    else:
+        while True:
+            clave = lector.valor()
+            if not isinstance(clave, str):
+                raise ErrorCuerpo('JSON inválido: se esperaba el nombre de un campo')
+            lector.esperar(':')
+            if clave == campo:
+                encontrado = True
+                yield from _elementos(lector, campo)
+            else:
+                lector.valor()
+            if lector.siguiente() != ',':
+                break
+            lector.esperar(',')
+        lector.esperar('}')
+    lector.terminar()
+    if not encontrado:
+        raise ErrorCuerpo(f'Falta el campo obligatorio: {campo}')
+
+def _elementos(lector, campo):
+    """Elementos de un arreglo JSON cuyo '[' es el próximo carácter del lector"""
+    if lector.siguiente() != '[':
+        raise ErrorCuerpo(f'El campo {campo} debe ser una lista')
+    lector.esperar('[')
+    if lector.siguiente() == ']':
+        lector.esperar(']')
+        return
+    while True:
+        yield lector.valor()
+        if lector.siguiente() != ',':
+            break
+        lector.esperar(',')
+    lector.esperar(']')
+
+def leer_ndjson(flujo):
+    """Genera los valores de un cuerpo NDJSON (un JSON por línea) a medida que se leen"""
+    for numero, linea in enumerate(flujo, 1):
+        if not linea.strip():
+            continue
+        try:
+            yield json.loads(linea)
+        except ValueError as e:
+            raise ErrorCuerpo(f'Línea {numero}: JSON inválido') from e
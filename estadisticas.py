@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Estadísticas de tareas por usuario
+Agregados materializados (totales y por día) que mantienen triggers sobre la
+tabla tareas, para que el endpoint de estadísticas lea una fila por usuario en
+lugar de agrupar todas sus tareas. Ejecutado como script reconstruye los
+agregados de todos los shards a partir de las tareas y del archivo.
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+
+import particionado
+
+# Tablas y triggers (migración 4 de los shards). Las tareas archivadas siguen
+# contando: el archivado suma en `archivadas` y devuelve sus aportes diarios
+ESQUEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS estadisticas_usuario (
+        usuario_id INTEGER PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        completadas INTEGER NOT NULL DEFAULT 0,
+        archivadas INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS estadisticas_diarias (
+        usuario_id INTEGER NOT NULL,
+        dia TEXT NOT NULL,
+        creadas INTEGER NOT NULL DEFAULT 0,
+        completadas INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (usuario_id, dia)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS estadisticas_insertar AFTER INSERT ON tareas
+    BEGIN
+        INSERT INTO estadisticas_usuario (usuario_id, total, completadas)
+        VALUES (NEW.usuario_id, 1, NEW.completada IS 1)
+        ON CONFLICT (usuario_id) DO UPDATE
+        SET total = total + 1, completadas = completadas + excluded.completadas;
+
+        INSERT INTO estadisticas_diarias (usuario_id, dia, creadas)
+        VALUES (NEW.usuario_id, date(NEW.fecha_creacion), 1)
+        ON CONFLICT (usuario_id, dia) DO UPDATE SET creadas = creadas + 1;
+
+        INSERT INTO estadisticas_diarias (usuario_id, dia, completadas)
+        SELECT NEW.usuario_id, date(NEW.fecha_completada), 1
+        WHERE NEW.completada IS 1 AND NEW.fecha_completada IS NOT NULL
+        ON CONFLICT (usuario_id, dia) DO UPDATE SET completadas = completadas + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS estadisticas_actualizar
+    AFTER UPDATE OF completada, fecha_completada ON tareas
+    BEGIN
+        UPDATE estadisticas_usuario
+        SET completadas = completadas + (NEW.completada IS 1) - (OLD.completada IS 1)
+        WHERE usuario_id = NEW.usuario_id;
+
+        UPDATE estadisticas_diarias SET completadas = completadas - 1
+        WHERE OLD.completada IS 1 AND OLD.fecha_completada IS NOT NULL
+          AND usuario_id = OLD.usuario_id AND dia = date(OLD.fecha_completada);
+
+        INSERT INTO estadisticas_diarias (usuario_id, dia, completadas)
+        SELECT NEW.usuario_id, date(NEW.fecha_completada), 1
+        WHERE NEW.completada IS 1 AND NEW.fecha_completada IS NOT NULL
+        ON CONFLICT (usuario_id, dia) DO UPDATE SET completadas = completadas + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS estadisticas_eliminar AFTER DELETE ON tareas
+    BEGIN
+        UPDATE estadisticas_usuario
+        SET total = total - 1, completadas = completadas - (OLD.completada IS 1)
+        WHERE usuario_id = OLD.usuario_id;
+
+        UPDATE estadisticas_diarias SET creadas = creadas - 1
+        WHERE usuario_id = OLD.usuario_id AND dia = date(OLD.fecha_creacion);
+
+        UPDATE estadisticas_diarias SET completadas = completadas - 1
+        WHERE OLD.completada IS 1 AND OLD.fecha_completada IS NOT NULL
+          AND usuario_id = OLD.usuario_id AND dia = date(OLD.fecha_completada);
+    END
+    ''',
+]
+
+# Suma aportes diarios (creadas, completadas) a la fila del día
+SQL_SUMAR_DIA = '''
+    INSERT INTO estadisticas_diarias (usuario_id, dia, creadas, completadas)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (usuario_id, dia) DO UPDATE
+    SET creadas = creadas + excluded.creadas, completadas = completadas + excluded.completadas
+'''
+
+# Suma tareas archivadas al total del usuario
+SQL_SUMAR_ARCHIVADAS = '''
+    INSERT INTO estadisticas_usuario (usuario_id, archivadas) VALUES (?, ?)
+    ON CONFLICT (usuario_id) DO UPDATE SET archivadas = archivadas + excluded.archivadas
+'''
+
+class Estadisticas:
+    """Lectura, archivado y reconstrucción de los agregados por usuario"""
+
+    def __init__(self, shards, ruta_archivo):
+        self.shards = shards
+        self.ruta_archivo = ruta_archivo
+
+    def leer(self, conn, usuario_id, dias=30):
+        """Totales del usuario y sus últimos `dias` días con actividad"""
+        fila = conn.execute(
+            "SELECT total, completadas, archivadas FROM estadisticas_usuario WHERE usuario_id = ?",
+            (usuario_id,)
+        ).fetchone()
+        total, completadas, archivadas = fila or (0, 0, 0)
+
+        hoy = datetime.datetime.now(datetime.timezone.utc).date()
+        desde = (hoy - datetime.timedelta(days=dias - 1)).isoformat()
+        por_dia = conn.execute(
+            "SELECT dia, creadas, completadas FROM estadisticas_diarias "
+            "WHERE usuario_id = ? AND dia >= ? AND (creadas > 0 OR completadas > 0) ORDER BY dia",
+            (usuario_id, desde)
+        ).fetchall()
+
+        return {
+            'total': total + archivadas,
+            'completadas': completadas + archivadas,
+            'pendientes': total - completadas,
+            'archivadas': archivadas,
+            'por_dia': [
+                {'dia': dia, 'creadas': creadas, 'completadas': hechas}
+                for dia, creadas, hechas in por_dia
+            ]
+        }
+
+    def registrar_archivadas(self, conn, filas):
+        """Mantiene en las estadísticas un lote de tareas recién archivadas.
+
+        Se llama dentro de la transacción del archivado, después de borrar las
+        filas del shard: el trigger de borrado descontó sus aportes y aquí se
+        devuelven los diarios y se suman al contador de archivadas.
+        """
+        por_usuario = {}
+        for fila in filas:
+            usuario_id, completada, fecha_creacion, fecha_completada = fila[1], fila[4], fila[5], fila[6]
+            por_usuario[usuario_id] = por_usuario.get(usuario_id, 0) + 1
+            conn.execute(SQL_SUMAR_DIA, (usuario_id, fecha_creacion[:10], 1, 0))
+            if completada and fecha_completada:
+                conn.execute(SQL_SUMAR_DIA, (usuario_id, fecha_completada[:10], 0, 1))
+        conn.executemany(SQL_SUMAR_ARCHIVADAS, por_usuario.items())
+
+    def _archivadas(self):
+        """Aportes de las tareas archivadas: ({usuario: cantidad}, [(usuario, dia, creadas, completadas)])"""
+        if not os.path.exists(self.ruta_archivo):
+            return {}, []
+        conn = particionado.conectar(self.ruta_archivo)
+        try:
+            cantidades = dict(conn.execute(
+                "SELECT usuario_id, COUNT(*) FROM tareas_archivadas GROUP BY usuario_id"
+            ))
+            diarias = conn.execute(
+                "SELECT usuario_id, date(fecha_creacion), COUNT(*), 0 FROM tareas_archivadas "
+                "GROUP BY 1, 2 "
+                "UNION ALL "
+                "SELECT usuario_id, date(fecha_completada), 0, COUNT(*) FROM tareas_archivadas "
+                "WHERE completada IS 1 AND fecha_completada IS NOT NULL GROUP BY 1, 2"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Archivo aún sin la tabla de tareas archivadas
+            return {}, []
+        finally:
+            conn.close()
+        return cantidades, diarias
+
+    def reconstruir_conexion(self, conn):
+        """Recalcula desde cero los agregados del shard abierto en `conn` (sin commit)"""
+        ruta = next(fila[2] for fila in conn.execute("PRAGMA database_list") if fila[1] == 'main')
+        cantidades, diarias = self._archivadas()
+        if len(self.shards.shards) > 1:
+            # El archivo es común: solo cuentan los usuarios que viven en este shard
+            propios = {
+                usuario_id for usuario_id in cantidades
+                if os.path.realpath(self.shards.shard_de(usuario_id)) == os.path.realpath(ruta)
+            }
+            cantidades = {u: c for u, c in cantidades.items() if u in propios}
+            diarias = [fila for fila in diarias if fila[0] in propios]
+
+        conn.execute("DELETE FROM estadisticas_usuario")
+        conn.execute("DELETE FROM estadisticas_diarias")
+        conn.execute(
+            "INSERT INTO estadisticas_usuario (usuario_id, total, completadas) "
+            "SELECT usuario_id, COUNT(*), SUM(completada IS 1) FROM tareas GROUP BY usuario_id"
+        )
+        conn.execute(
+            "INSERT INTO estadisticas_diarias (usuario_id, dia, creadas) "
+            "SELECT usuario_id, date(fecha_creacion), COUNT(*) FROM tareas GROUP BY 1, 2"
+        )
+        conn.execute(
+            "INSERT INTO estadisticas_diarias (usuario_id, dia, completadas) "
+            "SELECT usuario_id, date(fecha_completada), COUNT(*) FROM tareas "
+            "WHERE completada IS 1 AND fecha_completada IS NOT NULL GROUP BY 1, 2 "
+            "ON CONFLICT (usuario_id, dia) DO UPDATE SET completadas = excluded.completadas"
+        )
+        conn.executemany(SQL_SUMAR_ARCHIVADAS, cantidades.items())
+        conn.executemany(SQL_SUMAR_DIA, diarias)
+
+    def reconstruir(self):
+        """Recalcula los agregados de todos los shards; devuelve {shard: usuarios}"""
+        resultado = {}
+        for ruta in self.shards.shards:
+            conn = particionado.conectar(ruta)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                self.reconstruir_conexion(conn)
+                resultado[ruta] = conn.execute("SELECT COUNT(*) FROM estadisticas_usuario").fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        return resultado
+
+def main():
+    """Función principal"""
+    argparse.ArgumentParser(
+        description="Reconstruye las estadísticas materializadas de todos los shards"
+    ).parse_args()
+
+    import servidor
+    servidor.init_db()
+
+    for ruta, usuarios in servidor.estadisticas.reconstruir().items():
+        print(f"📊 {ruta}: estadísticas de {usuarios} usuarios reconstruidas")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
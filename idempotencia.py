@@ -0,0 +1,157 @@
+"""
+Claves de idempotencia de las peticiones que modifican datos
+Guarda la respuesta de cada petición con encabezado Idempotency-Key en una tabla
+SQLite compacta (con una LRU en memoria delante) para que los reintentos la
+reciban tal cual, sin volver a ejecutar la operación. Mientras la primera
+petición está en curso la clave queda reservada; las respuestas vencen a las
+`ttl` segundos y un trabajo de mantenimiento borra las vencidas.
+"""
+
+import collections
+import hashlib
+import hmac
+import threading
+import time
+
+RespuestaGuardada = collections.namedtuple('RespuestaGuardada', 'huella estado tipo cuerpo')
+
+# Resultados de reservar()
+RESERVADA = 'reservada'
+EN_CURSO = 'en_curso'
+OTRA_PETICION = 'otra_peticion'
+
+class AlmacenIdempotencia:
+    """Respuestas guardadas por (ámbito, clave); el ámbito es el usuario (0 sin sesión)"""
+
+    def __init__(self, transaccion, clave_huella, ttl=86400.0, plazo_en_curso=60.0,
+                 capacidad=1024, lote_limpieza=1000):
+        # transaccion() -> context manager con una conexión al directorio
+        self.transaccion = transaccion
+        self.clave_huella = clave_huella
+        self.ttl = ttl
+        self.plazo_en_curso = plazo_en_curso
+        self.capacidad = capacidad
+        self.lote_limpieza = lote_limpieza
+        self._lock = threading.Lock()
+        self._memoria = collections.OrderedDict()
+        self.repetidas = 0
+
+    @staticmethod
+    def init_db(conn):
+        """Crea la tabla de respuestas guardadas (estado NULL: petición en curso)"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS idempotencia (
+                ambito INTEGER NOT NULL,
+                clave TEXT NOT NULL,
+                huella BLOB NOT NULL,
+                estado INTEGER,
+                tipo TEXT,
+                cuerpo BLOB,
+                expira REAL NOT NULL,
+                PRIMARY KEY (ambito, clave)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotencia_expira ON idempotencia (expira)")
+
+    def huella(self, metodo, ruta, cuerpo):
+        """Resumen con clave de la petición (el cuerpo puede llevar contraseñas)"""
+        mensaje = b'\n'.join([metodo.encode(), ruta.encode(), cuerpo])
+        return hmac.new(self.clave_huella, mensaje, hashlib.sha256).digest()[:16]
+
+    def reservar(self, ambito, clave, huella):
+        """Reserva la clave para ejecutar la petición.
+
+        Devuelve (RESERVADA, None), (EN_CURSO, None), (OTRA_PETICION, None) si la
+        clave se usó con otra petición, o (estado, RespuestaGuardada) si ya hay
+        una respuesta que repetir.
+        """
+        ahora = time.time()
+        guardada = self._desde_memoria(ambito, clave, ahora)
+        if guardada is None:
+            with self.transaccion() as conn:
+                # Las reservas abandonadas y las respuestas vencidas se reemplazan
+                reservada = conn.execute('''
+                    INSERT INTO idempotencia (ambito, clave, huella, expira) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (ambito, clave) DO UPDATE SET
+                        huella = excluded.huella, estado = NULL, tipo = NULL,
+                        cuerpo = NULL, expira = excluded.expira
+                    WHERE idempotencia.expira < ?
+                ''', (ambito, clave, huella, ahora + self.plazo_en_curso, ahora)).rowcount
+                if reservada:
+                    return RESERVADA, None
+                fila = conn.execute(
+                    "SELECT huella, estado, tipo, cuerpo, expira FROM idempotencia "
+                    "WHERE ambito = ? AND clave = ?", (ambito, clave)
+                ).fetchone()
+            guardada = RespuestaGuardada._make(fila[:4])
+            if guardada.estado is not None:
+                self._a_memoria(ambito, clave, guardada, fila[4])
+
+        if not hmac.compare_digest(guardada.huella, huella):
+            return OTRA_PETICION, None
+        if guardada.estado is None:
+            return EN_CURSO, None
+        with self._lock:
+            self.repetidas += 1
+        return guardada.estado, guardada
+
+    def guardar(self, ambito, clave, huella, estado, tipo, cuerpo):
+        """Guarda la respuesta de una petición reservada"""
+        expira = time.time() + self.ttl
+        with self.transaccion() as conn:
+            conn.execute(
+                "UPDATE idempotencia SET estado = ?, tipo = ?, cuerpo = ?, expira = ? "
+                "WHERE ambito = ? AND clave = ? AND huella = ?",
+                (estado, tipo, cuerpo, expira, ambito, clave, huella)
+            )
+        self._a_memoria(ambito, clave, RespuestaGuardada(huella, estado, tipo, cuerpo), expira)
+
+    def liberar(self, ambito, clave, huella):
+        """Descarta una reserva cuya petición falló, para que el reintento se ejecute"""
+        with self.transaccion() as conn:
+            conn.execute(
+                "DELETE FROM idempotencia WHERE ambito = ? AND clave = ? AND huella = ? "
+                "AND estado IS NULL", (ambito, clave, huella)
+            )
+
+    def limpiar(self):
+        """Borra las respuestas y reservas vencidas por lotes; devuelve cuántas"""
+        borradas = 0
+        while True:
+            with self.transaccion() as conn:
+                # La tabla no tiene rowid: el lote se elige por clave primaria
+                cantidad = conn.execute(
+                    "DELETE FROM idempotencia WHERE (ambito, clave) IN (SELECT ambito, clave "
+                    "FROM idempotencia WHERE expira < ? LIMIT ?)", (time.time(), self.lote_limpieza)
+                ).rowcount
+            borradas += cantidad
+            if cantidad < self.lote_limpieza:
+                break
+        ahora = time.time()
+        with self._lock:
+            for llave in [llave for llave, (_, expira) in self._memoria.items() if expira < ahora]:
+                del self._memoria[llave]
+        return borradas
+
+    def _desde_memoria(self, ambito, clave, ahora):
+        """Respuesta vigente de la LRU en memoria, o None"""
+        with self._lock:
+            entrada = self._memoria.get((ambito, clave))
+            if entrada is None or entrada[1] < ahora:
+                return None
+            self._memoria.move_to_end((ambito, clave))
+            return entrada[0]
+
+    def _a_memoria(self, ambito, clave, guardada, expira):
+        """Agrega una respuesta terminada a la LRU en memoria"""
+        with self._lock:
+            self._memoria[(ambito, clave)] = (guardada, expira)
+            self._memoria.move_to_end((ambito, clave))
+            while len(self._memoria) > self.capacidad:
+                self._memoria.popitem(last=False)
+
+    def estado(self):
+        """Respuestas en memoria y reintentos respondidos desde el almacén"""
+        with self._lock:
+            return {'en_memoria': len(self._memoria), 'capacidad': self.capacidad,
+                    'repetidas': self.repetidas}
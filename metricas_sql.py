@@ -0,0 +1,186 @@
+"""
+Métricas de las sentencias SQL ejecutadas sobre SQLite
+Conexiones y cursores instrumentados que acumulan, por sentencia normalizada,
+llamadas, tiempo total y máximo y filas devueltas, y registran las sentencias
+lentas junto con su EXPLAIN QUERY PLAN
+"""
+
+import collections
+import datetime
+import functools
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('sql')
+
+# Filas leídas por cada fetchmany al iterar un cursor
+BLOQUE_ITERACION = 256
+
+# Literales y listas IN (...) que se reemplazan al normalizar
+_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=1024)
+def normalizar(sql):
+    """Forma canónica de una sentencia: sin literales y con espacios colapsados"""
+    sql = _ESPACIOS.sub(' ', sql).strip()
+    sql = _TEXTO.sub('?', sql)
+    sql = _NUMERO.sub('?', sql)
+    return _LISTA.sub('(...)', sql)
+
+class RegistroSQL:
+    """Estadísticas acumuladas por sentencia y últimas sentencias lentas del proceso"""
+
+    def __init__(self, umbral_lento=0.1, max_lentas=50):
+        self.umbral_lento = umbral_lento
+        self._lock = threading.Lock()
+        self._sentencias = {}
+        self._lentas = collections.deque(maxlen=max_lentas)
+
+    def registrar(self, clave, segundos, acumulado, filas=0, modificadas=0, llamada=False):
+        """Suma tiempo y filas de una sentencia; `acumulado` es lo que lleva esta ejecución"""
+        with self._lock:
+            datos = self._sentencias.get(clave)
+            if datos is None:
+                datos = self._sentencias[clave] = {
+                    'llamadas': 0, 'total': 0.0, 'maximo': 0.0, 'filas': 0, 'modificadas': 0
+                }
+            datos['llamadas'] += llamada
+            datos['total'] += segundos
+            datos['maximo'] = max(datos['maximo'], acumulado)
+            datos['filas'] += filas
+            datos['modificadas'] += modificadas
+
+    def registrar_lenta(self, clave, segundos, plan):
+        """Guarda y registra en el log una ejecución que superó el umbral"""
+        self._lentas.append({
+            'sentencia': clave,
+            'ms': round(segundos * 1000, 2),
+            'plan': plan,
+            'fecha': datetime.datetime.now().isoformat()
+        })
+        logger.warning("SQL lenta (%.1f ms): %s | plan: %s", segundos * 1000, clave, ' / '.join(plan))
+
+    def estado(self, orden='total', limite=50):
+        """Sentencias ordenadas por `orden` (total, maximo, llamadas o filas) y lentas recientes"""
+        with self._lock:
+            filas = [dict(datos, sentencia=clave) for clave, datos in self._sentencias.items()]
+            lentas = list(self._lentas)
+        filas.sort(key=lambda datos: datos[orden], reverse=True)
+        for datos in filas:
+            datos['medio_ms'] = round(datos['total'] / datos['llamadas'] * 1000, 3) if datos['llamadas'] else None
+            datos['total_ms'] = round(datos.pop('total') * 1000, 3)
+            datos['maximo_ms'] = round(datos.pop('maximo') * 1000, 3)
+        return {
+            'umbral_lento_ms': self.umbral_lento * 1000,
+            'sentencias': filas[:limite],
+            'lentas': lentas
+        }
+
+    def reiniciar(self):
+        """Descarta todas las estadísticas acumuladas"""
+        with self._lock:
+            self._sentencias.clear()
+            self._lentas.clear()
+
+# Registro compartido por todas las conexiones del proceso
+registro = RegistroSQL()
+
+# Con False, las conexiones nuevas se abren sin instrumentar
+activas = True
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mide la ejecución y la lectura de filas de cada sentencia"""
+
+    _ejecucion = None
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._iniciar(sql, parametros, time.perf_counter() - inicio)
+
+    def executemany(self, sql, secuencia):
+        secuencia = list(secuencia)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, secuencia)
+        finally:
+            self._iniciar(sql, secuencia[0] if secuencia else (), time.perf_counter() - inicio)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = super().fetchone()
+        self._sumar(time.perf_counter() - inicio, fila is not None)
+        return fila
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        filas = super().fetchmany(self.arraysize if size is None else size)
+        self._sumar(time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = super().fetchall()
+        self._sumar(time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def __iter__(self):
+        # Por bloques: medir fila a fila costaría más que leerlas
+        while True:
+            filas = self.fetchmany(BLOQUE_ITERACION)
+            if not filas:
+                return
+            yield from filas
+
+    def _iniciar(self, sql, parametros, segundos):
+        """Registra una ejecución nueva del cursor"""
+        # [clave, sql, parámetros, segundos acumulados, ya registrada como lenta]
+        self._ejecucion = [normalizar(sql), sql, parametros, segundos, False]
+        modificadas = max(self.rowcount, 0) if self.description is None else 0
+        registro.registrar(self._ejecucion[0], segundos, segundos, modificadas=modificadas, llamada=True)
+        self._revisar_lentitud()
+
+    def _sumar(self, segundos, filas):
+        """Suma a la ejecución actual el tiempo y las filas de una lectura"""
+        ejecucion = self._ejecucion
+        if ejecucion is None:
+            return
+        ejecucion[3] += segundos
+        registro.registrar(ejecucion[0], segundos, ejecucion[3], filas=filas)
+        self._revisar_lentitud()
+
+    def _revisar_lentitud(self):
+        """Registra la ejecución como lenta la primera vez que supera el umbral"""
+        clave, sql, parametros, segundos, registrada = self._ejecucion
+        if registrada or segundos < registro.umbral_lento:
+            return
+        self._ejecucion[4] = True
+        registro.registrar_lenta(clave, segundos, self._plan(sql, parametros))
+
+    def _plan(self, sql, parametros):
+        """EXPLAIN QUERY PLAN de la sentencia, con un cursor sin instrumentar"""
+        try:
+            cursor = sqlite3.Cursor(self.connection)
+            return [fila[3] for fila in cursor.execute('EXPLAIN QUERY PLAN ' + sql, parametros)]
+        except sqlite3.Error as e:
+            return [f'(sin plan: {e})']
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """Conexión cuyos cursores, incluidos los atajos execute(), están instrumentados"""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, secuencia):
+        return self.cursor().executemany(sql, secuencia)
@@ -0,0 +1,73 @@
+"""
+Negociación del formato de las peticiones y respuestas de la API
+Con el paquete opcional msgpack instalado, las respuestas de jsonify() se
+codifican en MessagePack cuando el cliente lo prefiere en Accept, y
+request.get_json() decodifica los cuerpos enviados con Content-Type
+MessagePack. Sin el paquete, todo sigue en JSON.
+"""
+
+from flask import Request, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import msgpack
+except ImportError:  # dependencia opcional
+    msgpack = None
+
+MIMETYPE_MSGPACK = 'application/msgpack'
+
+# Tipos aceptados en Content-Type (el segundo es el que usan muchos clientes)
+TIPOS_MSGPACK = (MIMETYPE_MSGPACK, 'application/x-msgpack')
+
+def disponible():
+    """Indica si MessagePack está instalado"""
+    return msgpack is not None
+
+def prefiere_msgpack():
+    """Indica si el cliente de la petición actual prefiere MessagePack a JSON"""
+    aceptados = request.accept_mimetypes
+    if not aceptados:
+        return False
+    # Con Accept: */* gana JSON, que va primero
+    return aceptados.best_match(('application/json',) + TIPOS_MSGPACK) in TIPOS_MSGPACK
+
+class ProveedorNegociado(DefaultJSONProvider):
+    """Proveedor JSON de Flask cuyas respuestas pueden salir en MessagePack"""
+
+    def response(self, *args, **kwargs):
+        if msgpack is None or not has_request_context():
+            return super().response(*args, **kwargs)
+
+        if prefiere_msgpack():
+            datos = self._prepare_response_obj(args, kwargs)
+            respuesta = self._app.response_class(
+                msgpack.packb(datos, default=self.default), mimetype=MIMETYPE_MSGPACK
+            )
+        else:
+            respuesta = super().response(*args, **kwargs)
+        respuesta.vary.add('Accept')
+        return respuesta
+
+class PeticionNegociada(Request):
+    """Petición cuyo get_json() también lee cuerpos MessagePack"""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if msgpack is None or self.mimetype not in TIPOS_MSGPACK:
+            return super().get_json(force=force, silent=silent, cache=cache)
+
+        if cache and '_msgpack' in self.__dict__:
+            return self.__dict__['_msgpack']
+        try:
+            datos = msgpack.unpackb(self.get_data(cache=cache))
+        except ValueError as e:
+            if silent:
+                return None
+            return self.on_json_loading_failure(e)
+        if cache:
+            self.__dict__['_msgpack'] = datos
+        return datos
+
+def init_app(app):
+    """Activa la negociación de formato en una aplicación Flask"""
+    app.json = ProveedorNegociado(app)
+    app.request_class = PeticionNegociada
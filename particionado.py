@@ -0,0 +1,427 @@
+"""
+Particionado horizontal de las tareas por usuario
+Asigna cada usuario_id a un archivo SQLite (shard) mediante hashing consistente.
+La tabla de usuarios, las ubicaciones fijadas y la secuencia global de ids de
+tareas viven en una base de datos directorio pequeña.
+"""
+
+import bisect
+import hashlib
+import os
+import sqlite3
+import threading
+
+import metricas_sql
+
+# Nodos virtuales por shard en el anillo de hashing consistente
+VNODOS = 64
+
+# Cantidad de ids de tareas reservados por cada acceso a la secuencia global
+BLOQUE_IDS = 1000
+
+# Tablas de contadores por usuario que acompañan a sus tareas al moverlo de
+# shard, con sus columnas clave (el resto de las columnas se suman)
+CONTADORES_POR_USUARIO = {
+    'estadisticas_usuario': ('usuario_id',),
+    'estadisticas_diarias': ('usuario_id', 'dia'),
+}
+
+def conectar(ruta, timeout=10.0, **opciones):
+    """Abre una conexión SQLite (instrumentada) a un archivo de la base de datos"""
+    fabrica = metricas_sql.ConexionInstrumentada if metricas_sql.activas else sqlite3.Connection
+    return sqlite3.connect(ruta, timeout=timeout, factory=fabrica, **opciones)
+
+def _mismo_archivo(ruta, otra):
+    """Indica si dos rutas apuntan al mismo archivo de base de datos"""
+    return os.path.abspath(ruta) == os.path.abspath(otra)
+
+def _hash(clave):
+    """Hash estable de 64 bits (independiente de PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.md5(str(clave).encode('utf-8')).digest()[:8], 'big')
+
+class AnilloHash:
+    """Anillo de hashing consistente con nodos virtuales"""
+
+    def __init__(self, nodos, vnodos=VNODOS):
+        if not nodos:
+            raise ValueError('Se requiere al menos un shard')
+        self.nodos = list(nodos)
+        puntos = sorted(
+            (_hash(f'{nodo}#{i}'), nodo)
+            for nodo in self.nodos
+            for i in range(vnodos)
+        )
+        self._claves = [clave for clave, _ in puntos]
+        self._nodos = [nodo for _, nodo in puntos]
+
+    def nodo(self, clave):
+        """Devuelve el nodo responsable de una clave"""
+        indice = bisect.bisect(self._claves, _hash(clave)) % len(self._claves)
+        return self._nodos[indice]
+
+class Shards:
+    """Enruta las consultas de tareas de cada usuario a su archivo SQLite"""
+
+    def __init__(self, directorio, shards=None):
+        self.directorio = directorio
+        self.shards = list(shards or [directorio])
+        self.anillo = AnilloHash(self.shards)
+        self._lock_ids = threading.Lock()
+        self._proximo_id = 0
+        self._limite_id = 0
+
+    @classmethod
+    def desde_entorno(cls, directorio):
+        """Crea el enrutador leyendo TAREAS_SHARDS (rutas separadas por comas)"""
+        valor = os.environ.get('TAREAS_SHARDS', '')
+        shards = [ruta.strip() for ruta in valor.split(',') if ruta.strip()]
+        return cls(directorio, shards or None)
+
+    def conectar_directorio(self):
+        """Conexión a la base de datos directorio (usuarios)"""
+        return conectar(self.directorio)
+
+    def init_directorio(self, cursor):
+        """Crea las tablas propias del particionado en el directorio"""
+        # Usuarios fijados a un shard distinto al que indica el anillo
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ubicaciones (
+                usuario_id INTEGER PRIMARY KEY,
+                shard TEXT NOT NULL
+            )
+        ''')
+
+        # Movimientos de usuarios entre shards sin terminar (ver mover_usuario)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS movimientos (
+                usuario_id INTEGER PRIMARY KEY,
+                origen TEXT NOT NULL,
+                destino TEXT NOT NULL
+            )
+        ''')
+
+        # Secuencia global de ids de tareas (únicos entre shards)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS secuencias (
+                nombre TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL
+            )
+        ''')
+
+    def sembrar_secuencia(self):
+        """Inicializa la secuencia de tareas con el mayor id existente en los shards"""
+        maximo = 0
+        for ruta in self.shards:
+            conn = conectar(ruta)
+            try:
+                fila = conn.execute("SELECT MAX(id) FROM tareas").fetchone()
+                maximo = max(maximo, fila[0] or 0)
+            finally:
+                conn.close()
+
+        conn = self.conectar_directorio()
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO secuencias (nombre, valor) VALUES ('tareas', ?)",
+                (maximo,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def nuevo_id_tarea(self, conn=None):
+        """Devuelve un id de tarea único entre todos los shards.
+
+        `conn` es la conexión de quien pide el id cuando su shard es el propio
+        directorio. Si ya tiene abierta una transacción de escritura, otra
+        conexión esperaría a su bloqueo, así que al agotarse el bloque el id se
+        reserva de a uno dentro de ella (un rollback deshace la reserva).
+        """
+        with self._lock_ids:
+            if self._proximo_id >= self._limite_id and conn is not None and conn.in_transaction:
+                conn.execute("UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'tareas'")
+                return conn.execute(
+                    "SELECT valor FROM secuencias WHERE nombre = 'tareas'"
+                ).fetchone()[0]
+
+            if self._proximo_id >= self._limite_id:
+                conn = self.conectar_directorio()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(
+                        "UPDATE secuencias SET valor = valor + ? WHERE nombre = 'tareas'",
+                        (BLOQUE_IDS,)
+                    )
+                    limite = conn.execute(
+                        "SELECT valor FROM secuencias WHERE nombre = 'tareas'"
+                    ).fetchone()[0]
+                    conn.commit()
+                finally:
+                    conn.close()
+                self._proximo_id = limite - BLOQUE_IDS
+                self._limite_id = limite
+
+            self._proximo_id += 1
+            return self._proximo_id
+
+    def shard_segun_anillo(self, usuario_id):
+        """Shard que corresponde a un usuario según el hashing consistente"""
+        return self.anillo.nodo(usuario_id)
+
+    def shard_de(self, usuario_id, conn=None):
+        """Shard donde están actualmente las tareas de un usuario.
+
+        `conn` es una conexión al directorio ya abierta; sin ella se abre una.
+        """
+        if len(self.shards) == 1:
+            return self.shards[0]
+
+        propia = conn is None
+        if propia:
+            conn = self.conectar_directorio()
+        try:
+            fila = conn.execute(
+                "SELECT shard FROM ubicaciones WHERE usuario_id = ?",
+                (usuario_id,)
+            ).fetchone()
+        finally:
+            if propia:
+                conn.close()
+
+        return fila[0] if fila else self.shard_segun_anillo(usuario_id)
+
+    def conectar_tareas(self, usuario_id):
+        """Conexión al shard que contiene las tareas del usuario"""
+        return conectar(self.shard_de(usuario_id))
+
+    def fijar_ubicaciones(self, nuevos_shards):
+        """Fija en su shard actual a los usuarios que el nuevo anillo movería.
+
+        Se ejecuta antes de cambiar TAREAS_SHARDS para que ningún usuario quede
+        apuntando a un shard sin sus tareas; luego `rebalancear` los mueve.
+        """
+        nuevo_anillo = AnilloHash(nuevos_shards)
+
+        conn = self.conectar_directorio()
+        try:
+            ids = [fila[0] for fila in conn.execute("SELECT id FROM usuarios")]
+            fijados = 0
+            for usuario_id in ids:
+                actual = self.shard_de(usuario_id)
+                if actual != nuevo_anillo.nodo(usuario_id):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO ubicaciones (usuario_id, shard) VALUES (?, ?)",
+                        (usuario_id, actual)
+                    )
+                    fijados += 1
+            conn.commit()
+        finally:
+            conn.close()
+
+        return fijados
+
+    def mover_usuario(self, usuario_id, destino):
+        """Mueve en línea las tareas de un usuario a otro shard.
+
+        Entre archivos WAL no hay commit atómico, así que el movimiento se hace
+        en pasos que se pueden repetir. Se anota en `movimientos` y se toma el
+        bloqueo de escritura del origen, de modo que las escrituras del usuario
+        esperan (y al obtenerlo ven la ubicación nueva, ver
+        `Repositorio.tareas_de`). Luego se reemplaza la copia del usuario en
+        destino con su propio commit, se cambia la ubicación y por último se
+        borra el origen. Si se interrumpe, volver a llamarlo (o `rebalancear`)
+        retoma el movimiento anotado.
+        """
+        origen = self.shard_de(usuario_id)
+        pendiente = self._movimiento_pendiente(usuario_id)
+        if pendiente:
+            anterior, copia = pendiente
+            # Sobran las filas del origen anterior si la ubicación llegó a
+            # cambiar, o las de la copia a medias si no
+            sobrante = anterior if _mismo_archivo(copia, origen) else copia
+            if not _mismo_archivo(sobrante, destino):
+                conn = conectar(sobrante)
+                try:
+                    self._borrar_usuario(conn, usuario_id)
+                    conn.commit()
+                finally:
+                    conn.close()
+            self._cerrar_movimiento(usuario_id)
+
+        if _mismo_archivo(origen, destino):
+            return 0
+
+        self._anotar_movimiento(usuario_id, origen, destino)
+        directorio_en_origen = _mismo_archivo(self.directorio, origen)
+        bloqueo = conectar(origen)
+        try:
+            bloqueo.execute("BEGIN IMMEDIATE")
+            movidas = self._copiar_usuario(usuario_id, origen, destino)
+
+            # Con el directorio en el origen, la ubicación y el borrado van juntos
+            if directorio_en_origen:
+                self._ubicar(bloqueo, usuario_id, destino)
+                bloqueo.execute("DELETE FROM movimientos WHERE usuario_id = ?", (usuario_id,))
+            else:
+                conn = self.conectar_directorio()
+                try:
+                    self._ubicar(conn, usuario_id, destino)
+                    conn.commit()
+                finally:
+                    conn.close()
+
+            self._borrar_usuario(bloqueo, usuario_id)
+            bloqueo.commit()
+        except Exception:
+            bloqueo.rollback()
+            raise
+        finally:
+            bloqueo.close()
+
+        if not directorio_en_origen:
+            self._cerrar_movimiento(usuario_id)
+        return movidas
+
+    def _movimiento_pendiente(self, usuario_id):
+        """(origen, destino) de un movimiento del usuario sin terminar, o None"""
+        conn = self.conectar_directorio()
+        try:
+            return conn.execute(
+                "SELECT origen, destino FROM movimientos WHERE usuario_id = ?",
+                (usuario_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def _anotar_movimiento(self, usuario_id, origen, destino):
+        """Registra en el directorio el movimiento que empieza"""
+        conn = self.conectar_directorio()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO movimientos (usuario_id, origen, destino) VALUES (?, ?, ?)",
+                (usuario_id, origen, destino)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _cerrar_movimiento(self, usuario_id):
+        """Da por terminado el movimiento del usuario"""
+        conn = self.conectar_directorio()
+        try:
+            conn.execute("DELETE FROM movimientos WHERE usuario_id = ?", (usuario_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _ubicar(self, conn, usuario_id, destino):
+        """Apunta al usuario a su nuevo shard (sin fijarlo si es el del anillo)"""
+        if destino == self.shard_segun_anillo(usuario_id):
+            conn.execute("DELETE FROM ubicaciones WHERE usuario_id = ?", (usuario_id,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO ubicaciones (usuario_id, shard) VALUES (?, ?)",
+                (usuario_id, destino)
+            )
+
+    def _copiar_usuario(self, usuario_id, origen, destino):
+        """Reemplaza en destino las filas del usuario por las del origen.
+
+        Solo escribe en destino (con transacción diferida, para no pedir el
+        bloqueo del origen que ya tiene `mover_usuario`), así que su commit es
+        atómico; una copia anterior a medias se descarta. Devuelve las tareas
+        copiadas.
+        """
+        conn = conectar(destino)
+        try:
+            conn.execute("ATTACH DATABASE ? AS origen", (origen,))
+            columnas = ', '.join(
+                fila[1] for fila in conn.execute("PRAGMA origen.table_info(tareas)")
+            )
+            conn.execute("BEGIN")
+            self._borrar_usuario(conn, usuario_id)
+            movidas = conn.execute(
+                f"INSERT INTO main.tareas ({columnas}) "
+                f"SELECT {columnas} FROM origen.tareas WHERE usuario_id = ?",
+                (usuario_id,)
+            ).rowcount
+            self._copiar_etiquetas(conn, usuario_id)
+            self._copiar_contadores(conn, usuario_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return movidas
+
+    @staticmethod
+    def _borrar_usuario(conn, usuario_id):
+        """Borra las tareas, etiquetas y contadores del usuario en `main`.
+
+        Los triggers quitan las asignaciones de etiquetas y descuentan los
+        contadores; lo que queda en ellos (p. ej. de tareas archivadas) se borra.
+        """
+        conn.execute("DELETE FROM main.tareas WHERE usuario_id = ?", (usuario_id,))
+        conn.execute("DELETE FROM main.etiquetas WHERE usuario_id = ?", (usuario_id,))
+        for tabla in CONTADORES_POR_USUARIO:
+            conn.execute(f"DELETE FROM main.{tabla} WHERE usuario_id = ?", (usuario_id,))
+
+    @staticmethod
+    def _copiar_etiquetas(conn, usuario_id):
+        """Copia las etiquetas del usuario y sus asignaciones del origen a `main`.
+
+        Los ids de etiqueta son propios de cada shard, así que las asignaciones
+        se traducen por nombre; los contadores los recalculan los triggers.
+        """
+        conn.execute(
+            "INSERT INTO main.etiquetas (usuario_id, nombre) "
+            "SELECT usuario_id, nombre FROM origen.etiquetas WHERE usuario_id = ?",
+            (usuario_id,)
+        )
+        conn.execute(
+            "INSERT INTO main.tarea_etiquetas (etiqueta_id, tarea_id) "
+            "SELECT d.id, te.tarea_id FROM origen.etiquetas e "
+            "JOIN origen.tarea_etiquetas te ON te.etiqueta_id = e.id "
+            "JOIN main.etiquetas d ON d.usuario_id = e.usuario_id AND d.nombre = e.nombre "
+            "WHERE e.usuario_id = ?",
+            (usuario_id,)
+        )
+
+    @staticmethod
+    def _copiar_contadores(conn, usuario_id):
+        """Copia los contadores del usuario tal como están en el origen.
+
+        Reemplazan a los que generaron los triggers al copiar las tareas, que
+        no cuentan lo que ya no está en `tareas`, como las tareas archivadas.
+        """
+        for tabla in CONTADORES_POR_USUARIO:
+            columnas = ', '.join(
+                fila[1] for fila in conn.execute(f"PRAGMA origen.table_info({tabla})")
+            )
+            conn.execute(f"DELETE FROM main.{tabla} WHERE usuario_id = ?", (usuario_id,))
+            conn.execute(
+                f"INSERT INTO main.{tabla} ({columnas}) "
+                f"SELECT {columnas} FROM origen.{tabla} WHERE usuario_id = ?",
+                (usuario_id,)
+            )
+
+    def rebalancear(self):
+        """Mueve a su shard del anillo a todos los usuarios fijados en otro.
+
+        También retoma los movimientos que quedaron a medias.
+        """
+        conn = self.conectar_directorio()
+        try:
+            usuarios = [fila[0] for fila in conn.execute(
+                "SELECT usuario_id FROM ubicaciones UNION SELECT usuario_id FROM movimientos"
+            )]
+        finally:
+            conn.close()
+
+        resultado = []
+        for usuario_id in usuarios:
+            actual = self.shard_de(usuario_id)
+            destino = self.shard_segun_anillo(usuario_id)
+            resultado.append((usuario_id, actual, destino, self.mover_usuario(usuario_id, destino)))
+        return resultado
@@ -0,0 +1,257 @@
+"""
+Planificador de trabajos de mantenimiento en segundo plano
+Ejecuta trabajos por intervalo o con expresiones tipo cron en un hilo propio,
+con jitter y una tabla de leases en SQLite para que, con varios procesos del
+servidor, cada ejecución ocurra en un solo proceso
+"""
+
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+import particionado
+
+logger = logging.getLogger('planificador')
+
+class Cron:
+    """Expresión cron de cinco campos: minuto hora día-del-mes mes día-de-semana.
+
+    A diferencia de cron clásico, día del mes y día de la semana se combinan
+    siempre con Y; el domingo es 0.
+    """
+
+    RANGOS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expresion):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expresión cron inválida: {expresion!r}")
+        self.expresion = expresion
+        (self.minutos, self.horas, self.dias,
+         self.meses, self.dias_semana) = [
+            self._parsear(campo, minimo, maximo)
+            for campo, (minimo, maximo) in zip(campos, self.RANGOS)
+        ]
+
+    @staticmethod
+    def _parsear(campo, minimo, maximo):
+        """Convierte un campo (`*`, `*/n`, `a-b`, `a,b`, `a-b/n`, `a/n`) en un conjunto de valores"""
+        valores = set()
+        for parte in campo.split(','):
+            paso = None
+            if '/' in parte:
+                parte, paso = parte.split('/')
+                paso = int(paso)
+            if parte == '*':
+                inicio, fin = minimo, maximo
+            elif '-' in parte:
+                inicio, fin = (int(v) for v in parte.split('-'))
+            else:
+                inicio = int(parte)
+                # Como en cron, `a/n` va de `a` hasta el máximo del campo
+                fin = maximo if paso is not None else inicio
+            if paso is None:
+                paso = 1
+            if inicio < minimo or fin > maximo or inicio > fin or paso <= 0:
+                raise ValueError(f"Valor fuera de rango en campo cron: {campo!r}")
+            valores.update(range(inicio, fin + 1, paso))
+        return valores
+
+    def siguiente(self, desde):
+        """Próximo instante (minuto exacto) posterior a `desde` que cumple la expresión"""
+        momento = desde.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limite = momento + datetime.timedelta(days=366)
+        while momento < limite:
+            if (momento.month in self.meses
+                    and momento.day in self.dias
+                    and (momento.weekday() + 1) % 7 in self.dias_semana
+                    and momento.hour in self.horas
+                    and momento.minute in self.minutos):
+                return momento
+            if momento.month not in self.meses or momento.day not in self.dias \
+                    or (momento.weekday() + 1) % 7 not in self.dias_semana:
+                momento = (momento + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif momento.hour not in self.horas:
+                momento = (momento + datetime.timedelta(hours=1)).replace(minute=0)
+            else:
+                momento += datetime.timedelta(minutes=1)
+        raise ValueError(f"La expresión cron {self.expresion!r} no tiene próximas ejecuciones")
+
+class Trabajo:
+    """Un trabajo registrado y sus métricas de ejecución"""
+
+    def __init__(self, nombre, funcion, intervalo=None, cron=None, jitter=0):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.intervalo = intervalo
+        self.cron = Cron(cron) if cron else None
+        self.jitter = jitter
+        self.proxima = None
+        self.ejecuciones = 0
+        self.omitidas = 0
+        self.errores = 0
+        self.ultimo_error = None
+        self.ultima_ejecucion = None
+        self.ultima_duracion = None
+        self.duracion_total = 0.0
+        self.duracion_maxima = 0.0
+        self.en_curso = False
+
+    def calcular_proxima(self, ahora):
+        """Programa la siguiente ejecución a partir de `ahora` (epoch)"""
+        if self.cron:
+            siguiente = self.cron.siguiente(datetime.datetime.fromtimestamp(ahora))
+            base = siguiente.timestamp()
+        else:
+            base = ahora + self.intervalo
+        self.proxima = base + random.uniform(0, self.jitter)
+        return base
+
+    def a_dict(self):
+        """Estado del trabajo para el endpoint de administración"""
+        return {
+            'nombre': self.nombre,
+            'programacion': self.cron.expresion if self.cron else f'cada {self.intervalo}s',
+            'jitter': self.jitter,
+            'proxima': datetime.datetime.fromtimestamp(self.proxima).isoformat() if self.proxima else None,
+            'ultima_ejecucion': (datetime.datetime.fromtimestamp(self.ultima_ejecucion).isoformat()
+                                 if self.ultima_ejecucion else None),
+            'ultima_duracion_ms': round(self.ultima_duracion * 1000, 2) if self.ultima_duracion is not None else None,
+            'duracion_media_ms': round(self.duracion_total / self.ejecuciones * 1000, 2) if self.ejecuciones else None,
+            'duracion_maxima_ms': round(self.duracion_maxima * 1000, 2),
+            'ejecuciones': self.ejecuciones,
+            'omitidas': self.omitidas,
+            'errores': self.errores,
+            'ultimo_error': self.ultimo_error,
+            'en_curso': self.en_curso
+        }
+
+class Planificador:
+    """Ejecuta trabajos registrados en un hilo en segundo plano"""
+
+    def __init__(self, ruta_leases):
+        self.ruta_leases = ruta_leases
+        self.propietario = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.trabajos = {}
+        # Protege `trabajos`: se registran desde otros hilos mientras corre el bucle
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = False
+        self._hilo = None
+
+    def init_db(self, cursor):
+        """Crea la tabla de leases que coordina a los procesos"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                nombre TEXT PRIMARY KEY,
+                propietario TEXT NOT NULL,
+                expira REAL NOT NULL
+            )
+        ''')
+
+    def cada(self, nombre, funcion, segundos, jitter=0):
+        """Registra un trabajo que se ejecuta cada `segundos`"""
+        return self._registrar(Trabajo(nombre, funcion, intervalo=segundos, jitter=jitter))
+
+    def cron(self, nombre, funcion, expresion, jitter=0):
+        """Registra un trabajo con una expresión cron de cinco campos"""
+        return self._registrar(Trabajo(nombre, funcion, cron=expresion, jitter=jitter))
+
+    def _registrar(self, trabajo):
+        """Agrega un trabajo y despierta al hilo para recalcular la espera"""
+        trabajo.calcular_proxima(time.time())
+        with self._lock:
+            self.trabajos[trabajo.nombre] = trabajo
+        self._despertar.set()
+        return trabajo
+
+    def _adquirir_lease(self, nombre, expira):
+        """Toma el lease del trabajo hasta `expira` si está libre o vencido"""
+        conn = particionado.conectar(self.ruta_leases)
+        try:
+            cursor = conn.execute(
+                '''
+                INSERT INTO leases (nombre, propietario, expira) VALUES (?, ?, ?)
+                ON CONFLICT (nombre) DO UPDATE
+                SET propietario = excluded.propietario, expira = excluded.expira
+                WHERE leases.expira <= ? OR leases.propietario = excluded.propietario
+                ''',
+                (nombre, self.propietario, expira, time.time())
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def ejecutar(self, trabajo):
+        """Ejecuta un trabajo si este proceso obtiene su lease"""
+        ahora = time.time()
+        # El lease dura hasta la próxima ejecución programada, así el resto de
+        # los procesos omite esta vuelta aunque el trabajo termine antes
+        siguiente = trabajo.calcular_proxima(ahora)
+        margen = min(1.0, (siguiente - ahora) * 0.05)
+        if not self._adquirir_lease(trabajo.nombre, siguiente - margen):
+            trabajo.omitidas += 1
+            return False
+
+        trabajo.en_curso = True
+        inicio = time.perf_counter()
+        try:
+            trabajo.funcion()
+            trabajo.ultimo_error = None
+        except Exception as e:
+            trabajo.errores += 1
+            trabajo.ultimo_error = str(e)
+            logger.exception("Falló el trabajo %s", trabajo.nombre)
+        finally:
+            duracion = time.perf_counter() - inicio
+            trabajo.en_curso = False
+            trabajo.ejecuciones += 1
+            trabajo.ultima_ejecucion = ahora
+            trabajo.ultima_duracion = duracion
+            trabajo.duracion_total += duracion
+            trabajo.duracion_maxima = max(trabajo.duracion_maxima, duracion)
+        return True
+
+    def _bucle(self):
+        """Espera al próximo trabajo vencido y lo ejecuta"""
+        while not self._detener:
+            ahora = time.time()
+            pendientes = [t for t in self._registrados() if t.proxima <= ahora]
+            for trabajo in pendientes:
+                try:
+                    self.ejecutar(trabajo)
+                except Exception as e:
+                    # Un error al tomar el lease no debe detener el planificador
+                    trabajo.errores += 1
+                    trabajo.ultimo_error = str(e)
+                    logger.exception("No se pudo ejecutar el trabajo %s", trabajo.nombre)
+
+            proxima = min((t.proxima for t in self._registrados()), default=ahora + 60)
+            self._despertar.wait(max(0.0, proxima - time.time()))
+            self._despertar.clear()
+
+    def _registrados(self):
+        """Copia de la lista de trabajos, para recorrerla sin el lock"""
+        with self._lock:
+            return list(self.trabajos.values())
+
+    def iniciar(self):
+        """Arranca el hilo del planificador"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name='planificador', daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        """Detiene el hilo del planificador"""
+        self._detener = True
+        self._despertar.set()
+
+    def estado(self):
+        """Estado de todos los trabajos registrados"""
+        return [trabajo.a_dict() for trabajo in self._registrados()]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Herramienta de rebalanceo de shards de tareas
+Permite fijar usuarios antes de cambiar TAREAS_SHARDS y moverlos en línea después
+"""
+
+import argparse
+import sys
+
+from servidor import init_db, shards
+
+def mostrar_estado():
+    """Muestra la configuración de shards y los usuarios fijados"""
+    print("📦 Shards configurados:")
+    for ruta in shards.shards:
+        print(f"   - {ruta}")
+
+    conn = shards.conectar_directorio()
+    fijados = conn.execute("SELECT usuario_id, shard FROM ubicaciones ORDER BY usuario_id").fetchall()
+    conn.close()
+
+    print(f"\n📌 Usuarios fijados: {len(fijados)}")
+    for usuario_id, ruta in fijados:
+        print(f"   - usuario {usuario_id}: {ruta} (anillo: {shards.shard_segun_anillo(usuario_id)})")
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Rebalanceo de shards de tareas")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('estado', help="Muestra shards y usuarios fijados")
+
+    fijar = sub.add_parser('fijar', help="Fija usuarios antes de cambiar TAREAS_SHARDS")
+    fijar.add_argument('--shards', required=True, help="Nueva lista de shards separada por comas")
+
+    mover = sub.add_parser('mover', help="Mueve las tareas de un usuario a otro shard")
+    mover.add_argument('usuario_id', type=int)
+    mover.add_argument('destino')
+
+    sub.add_parser('rebalancear', help="Mueve los usuarios fijados a su shard del anillo")
+
+    args = parser.parse_args()
+    init_db()
+
+    if args.comando == 'estado':
+        mostrar_estado()
+    elif args.comando == 'fijar':
+        nuevos = [ruta.strip() for ruta in args.shards.split(',') if ruta.strip()]
+        fijados = shards.fijar_ubicaciones(nuevos)
+        print(f"📌 {fijados} usuario(s) fijados en su shard actual")
+        print("💡 Ahora cambia TAREAS_SHARDS y ejecuta: python rebalancear.py rebalancear")
+    elif args.comando == 'mover':
+        movidas = shards.mover_usuario(args.usuario_id, args.destino)
+        print(f"✅ {movidas} tarea(s) movidas a {args.destino}")
+    elif args.comando == 'rebalancear':
+        for usuario_id, origen, destino, movidas in shards.rebalancear():
+            print(f"✅ usuario {usuario_id}: {origen} → {destino} ({movidas} tareas)")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Réplicas de solo lectura de las bases de datos SQLite
+Copia periódicamente cada archivo con la API de backup en línea de SQLite para
+que las consultas agregadas no compitan con las escrituras del primario
+"""
+
+import os
+import sqlite3
+import time
+
+import particionado
+
+def ruta_replica(ruta):
+    """Nombre del archivo réplica de una base de datos (tareas.db -> tareas.replica.db)"""
+    base, extension = os.path.splitext(ruta)
+    return f"{base}.replica{extension or '.db'}"
+
+class Replicas:
+    """Mantiene y enruta lecturas hacia copias instantáneas de los archivos SQLite"""
+
+    def __init__(self, rutas, intervalo=60, habilitada=False):
+        self.rutas = list(rutas)
+        self.intervalo = intervalo
+        self.habilitada = habilitada
+
+    def refrescar(self):
+        """Copia cada archivo primario a su réplica y la publica atómicamente"""
+        for ruta in self.rutas:
+            destino = ruta_replica(ruta)
+            temporal = destino + '.tmp'
+
+            origen = particionado.conectar(ruta)
+            copia = sqlite3.connect(temporal)
+            try:
+                origen.backup(copia)
+                # La réplica no usa WAL para poder abrirse como inmutable
+                copia.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                copia.close()
+                origen.close()
+
+            os.replace(temporal, destino)
+
+    def antiguedad(self, ruta):
+        """Segundos desde el último refresco de la réplica (None si no existe)"""
+        # Se usa la fecha del archivo porque el refresco puede hacerlo otro proceso
+        try:
+            return time.time() - os.path.getmtime(ruta_replica(ruta))
+        except OSError:
+            return None
+
+    def disponible(self, ruta):
+        """Indica si hay una réplica utilizable y no demasiado desactualizada"""
+        antiguedad = self.antiguedad(ruta)
+        return antiguedad is not None and antiguedad <= self.intervalo * 3
+
+    def conectar(self, ruta):
+        """Conexión de lectura: a la réplica si está habilitada y vigente, si no al primario"""
+        if self.habilitada and self.disponible(ruta):
+            uri = 'file:' + os.path.abspath(ruta_replica(ruta)) + '?mode=ro&immutable=1'
+            return particionado.conectar(uri, uri=True)
+        return particionado.conectar(ruta)
+
+    def usa_replica(self, ruta):
+        """Indica hacia dónde se enrutaría una lectura de ese archivo"""
+        return self.habilitada and self.disponible(ruta)
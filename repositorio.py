@@ -0,0 +1,496 @@
+"""
+Acceso a datos de usuarios y tareas
+Único punto donde las rutas del servidor consultan SQLite: concentra las
+sentencias, reutiliza conexiones de un pool por archivo (con una caché de
+sentencias preparadas mayor que la de por defecto) y devuelve las filas como
+namedtuples en lugar de tuplas posicionales o diccionarios.
+"""
+
+import collections
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import particionado
+from vuelo_unico import VueloUnico
+
+# Sentencias preparadas que guarda cada conexión (sqlite3 usa 128 por defecto)
+CACHE_SENTENCIAS = 256
+
+# Conexiones libres que se guardan por archivo para la próxima petición
+TAMAÑO_POOL = 16
+
+Usuario = collections.namedtuple('Usuario', 'id usuario contraseña_hash version')
+Tarea = collections.namedtuple(
+    'Tarea', 'id titulo descripcion completada fecha_creacion fecha_completada prioridad vence'
+)
+Etiqueta = collections.namedtuple('Etiqueta', 'nombre cantidad')
+Token = collections.namedtuple('Token', 'prefijo usuario_id hash')
+TokenInfo = collections.namedtuple('TokenInfo', 'prefijo nombre fecha_creacion')
+
+# Columnas de tareas en el orden de los campos de Tarea
+COLUMNAS_TAREA = ', '.join(Tarea._fields)
+
+def _marcadores(valores):
+    """Marcadores '?, ?, ...' para una lista IN"""
+    return ', '.join('?' * len(valores))
+
+class TareasUsuario:
+    """Operaciones de escritura sobre las tareas de un usuario dentro de una transacción"""
+
+    __slots__ = ('conn', 'usuario_id', 'shards', 'en_directorio')
+
+    def __init__(self, conn, usuario_id, shards, en_directorio=False):
+        self.conn = conn
+        self.usuario_id = usuario_id
+        self.shards = shards
+        self.en_directorio = en_directorio
+
+    def leer(self, tarea_id):
+        """Tarea por id (None si no existe)"""
+        fila = self.conn.execute(
+            f"SELECT {COLUMNAS_TAREA} FROM tareas WHERE id = ?", (tarea_id,)
+        ).fetchone()
+        return Tarea._make(fila) if fila else None
+
+    def insertar(self, campos):
+        """Inserta una tarea con campos validados y la devuelve"""
+        tarea_id = self.shards.nuevo_id_tarea(self.conn if self.en_directorio else None)
+        self.conn.execute(
+            "INSERT INTO tareas (id, usuario_id, titulo, descripcion, prioridad, vence) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (tarea_id, self.usuario_id, campos['titulo'], campos.get('descripcion'),
+             campos.get('prioridad', 0), campos.get('vence'))
+        )
+        if campos.get('completada'):
+            return self.modificar(tarea_id, {'completada': True})
+        return self.leer(tarea_id)
+
+    def modificar(self, tarea_id, campos):
+        """Actualiza una tarea propia; devuelve la tarea o None si no es del usuario"""
+        asignaciones = ', '.join(f"{campo} = ?" for campo in campos)
+        valores = list(campos.values())
+
+        # La fecha de completado alimenta el archivado de tareas antiguas
+        if 'completada' in campos:
+            asignaciones += (
+                ", fecha_completada = CASE WHEN ? THEN "
+                "COALESCE(fecha_completada, CURRENT_TIMESTAMP) ELSE NULL END"
+            )
+            valores.append(campos['completada'])
+
+        cursor = self.conn.execute(
+            f"UPDATE tareas SET {asignaciones} WHERE id = ? AND usuario_id = ?",
+            (*valores, tarea_id, self.usuario_id)
+        )
+        return self.leer(tarea_id) if cursor.rowcount else None
+
+    def borrar(self, tarea_id):
+        """Elimina una tarea propia; indica si existía"""
+        cursor = self.conn.execute(
+            "DELETE FROM tareas WHERE id = ? AND usuario_id = ?", (tarea_id, self.usuario_id)
+        )
+        return cursor.rowcount > 0
+
+    def etiquetar(self, tarea_ids, agregar, quitar):
+        """Agrega y quita etiquetas a tareas propias; devuelve (propias, agregadas, quitadas)"""
+        propias = [fila[0] for fila in self.conn.execute(
+            f"SELECT id FROM tareas WHERE usuario_id = ? AND id IN ({_marcadores(tarea_ids)})",
+            (self.usuario_id, *tarea_ids)
+        )]
+
+        agregadas = quitadas = 0
+        if agregar and propias:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO etiquetas (usuario_id, nombre) VALUES (?, ?)",
+                [(self.usuario_id, nombre) for nombre in agregar]
+            )
+            etiqueta_ids = [fila[0] for fila in self.conn.execute(
+                f"SELECT id FROM etiquetas WHERE usuario_id = ? AND nombre IN ({_marcadores(agregar)})",
+                (self.usuario_id, *agregar)
+            )]
+            agregadas = self.conn.executemany(
+                "INSERT OR IGNORE INTO tarea_etiquetas (etiqueta_id, tarea_id) VALUES (?, ?)",
+                [(etiqueta_id, tarea_id) for etiqueta_id in etiqueta_ids for tarea_id in propias]
+            ).rowcount
+        if quitar and propias:
+            quitadas = self.conn.executemany(
+                "DELETE FROM tarea_etiquetas WHERE tarea_id = ? AND etiqueta_id = "
+                "(SELECT id FROM etiquetas WHERE usuario_id = ? AND nombre = ?)",
+                [(tarea_id, self.usuario_id, nombre) for nombre in quitar for tarea_id in propias]
+            ).rowcount
+        return propias, agregadas, quitadas
+
+class Repositorio:
+    """Consultas de usuarios y tareas sobre conexiones reutilizadas de un pool"""
+
+    def __init__(self, shards, replicas, archivador, estadisticas, cache_sentencias=CACHE_SENTENCIAS,
+                 tamaño_pool=TAMAÑO_POOL):
+        self.shards = shards
+        self.replicas = replicas
+        self.archivador = archivador
+        self.estadisticas = estadisticas
+        self.cache_sentencias = cache_sentencias
+        self.tamaño_pool = tamaño_pool
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.abiertas = 0
+        # Lecturas idénticas simultáneas (p. ej. los conteos de /status) se ejecutan una vez
+        self.vuelos = VueloUnico()
+
+    def _pool(self, ruta):
+        """Cola de conexiones libres de un archivo"""
+        with self._lock:
+            pool = self._pools.get(ruta)
+            if pool is None:
+                pool = self._pools[ruta] = queue.Queue(self.tamaño_pool)
+            return pool
+
+    def conexion(self, ruta):
+        """Conexión de este hilo a un archivo, tomada del pool hasta `liberar()`.
+
+        El servidor atiende cada petición en un hilo nuevo, así que la conexión
+        se toma al primer uso y vuelve al pool al terminar la petición. Cada uso
+        termina con commit o rollback (ver `transaccion`), así que la conexión
+        no lleva bloqueos ni instantáneas de lectura de una petición a otra.
+        """
+        conexiones = self._local.__dict__.setdefault('conexiones', {})
+        conn = conexiones.get(ruta)
+        if conn is None:
+            try:
+                conn = self._pool(ruta).get_nowait()
+            except queue.Empty:
+                # Las conexiones pasan de un hilo a otro, nunca usadas a la vez
+                conn = particionado.conectar(
+                    ruta, cached_statements=self.cache_sentencias, check_same_thread=False
+                )
+                with self._lock:
+                    self.abiertas += 1
+            conexiones[ruta] = conn
+        return conn
+
+    def liberar(self):
+        """Devuelve al pool las conexiones de este hilo (cierra las que no caben)"""
+        for ruta, conn in self._local.__dict__.pop('conexiones', {}).items():
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool(ruta).put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transaccion(self, ruta):
+        """Conexión de este hilo con commit al salir del bloque (rollback si falla)"""
+        conn = self.conexion(ruta)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def tareas_de(self, usuario_id):
+        """Transacción sobre el shard del usuario para modificar sus tareas.
+
+        La ubicación se vuelve a leer con el bloqueo de escritura del shard ya
+        tomado: si `mover_usuario` cambió al usuario de shard entre la consulta
+        y el bloqueo, se deshace y se reintenta en el shard nuevo.
+        """
+        ruta = self.shard_de(usuario_id)
+        conn = self.conexion(ruta)
+        while len(self.shards.shards) > 1 and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+            if ruta == self.shards.directorio:
+                # Misma conexión: `shard_de` haría commit de esta transacción
+                actual = self.shards.shard_de(usuario_id, conn)
+            else:
+                actual = self.shard_de(usuario_id)
+            if actual == ruta:
+                break
+            conn.rollback()
+            ruta = actual
+            conn = self.conexion(ruta)
+
+        with self.transaccion(ruta) as conn:
+            yield TareasUsuario(conn, usuario_id, self.shards, ruta == self.shards.directorio)
+
+    def shard_de(self, usuario_id):
+        """Shard con las tareas de un usuario; las ubicaciones se leen con el pool"""
+        if len(self.shards.shards) == 1:
+            return self.shards.shards[0]
+        with self.transaccion(self.shards.directorio) as conn:
+            return self.shards.shard_de(usuario_id, conn)
+
+    def cerrar(self):
+        """Cierra las conexiones de este hilo y las libres de los pools"""
+        for conn in self._local.__dict__.pop('conexiones', {}).values():
+            conn.close()
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            while not pool.empty():
+                pool.get_nowait().close()
+
+    def estado(self):
+        """Conexiones abiertas desde el inicio y libres en cada pool"""
+        with self._lock:
+            return {'abiertas': self.abiertas,
+                    'libres': {ruta: pool.qsize() for ruta, pool in self._pools.items()}}
+
+    # Usuarios (directorio)
+
+    def crear_usuario(self, usuario, contraseña_hash):
+        """Registra un usuario; devuelve su id o None si el nombre ya existe"""
+        try:
+            with self.transaccion(self.shards.directorio) as conn:
+                return conn.execute(
+                    "INSERT INTO usuarios (usuario, contraseña_hash) VALUES (?, ?)",
+                    (usuario, contraseña_hash)
+                ).lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    def buscar_usuario(self, usuario):
+        """Usuario por nombre (None si no existe)"""
+        with self.transaccion(self.shards.directorio) as conn:
+            fila = conn.execute(
+                "SELECT id, usuario, contraseña_hash, version FROM usuarios WHERE usuario = ?", (usuario,)
+            ).fetchone()
+        return Usuario._make(fila) if fila else None
+
+    def usuario_por_id(self, usuario_id):
+        """Usuario por id (None si no existe)"""
+        with self.transaccion(self.shards.directorio) as conn:
+            fila = conn.execute(
+                "SELECT id, usuario, contraseña_hash, version FROM usuarios WHERE id = ?", (usuario_id,)
+            ).fetchone()
+        return Usuario._make(fila) if fila else None
+
+    def sello_usuarios(self):
+        """Versión global de los usuarios: crece con cada cambio de contraseña o baja"""
+        with self.transaccion(self.shards.directorio) as conn:
+            fila = conn.execute(
+                "SELECT valor FROM secuencias WHERE nombre = 'version_usuarios'"
+            ).fetchone()
+        return fila[0] if fila else 0
+
+    @staticmethod
+    def _avanzar_sello(conn):
+        """Incrementa la versión global para que los demás procesos vacíen su caché"""
+        conn.execute("UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'version_usuarios'")
+
+    def cambiar_contraseña(self, usuario_id, contraseña_hash):
+        """Guarda un hash nuevo; devuelve la nueva versión del usuario (None si no existe)"""
+        with self.transaccion(self.shards.directorio) as conn:
+            fila = conn.execute(
+                "UPDATE usuarios SET contraseña_hash = ?, version = version + 1 "
+                "WHERE id = ? RETURNING version",
+                (contraseña_hash, usuario_id)
+            ).fetchone()
+            if fila:
+                self._avanzar_sello(conn)
+        return fila[0] if fila else None
+
+    def eliminar_usuario(self, usuario_id):
+        """Da de baja a un usuario con sus tareas, etiquetas, estadísticas y archivo.
+
+        Primero se borra el usuario (sus sesiones dejan de valer) y después sus
+        datos; si el proceso se interrumpe en medio quedan filas huérfanas que
+        ninguna consulta alcanza.
+        """
+        shard = self.shard_de(usuario_id)
+        with self.transaccion(self.shards.directorio) as conn:
+            borrado = conn.execute("DELETE FROM usuarios WHERE id = ?", (usuario_id,)).rowcount
+            conn.execute("DELETE FROM ubicaciones WHERE usuario_id = ?", (usuario_id,))
+            conn.execute("DELETE FROM tokens WHERE usuario_id = ?", (usuario_id,))
+            self._avanzar_sello(conn)
+        if not borrado:
+            return False
+
+        with self.transaccion(shard) as conn:
+            # Los triggers quitan las asignaciones de etiquetas y descuentan estadísticas
+            conn.execute("DELETE FROM tareas WHERE usuario_id = ?", (usuario_id,))
+            conn.execute("DELETE FROM etiquetas WHERE usuario_id = ?", (usuario_id,))
+            for tabla in particionado.CONTADORES_POR_USUARIO:
+                conn.execute(f"DELETE FROM {tabla} WHERE usuario_id = ?", (usuario_id,))
+        self.archivador.eliminar_usuario(usuario_id)
+        return True
+
+    # Tokens de API
+
+    def crear_token(self, usuario_id, prefijo, hash_token, nombre):
+        """Guarda un token de API (solo su HMAC) bajo su prefijo de búsqueda"""
+        with self.transaccion(self.shards.directorio) as conn:
+            conn.execute(
+                "INSERT INTO tokens (prefijo, usuario_id, hash, nombre) VALUES (?, ?, ?, ?)",
+                (prefijo, usuario_id, hash_token, nombre)
+            )
+
+    def token_por_prefijo(self, prefijo):
+        """Token por prefijo (None si no existe o fue revocado)"""
+        with self.transaccion(self.shards.directorio) as conn:
+            fila = conn.execute(
+                "SELECT prefijo, usuario_id, hash FROM tokens WHERE prefijo = ?", (prefijo,)
+            ).fetchone()
+        return Token._make(fila) if fila else None
+
+    def listar_tokens(self, usuario_id):
+        """Tokens del usuario, sin sus hashes"""
+        with self.transaccion(self.shards.directorio) as conn:
+            return list(map(TokenInfo._make, conn.execute(
+                "SELECT prefijo, nombre, fecha_creacion FROM tokens WHERE usuario_id = ? ORDER BY fecha_creacion",
+                (usuario_id,)
+            ).fetchall()))
+
+    def revocar_token(self, usuario_id, prefijo):
+        """Borra un token propio; indica si existía"""
+        with self.transaccion(self.shards.directorio) as conn:
+            return conn.execute(
+                "DELETE FROM tokens WHERE prefijo = ? AND usuario_id = ?", (prefijo, usuario_id)
+            ).rowcount > 0
+
+    # Consultas agregadas (réplica si está habilitada y vigente)
+
+    def _contar_en(self, ruta, tabla):
+        """COUNT(*) de una tabla; las llamadas simultáneas comparten una sola consulta"""
+        return self.vuelos.hacer(('contar', ruta, tabla), self._contar, ruta, tabla)
+
+    def _contar(self, ruta, tabla):
+        """COUNT(*) de una tabla, leído con una conexión de corta vida.
+
+        Las réplicas se reemplazan como archivos nuevos en cada refresco, así
+        que no se reutilizan sus conexiones.
+        """
+        conn = self.replicas.conectar(ruta)
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def contar_usuarios(self):
+        """Usuarios registrados"""
+        return self._contar_en(self.shards.directorio, 'usuarios')
+
+    def contar_tareas(self):
+        """Tareas activas en todos los shards"""
+        return sum(self._contar_en(ruta, 'tareas') for ruta in self.shards.shards)
+
+    def lectura_en_replica(self):
+        """Indica si las consultas agregadas se leen de la réplica"""
+        return self.replicas.usa_replica(self.shards.directorio)
+
+    # Tareas
+
+    def listar_tareas(self, usuario_id):
+        """Tareas activas del usuario ordenadas por id"""
+        with self.transaccion(self.shard_de(usuario_id)) as conn:
+            return list(map(Tarea._make, conn.execute(
+                f"SELECT {COLUMNAS_TAREA} FROM tareas WHERE usuario_id = ? ORDER BY id",
+                (usuario_id,)
+            ).fetchall()))
+
+    def listar_archivadas(self, usuario_id):
+        """Tareas archivadas del usuario"""
+        return list(map(Tarea._make, self.archivador.listar(usuario_id)))
+
+    def tareas_con_etiquetas(self, usuario_id, nombres, todas=True):
+        """Tareas del usuario que tienen todas (o alguna) de las etiquetas.
+
+        Cada etiqueta aporta un tramo de la clave primaria de tarea_etiquetas y los
+        tramos se combinan con INTERSECT/UNION, sin recorrer las tareas del usuario.
+        """
+        with self.transaccion(self.shard_de(usuario_id)) as conn:
+            ids = [fila[0] for fila in conn.execute(
+                f"SELECT id FROM etiquetas WHERE usuario_id = ? AND nombre IN ({_marcadores(nombres)})",
+                (usuario_id, *nombres)
+            )]
+            if not ids or (todas and len(ids) < len(nombres)):
+                return []
+
+            operador = ' INTERSECT ' if todas else ' UNION '
+            subconsulta = operador.join(
+                "SELECT tarea_id FROM tarea_etiquetas WHERE etiqueta_id = ?" for _ in ids
+            )
+            return list(map(Tarea._make, conn.execute(
+                f"SELECT {COLUMNAS_TAREA} FROM tareas "
+                f"WHERE id IN ({subconsulta}) AND usuario_id = ? ORDER BY id",
+                (*ids, usuario_id)
+            ).fetchall()))
+
+    def etiquetas_por_tarea(self, usuario_id):
+        """{tarea_id: [nombres]} con las etiquetas de las tareas del usuario"""
+        por_tarea = {}
+        with self.transaccion(self.shard_de(usuario_id)) as conn:
+            for tarea_id, nombre in conn.execute(
+                "SELECT te.tarea_id, e.nombre FROM etiquetas e "
+                "JOIN tarea_etiquetas te ON te.etiqueta_id = e.id "
+                "WHERE e.usuario_id = ? ORDER BY e.nombre",
+                (usuario_id,)
+            ):
+                por_tarea.setdefault(tarea_id, []).append(nombre)
+        return por_tarea
+
+    def siguientes_tareas(self, usuario_id, k):
+        """Las k tareas pendientes más urgentes, leídas en el orden de idx_tareas_siguientes.
+
+        Primero las que vencen antes (y a igual vencimiento, mayor prioridad); luego
+        las que no tienen vencimiento, por prioridad. Son dos consultas porque SQLite
+        ordena los NULL primero: cada una recorre un tramo del índice sin ordenar.
+        """
+        with self.transaccion(self.shard_de(usuario_id)) as conn:
+            filas = conn.execute(
+                f"SELECT {COLUMNAS_TAREA} FROM tareas "
+                "WHERE usuario_id = ? AND completada = 0 AND vence IS NOT NULL "
+                "ORDER BY vence, prioridad DESC LIMIT ?",
+                (usuario_id, k)
+            ).fetchall()
+            if len(filas) < k:
+                filas += conn.execute(
+                    f"SELECT {COLUMNAS_TAREA} FROM tareas "
+                    "WHERE usuario_id = ? AND completada = 0 AND vence IS NULL "
+                    "ORDER BY prioridad DESC LIMIT ?",
+                    (usuario_id, k - len(filas))
+                ).fetchall()
+        return list(map(Tarea._make, filas))
+
+    def listar_etiquetas(self, usuario_id):
+        """Etiquetas del usuario con la cantidad de tareas de cada una"""
+        with self.transaccion(self.shard_de(usuario_id)) as conn:
+            return list(map(Etiqueta._make, conn.execute(
+                "SELECT nombre, cantidad FROM etiquetas WHERE usuario_id = ? ORDER BY nombre",
+                (usuario_id,)
+            ).fetchall()))
+
+    def estadisticas_de(self, usuario_id, dias):
+        """Totales del usuario y su actividad de los últimos `dias` días"""
+        with self.transaccion(self.shard_de(usuario_id)) as conn:
+            return self.estadisticas.leer(conn, usuario_id, dias)
+
+    # Sondas
+
+    @staticmethod
+    def comprobar_base(ruta, plazo):
+        """Ejecuta una consulta trivial sobre un archivo con `plazo` segundos como límite.
+
+        Usa una conexión nueva a propósito: la sonda debe detectar un archivo que
+        ya no se puede abrir, no solo una conexión que sigue viva.
+        """
+        inicio = time.perf_counter()
+        limite = inicio + plazo
+        try:
+            conn = particionado.conectar(ruta, timeout=plazo)
+            try:
+                # El manejador de progreso interrumpe la consulta al vencer el plazo
+                conn.set_progress_handler(lambda: time.perf_counter() > limite, 1000)
+                # Lee el esquema (no solo SELECT 1) para tocar realmente el archivo
+                conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return {'ok': False, 'error': str(e), 'ms': round((time.perf_counter() - inicio) * 1000, 2)}
+        return {'ok': True, 'ms': round((time.perf_counter() - inicio) * 1000, 2)}
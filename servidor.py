@@ -1,70 +1,349 @@
-from flask import Flask, request, jsonify, render_template_string, session
+from flask import Flask, request, jsonify, make_response, render_template, session, g
+from jinja2 import DictLoader, FileSystemBytecodeCache
 import sqlite3
-import bcrypt
 import os
+import hashlib
+import io
+import hmac
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from functools import wraps
 import datetime
+import logging
+from bitacora import Bitacora, configurar as configurar_bitacora
+from compresion import Compresor
+from admision import ControlAdmision
+from cuerpos import LimiteCuerpo, ErrorCuerpo, leer_arreglo_json, leer_ndjson
+import particionado
+import metricas_sql
+import negociacion
+from replica import Replicas
+from archivado import Archivador
+from estadisticas import Estadisticas, ESQUEMA as ESQUEMA_ESTADISTICAS
+from planificador import Planificador
+from repositorio import Repositorio
+from cache_usuarios import CacheUsuarios
+from idempotencia import AlmacenIdempotencia, EN_CURSO, OTRA_PETICION
+
+# Momento de importación, para medir cuánto tarda el proceso en quedar listo
+INICIO_PROCESO = time.perf_counter()
 
 app = Flask(__name__)
 app.secret_key = 'tu_clave_secreta_super_segura'  # Cambiar en producción
 
+logger = logging.getLogger('servidor')
+
+# Línea de acceso JSON por petición con su X-Request-ID; va antes que las demás
+# extensiones para medir la petición completa y ver la respuesta ya comprimida
+app.config['BITACORA_MUESTREO'] = float(os.environ.get('BITACORA_MUESTREO', 1.0))
+app.config['BITACORA_LENTA_MS'] = float(os.environ.get('BITACORA_LENTA_MS', 500))
+bitacora = Bitacora(app)
+
+# Compresión de respuestas (umbral en bytes y nivel de zlib configurables)
+app.config['COMPRESION_TAMAÑO_MINIMO'] = int(os.environ.get('COMPRESION_TAMAÑO_MINIMO', 500))
+app.config['COMPRESION_NIVEL'] = int(os.environ.get('COMPRESION_NIVEL', 6))
+compresor = Compresor(app)
+
+# Respuestas y cuerpos en MessagePack según Accept/Content-Type (si está instalado)
+negociacion.init_app(app)
+
 # Configuración de la base de datos
 DB_NAME = 'tareas.db'
 
-def init_db():
-    """Inicializa la base de datos con las tablas necesarias"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+# Costo de bcrypt (las pruebas lo bajan para no pagar 250 ms por hash)
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+# Estadísticas por sentencia SQL; las que tardan más que SQL_LENTA_MS se
+# registran en el log con su plan
+metricas_sql.activas = os.environ.get('SQL_METRICAS', '1') == '1'
+metricas_sql.registro.umbral_lento = float(os.environ.get('SQL_LENTA_MS', 100)) / 1000
+
+# Sondas de disponibilidad: cuánto se reutiliza un resultado y cuánto puede
+# tardar la base de datos en responder antes de considerarla no disponible
+SONDA_CACHE_SEGUNDOS = float(os.environ.get('SONDA_CACHE_SEGUNDOS', 2))
+SONDA_TIEMPO_LIMITE = float(os.environ.get('SONDA_TIEMPO_LIMITE', 0.5))
+
+class PoolHash:
+    """Limita cuántos hashes de bcrypt se calculan a la vez y cuenta la espera"""
+    
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self._semaforo = threading.BoundedSemaphore(capacidad)
+        self._lock = threading.Lock()
+        self.en_uso = 0
+        self.esperando = 0
+    
+    @contextmanager
+    def ocupar(self):
+        """Reserva un lugar del pool mientras dura el bloque"""
+        with self._lock:
+            self.esperando += 1
+        self._semaforo.acquire()
+        with self._lock:
+            self.esperando -= 1
+            self.en_uso += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.en_uso -= 1
+            self._semaforo.release()
+    
+    def saturado(self):
+        """Hay tantas peticiones esperando como lugares tiene el pool"""
+        return self.esperando >= self.capacidad
+    
+    def estado(self):
+        """Ocupación actual del pool"""
+        return {'capacidad': self.capacidad, 'en_uso': self.en_uso, 'esperando': self.esperando}
+
+# bcrypt usa CPU: más hashes simultáneos que núcleos solo alargan cada login
+pool_hash = PoolHash(int(os.environ.get('BCRYPT_CONCURRENCIA', os.cpu_count() or 4)))
+
+# Clase de admisión de los endpoints que no se deducen del método HTTP; None
+# es sin límite (sondas y contadores de monitoreo deben responder siempre)
+CLASE_POR_ENDPOINT = {
+    'registro': 'autenticacion',
+    'login': 'autenticacion',
+    'cambiar_contraseña': 'autenticacion',
+    'eliminar_cuenta': 'autenticacion',
+    'healthz': None,
+    'readyz': None,
+    'admin_admision': None,
+}
+
+def clase_de_peticion():
+    """Clase de admisión de la petición actual"""
+    if request.endpoint in CLASE_POR_ENDPOINT:
+        return CLASE_POR_ENDPOINT[request.endpoint]
+    return 'lectura' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'escritura'
+
+# Peticiones en curso por clase antes de rechazar con 503 + Retry-After. Las de
+# autenticación esperan bcrypt: más del doble del pool solo alarga las colas
+app.config['ADMISION_LIMITES'] = {
+    'autenticacion': int(os.environ.get('ADMISION_AUTENTICACION', pool_hash.capacidad * 2)),
+    'escritura': int(os.environ.get('ADMISION_ESCRITURA', 32)),
+    'lectura': int(os.environ.get('ADMISION_LECTURA', 64)),
+}
+app.config['ADMISION_REINTENTO'] = int(os.environ.get('ADMISION_REINTENTO', 1))
+admision = ControlAdmision(app, clase_de_peticion)
+
+# Tamaño máximo del cuerpo por endpoint (bytes); los demás usan CUERPO_MAXIMO.
+# Las credenciales son pequeñas; el lote se lee de forma incremental
+app.config['CUERPO_MAXIMO'] = int(os.environ.get('CUERPO_MAXIMO', 64 * 1024))
+LIMITE_CUERPO_POR_ENDPOINT = {
+    'registro': 4096,
+    'login': 4096,
+    'cambiar_contraseña': 4096,
+    'eliminar_cuenta': 4096,
+    'lote_tareas': int(os.environ.get('CUERPO_MAXIMO_LOTE', 4 * 1024 * 1024)),
+}
+limite_cuerpo = LimiteCuerpo(app, lambda: LIMITE_CUERPO_POR_ENDPOINT.get(request.endpoint))
+
+def configurar_bd(db_name, rutas_shards=None, ruta_archivo=None):
+    """Configura las rutas de las bases de datos y los componentes que dependen de ellas"""
+    global DB_NAME, shards, replicas, archivador, estadisticas, planificador, repositorio, usuarios_cache, idempotencia
+    
+    DB_NAME = db_name
+    
+    # Las tareas se reparten por usuario entre los archivos de TAREAS_SHARDS;
+    # DB_NAME actúa como directorio (usuarios) y como shard por defecto
+    if rutas_shards is None:
+        shards = particionado.Shards.desde_entorno(DB_NAME)
+    else:
+        shards = particionado.Shards(DB_NAME, rutas_shards)
+    
+    # Réplicas de solo lectura para consultas agregadas (/status y página de inicio)
+    replicas = Replicas(
+        dict.fromkeys([DB_NAME, *shards.shards]),
+        intervalo=int(os.environ.get('REPLICA_INTERVALO', 60)),
+        habilitada=os.environ.get('USAR_REPLICA', '0') == '1'
+    )
     
-    # Tabla de usuarios
-    cursor.execute('''
+    # Archivado de tareas completadas antiguas en un archivo SQLite frío; las
+    # estadísticas por usuario siguen contando las tareas archivadas
+    ruta_archivo = ruta_archivo or os.environ.get('ARCHIVO_DB', 'tareas_archivo.db')
+    estadisticas = Estadisticas(shards, ruta_archivo)
+    archivador = Archivador(
+        shards,
+        ruta_archivo,
+        dias=int(os.environ.get('ARCHIVADO_DIAS', 30)),
+        lote=int(os.environ.get('ARCHIVADO_LOTE', 500)),
+        al_archivar=estadisticas.registrar_archivadas
+    )
+    
+    # Trabajos de mantenimiento en segundo plano (leases en el directorio)
+    planificador = Planificador(DB_NAME)
+    
+    # Las rutas consultan SQLite solo a través del repositorio
+    repositorio = Repositorio(
+        shards, replicas, archivador, estadisticas,
+        cache_sentencias=int(os.environ.get('SQL_CACHE_SENTENCIAS', 256)),
+        tamaño_pool=int(os.environ.get('SQL_POOL_TAMAÑO', 16))
+    )
+    
+    # Registros de usuarios autenticados, para no consultar usuarios en cada petición
+    usuarios_cache = CacheUsuarios(
+        repositorio.usuario_por_id,
+        repositorio.sello_usuarios,
+        capacidad=int(os.environ.get('USUARIOS_CACHE_TAMAÑO', 1024)),
+        ttl=float(os.environ.get('USUARIOS_CACHE_TTL', 60)),
+        intervalo_sello=float(os.environ.get('USUARIOS_CACHE_SELLO', 1))
+    )
+    
+    # Respuestas de las peticiones con Idempotency-Key, en el directorio
+    idempotencia = AlmacenIdempotencia(
+        lambda: repositorio.transaccion(DB_NAME),
+        app.secret_key.encode('utf-8'),
+        ttl=float(os.environ.get('IDEMPOTENCIA_TTL', 86400)),
+        capacidad=int(os.environ.get('IDEMPOTENCIA_CACHE_TAMAÑO', 1024))
+    )
+    
+    # Con otras bases el proceso debe volver a prepararse
+    arranque.update(listo=False, iniciado=False, error=None)
+    sonda.update(resultado=None, expira=0.0)
+
+# Estado de la preparación del proceso (base de datos y plantillas)
+arranque = {'listo': False, 'iniciado': False, 'error': None, 'etapas': {}, 'segundos_hasta_listo': None}
+lock_arranque = threading.Lock()
+
+# Último resultado de las comprobaciones de /readyz y hasta cuándo vale
+sonda = {'resultado': None, 'expira': 0.0}
+lock_sonda = threading.Lock()
+
+configurar_bd(DB_NAME)
+
+# Tokens de API: "<PREFIJO_TOKEN>_<prefijo de búsqueda>_<secreto>", guardados
+# como HMAC con esta clave
+PREFIJO_TOKEN = 'tgt'
+CLAVE_TOKENS = os.environ.get('TOKENS_CLAVE', app.secret_key).encode('utf-8')
+
+# Usuarios con acceso a los endpoints /admin. Vacío por defecto: el registro es
+# abierto y cualquiera podría tomar un nombre fijo como "admin"
+ADMIN_USUARIOS = {
+    u.strip() for u in os.environ.get('ADMIN_USUARIOS', '').split(',') if u.strip()
+}
+
+# Migraciones del esquema: la posición en la lista (+1) es la versión que queda
+# registrada en la tabla `esquema` al aplicarla. Cada paso es una sentencia SQL
+# o una función que recibe la conexión
+MIGRACIONES_DIRECTORIO = [
+    [
+        '''
         CREATE TABLE IF NOT EXISTS usuarios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             usuario TEXT UNIQUE NOT NULL,
             contraseña_hash TEXT NOT NULL,
             fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    
-    # Tabla de tareas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tareas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usuario_id INTEGER,
-            titulo TEXT NOT NULL,
-            descripcion TEXT,
-            completada BOOLEAN DEFAULT FALSE,
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        ''',
+        # Tablas del particionado (ubicaciones y secuencia de ids)
+        lambda conn: shards.init_directorio(conn),
+        # Leases del planificador de trabajos
+        lambda conn: planificador.init_db(conn),
+    ],
+    [
+        # Versión por usuario (invalida sesiones) y sello global (invalida cachés)
+        "ALTER TABLE usuarios ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        "INSERT OR IGNORE INTO secuencias (nombre, valor) VALUES ('version_usuarios', 0)",
+    ],
+    [
+        # Tokens de API; el prefijo (clave primaria) es la búsqueda de cada petición
+        '''
+        CREATE TABLE IF NOT EXISTS tokens (
+            prefijo TEXT PRIMARY KEY,
+            usuario_id INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            nombre TEXT,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_tokens_usuario ON tokens (usuario_id)",
+    ],
+    [
+        # Respuestas guardadas de las peticiones con Idempotency-Key
+        lambda conn: AlmacenIdempotencia.init_db(conn),
+    ],
+]
+
+MIGRACIONES_TAREAS = [
+    [
+        "ALTER TABLE tareas ADD COLUMN fecha_completada TIMESTAMP",
+        "UPDATE tareas SET fecha_completada = CURRENT_TIMESTAMP WHERE completada = 1",
+        "CREATE INDEX IF NOT EXISTS idx_tareas_completadas "
+        "ON tareas (fecha_completada) WHERE completada = 1",
+    ],
+    [
+        "ALTER TABLE tareas ADD COLUMN prioridad INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE tareas ADD COLUMN vence TIMESTAMP",
+        # Tareas pendientes en el orden de /api/tareas/siguientes
+        "CREATE INDEX IF NOT EXISTS idx_tareas_siguientes "
+        "ON tareas (usuario_id, vence, prioridad DESC) WHERE completada = 0",
+    ],
+    [
+        # Etiquetas de cada usuario; `cantidad` = tareas que la llevan
+        '''
+        CREATE TABLE IF NOT EXISTS etiquetas (
+            id INTEGER PRIMARY KEY,
+            usuario_id INTEGER NOT NULL,
+            nombre TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (usuario_id, nombre)
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
+        ''',
+        # La clave (etiqueta_id, tarea_id) es el índice que recorren los filtros
+        '''
+        CREATE TABLE IF NOT EXISTS tarea_etiquetas (
+            etiqueta_id INTEGER NOT NULL,
+            tarea_id INTEGER NOT NULL,
+            PRIMARY KEY (etiqueta_id, tarea_id)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_tarea_etiquetas_tarea "
+        "ON tarea_etiquetas (tarea_id, etiqueta_id)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS etiquetas_sumar AFTER INSERT ON tarea_etiquetas
+        BEGIN
+            UPDATE etiquetas SET cantidad = cantidad + 1 WHERE id = NEW.etiqueta_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS etiquetas_restar AFTER DELETE ON tarea_etiquetas
+        BEGIN
+            UPDATE etiquetas SET cantidad = cantidad - 1 WHERE id = OLD.etiqueta_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS tareas_quitar_etiquetas AFTER DELETE ON tareas
+        BEGIN
+            DELETE FROM tarea_etiquetas WHERE tarea_id = OLD.id;
+        END
+        ''',
+    ],
+    [
+        # Estadísticas materializadas por usuario, cargadas con las tareas existentes
+        *ESQUEMA_ESTADISTICAS,
+        lambda conn: estadisticas.reconstruir_conexion(conn),
+    ],
+]
 
-def hash_password(password):
-    """Hashea una contraseña usando bcrypt"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+# Prioridades válidas: 0 (baja) a 3 (urgente)
+PRIORIDAD_MINIMA, PRIORIDAD_MAXIMA = 0, 3
 
-def verify_password(password, hashed):
-    """Verifica una contraseña contra su hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+# Máximo de tareas que devuelve /api/tareas/siguientes
+MAX_SIGUIENTES = 100
 
-def require_login(f):
-    """Decorador para requerir autenticación"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'usuario_id' not in session:
-            return jsonify({'error': 'Debe iniciar sesión primero'}), 401
-        return f(*args, **kwargs)
-    return decorated_function
+# Largo máximo del nombre de una etiqueta
+MAX_LARGO_ETIQUETA = 50
 
-@app.route('/')
-def index():
-    """Página de inicio"""
-    html_template = """
+# Máximo de días de actividad que devuelve /api/estadisticas
+MAX_DIAS_ESTADISTICAS = 365
+
+# Plantillas HTML de las páginas
+PLANTILLA_INICIO = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -127,26 +406,405 @@ def index():
     </body>
     </html>
     """
+
+PLANTILLA_TAREAS = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Mis Tareas - Sistema de Gestión</title>
+        <style>
+            body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }
+            .container { background: #f4f4f4; padding: 20px; border-radius: 5px; }
+            .welcome { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 5px; margin-bottom: 20px; }
+            .info-box { background: white; padding: 15px; margin: 10px 0; border-radius: 3px; border-left: 4px solid #4CAF50; }
+            .logout-btn { background: #f44336; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin-top: 10px; }
+            .stats { display: flex; gap: 20px; margin: 20px 0; }
+            .stat-card { background: white; padding: 15px; border-radius: 5px; flex: 1; text-align: center; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="welcome">
+                <h1>🎉 ¡Bienvenido {{ usuario }}!</h1>
+                <p>Has iniciado sesión exitosamente en el Sistema de Gestión de Tareas.</p>
+            </div>
+            
+            <div class="info-box">
+                <h3>✅ Autenticación Exitosa</h3>
+                <p>Tu sesión está activa y puedes acceder a todas las funcionalidades del sistema.</p>
+                <p><strong>Usuario:</strong> {{ usuario }}</p>
+                <p><strong>Sesión iniciada:</strong> {{ fecha_actual }}</p>
+            </div>
+            
+            <div class="stats">
+                <div class="stat-card">
+                    <h3>📋 Tareas</h3>
+                    <p>{{ estadisticas.total }}</p>
+                </div>
+                <div class="stat-card">
+                    <h3>✅ Completadas</h3>
+                    <p>{{ estadisticas.completadas }}</p>
+                </div>
+                <div class="stat-card">
+                    <h3>⏳ Pendientes</h3>
+                    <p>{{ estadisticas.pendientes }}</p>
+                </div>
+            </div>
+            
+            <div class="info-box">
+                <h3>🔧 Funcionalidades Implementadas</h3>
+                <ul>
+                    <li>✅ Registro de usuarios con validación</li>
+                    <li>✅ Autenticación segura con hashing</li>
+                    <li>✅ Sesiones de usuario</li>
+                    <li>✅ Base de datos SQLite</li>
+                    <li>✅ API REST endpoints</li>
+                    <li>✅ Páginas HTML responsivas</li>
+                </ul>
+            </div>
+            
+            <a href="/logout" class="logout-btn">🚪 Cerrar Sesión</a>
+        </div>
+    </body>
+    </html>
+    """
+
+def prefijo_estatico(plantilla):
+    """Devuelve la porción inicial de una plantilla que no depende del contexto"""
+    return plantilla.split('{{', 1)[0].split('{%', 1)[0]
+
+# Las porciones estáticas (cabecera y CSS) se comprimen una sola vez
+compresor.registrar_prefijo(prefijo_estatico(PLANTILLA_INICIO))
+compresor.registrar_prefijo(prefijo_estatico(PLANTILLA_TAREAS))
+
+# Las plantillas se compilan en el primer uso y Jinja las mantiene en memoria;
+# con PLANTILLAS_CACHE el bytecode compilado se guarda en disco para los
+# procesos que arrancan después
+app.jinja_loader = DictLoader({
+    'inicio.html': PLANTILLA_INICIO,
+    'tareas.html': PLANTILLA_TAREAS,
+})
+if os.environ.get('PLANTILLAS_CACHE'):
+    os.makedirs(os.environ['PLANTILLAS_CACHE'], exist_ok=True)
+    app.jinja_options = {
+        **app.jinja_options,
+        'bytecode_cache': FileSystemBytecodeCache(os.environ['PLANTILLAS_CACHE'])
+    }
+
+def version_esquema(conn, componente):
+    """Versión registrada de un componente del esquema (0 si no hay registro)"""
+    try:
+        fila = conn.execute(
+            "SELECT version FROM esquema WHERE componente = ?", (componente,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Base anterior a la tabla esquema
+        return 0
+    return fila[0] if fila else 0
+
+def migrar(conn, componente, migraciones):
+    """Aplica las migraciones pendientes de un componente del esquema"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS esquema (
+            componente TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    version = version_esquema(conn, componente)
     
-    # Obtener estadísticas
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM usuarios")
-    user_count = cursor.fetchone()[0]
+    for numero, pasos in enumerate(migraciones[version:], start=version + 1):
+        for paso in pasos:
+            if callable(paso):
+                paso(conn)
+            else:
+                conn.execute(paso)
+        conn.execute(
+            "INSERT OR REPLACE INTO esquema (componente, version) VALUES (?, ?)",
+            (componente, numero)
+        )
+        conn.commit()
+
+def init_db():
+    """Inicializa la base de datos con las tablas necesarias.
+
+    Las bases cuyo esquema registrado ya está en la última versión se omiten,
+    así un proceso nuevo no repite el DDL en cada arranque.
+    """
+    conn = shards.conectar_directorio()
+    if version_esquema(conn, 'directorio') < len(MIGRACIONES_DIRECTORIO):
+        conn.execute("PRAGMA journal_mode=WAL")
+        migrar(conn, 'directorio', MIGRACIONES_DIRECTORIO)
     conn.close()
     
+    # Tabla de tareas en cada shard
+    for ruta in shards.shards:
+        conn = particionado.conectar(ruta)
+        if version_esquema(conn, 'tareas') == len(MIGRACIONES_TAREAS):
+            conn.close()
+            continue
+        
+        cursor = conn.cursor()
+        # VACUUM incremental para devolver el espacio que libera el archivado
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tareas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER,
+                titulo TEXT NOT NULL,
+                descripcion TEXT,
+                completada BOOLEAN DEFAULT FALSE,
+                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+            )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tareas_usuario ON tareas (usuario_id)"
+        )
+        conn.commit()
+        
+        migrar(conn, 'tareas', MIGRACIONES_TAREAS)
+        
+        # Archivos creados antes del archivado: activar auto_vacuum requiere un VACUUM
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            cursor.execute("VACUUM")
+        conn.close()
+    
+    shards.sembrar_secuencia()
+    archivador.init_archivo()
+
+def preparar():
+    """Deja el proceso listo para atender: esquema verificado y plantillas compiladas"""
+    with lock_arranque:
+        if arranque['listo']:
+            return
+        arranque['iniciado'] = True
+        etapas = {}
+        
+        try:
+            inicio = time.perf_counter()
+            init_db()
+            etapas['init_db'] = time.perf_counter() - inicio
+            
+            inicio = time.perf_counter()
+            for nombre in app.jinja_loader.list_templates():
+                app.jinja_env.get_template(nombre)
+            etapas['plantillas'] = time.perf_counter() - inicio
+        except Exception as e:
+            # El error se informa en /readyz y el próximo intento vuelve a empezar
+            arranque.update(iniciado=False, error=f'{type(e).__name__}: {e}')
+            raise
+        
+        arranque['etapas'] = {nombre: round(s * 1000, 2) for nombre, s in etapas.items()}
+        arranque['segundos_hasta_listo'] = round(time.perf_counter() - INICIO_PROCESO, 3)
+        arranque.update(listo=True, error=None)
+
+def preparar_en_segundo_plano():
+    """Ejecuta preparar() en el hilo lanzado por /readyz, registrando el error si falla"""
+    try:
+        preparar()
+    except Exception:
+        logger.exception('Falló la preparación del proceso')
+
+@app.before_request
+def asegurar_preparado():
+    """Prepara el proceso en la primera petición si nadie lo hizo antes"""
+    if not arranque['listo'] and request.endpoint not in ('healthz', 'readyz'):
+        preparar()
+
+@app.teardown_request
+def liberar_conexiones(error=None):
+    """Devuelve al pool las conexiones SQLite que usó la petición"""
+    repositorio.liberar()
+
+def hash_password(password):
+    """Hashea una contraseña usando bcrypt"""
+    # bcrypt se importa al primer uso: solo lo necesitan registro y login
+    import bcrypt
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    with pool_hash.ocupar():
+        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+    return hashed.decode('utf-8')
+
+def verify_password(password, hashed):
+    """Verifica una contraseña contra su hash"""
+    import bcrypt
+    with pool_hash.ocupar():
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def usuario_autenticado():
+    """Usuario de la sesión si sigue existiendo y su contraseña no cambió desde el login"""
+    version = session.get('version', 0)
+    usuario = usuarios_cache.obtener(session['usuario_id'])
+    if usuario is not None and usuario.version < version:
+        # Registro en caché anterior a un cambio hecho en otro proceso
+        usuarios_cache.invalidar(usuario.id)
+        usuario = usuarios_cache.obtener(session['usuario_id'])
+    if usuario is None or usuario.version != version:
+        return None
+    return usuario
+
+def nuevo_token():
+    """Genera un token de API: (token completo, prefijo de búsqueda)"""
+    prefijo = secrets.token_hex(6)
+    return f"{PREFIJO_TOKEN}_{prefijo}_{secrets.token_urlsafe(32)}", prefijo
+
+def hash_token(token):
+    """HMAC-SHA256 del token: los tokens son aleatorios, no necesitan bcrypt"""
+    return hmac.new(CLAVE_TOKENS, token.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def usuario_por_token(token):
+    """Usuario dueño de un token de API válido (None si no lo es)"""
+    partes = token.split('_', 2)
+    if len(partes) != 3 or partes[0] != PREFIJO_TOKEN:
+        return None
+    guardado = repositorio.token_por_prefijo(partes[1])
+    if guardado is None or not hmac.compare_digest(guardado.hash, hash_token(token)):
+        return None
+    return usuarios_cache.obtener(guardado.usuario_id)
+
+def require_login(f):
+    """Decorador para requerir autenticación (cookie de sesión o token de API).
+
+    Deja el usuario autenticado en g.usuario.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        autorizacion = request.headers.get('Authorization', '')
+        if autorizacion:
+            esquema, _, token = autorizacion.partition(' ')
+            g.usuario = usuario_por_token(token.strip()) if esquema.lower() == 'bearer' else None
+            if g.usuario is None:
+                return jsonify({'error': 'Token de API inválido'}), 401
+            return f(*args, **kwargs)
+        
+        if 'usuario_id' not in session:
+            return jsonify({'error': 'Debe iniciar sesión primero'}), 401
+        g.usuario = usuario_autenticado()
+        if g.usuario is None:
+            session.clear()
+            return jsonify({'error': 'La sesión ya no es válida, inicie sesión nuevamente'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def require_admin(f):
+    """Decorador para requerir un usuario administrador"""
+    @wraps(f)
+    @require_login
+    def decorated_function(*args, **kwargs):
+        if g.usuario.usuario not in ADMIN_USUARIOS:
+            return jsonify({'error': 'Requiere permisos de administrador'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+def idempotente(f):
+    """Decorador para repetir la respuesta guardada de una petición con Idempotency-Key.
+
+    Va debajo de require_login: el ámbito de la clave es el usuario autenticado.
+    Sin sesión todos los clientes comparten el ámbito 0, así que ahí la clave
+    debe ser un UUID, único sin coordinarse con nadie. Solo se guardan las
+    respuestas sin error del servidor; si la petición falla, el reintento
+    vuelve a ejecutarse.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        clave = request.headers.get('Idempotency-Key')
+        if clave is None:
+            return f(*args, **kwargs)
+        if not clave or len(clave) > 255:
+            return jsonify({'error': 'Idempotency-Key debe tener entre 1 y 255 caracteres'}), 400
+        
+        ambito = g.usuario.id if 'usuario' in g else 0
+        if not ambito and not es_uuid(clave):
+            return jsonify({'error': 'Sin sesión, Idempotency-Key debe ser un UUID'}), 400
+        huella = idempotencia.huella(request.method, request.path, request.get_data())
+        g.cuerpo_leido = True
+        resultado, guardada = idempotencia.reservar(ambito, clave, huella)
+        if resultado == EN_CURSO:
+            respuesta = jsonify({'error': 'Hay una petición con esta Idempotency-Key en curso'})
+            respuesta.status_code = 409
+            respuesta.headers['Retry-After'] = '1'
+            return respuesta
+        if resultado == OTRA_PETICION:
+            return jsonify({'error': 'La Idempotency-Key ya se usó con otra petición'}), 422
+        if guardada is not None:
+            respuesta = app.response_class(guardada.cuerpo, guardada.estado, mimetype=guardada.tipo)
+            respuesta.headers['Idempotent-Replayed'] = 'true'
+            return respuesta
+        
+        try:
+            respuesta = make_response(f(*args, **kwargs))
+        except BaseException:
+            idempotencia.liberar(ambito, clave, huella)
+            raise
+        if respuesta.status_code >= 500:
+            idempotencia.liberar(ambito, clave, huella)
+        else:
+            idempotencia.guardar(ambito, clave, huella, respuesta.status_code,
+                                 respuesta.mimetype, respuesta.get_data())
+        return respuesta
+    return decorated_function
+
+def es_uuid(valor):
+    """Indica si un texto es un UUID (con o sin guiones)"""
+    try:
+        uuid.UUID(valor)
+    except ValueError:
+        return False
+    return True
+
+def bases_de_datos():
+    """Rutas de todos los archivos SQLite primarios (directorio y shards)"""
+    return list(dict.fromkeys([DB_NAME, *shards.shards]))
+
+def optimizar_bases():
+    """Ejecuta PRAGMA optimize para actualizar las estadísticas del planificador de consultas"""
+    for ruta in bases_de_datos():
+        conn = particionado.conectar(ruta)
+        conn.execute("PRAGMA optimize")
+        conn.close()
+
+def checkpoint_wal():
+    """Vuelca el WAL de cada archivo a la base de datos y lo trunca"""
+    for ruta in bases_de_datos():
+        conn = particionado.conectar(ruta)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+
+def registrar_trabajos():
+    """Registra los trabajos de mantenimiento en el planificador"""
+    planificador.cada('checkpoint_wal', checkpoint_wal,
+                      int(os.environ.get('CHECKPOINT_INTERVALO', 300)), jitter=30)
+    planificador.cron('optimizar', optimizar_bases,
+                      os.environ.get('OPTIMIZAR_CRON', '0 */6 * * *'), jitter=60)
+    planificador.cron('archivado', archivador.archivar,
+                      os.environ.get('ARCHIVADO_CRON', '30 3 * * *'), jitter=300)
+    planificador.cada('idempotencia', idempotencia.limpiar,
+                      int(os.environ.get('IDEMPOTENCIA_LIMPIEZA', 3600)), jitter=60)
+    if replicas.habilitada:
+        planificador.cada('replicas', replicas.refrescar, replicas.intervalo,
+                          jitter=replicas.intervalo * 0.1)
+
+@app.route('/')
+def index():
+    """Página de inicio"""
+    # Obtener estadísticas
+    user_count = repositorio.contar_usuarios()
+    
     db_status = "Conectada ✅" if os.path.exists(DB_NAME) else "No encontrada ❌"
     
-    return render_template_string(html_template, 
+    return render_template('inicio.html', 
                                 user_count=user_count, 
                                 db_status=db_status)
 
 @app.route('/registro', methods=['POST'])
+@idempotente
 def registro():
     """Registra un nuevo usuario"""
+    # Fuera del try: un cuerpo demasiado grande debe responder 413, no 500
+    data = request.get_json(silent=True)
     try:
-        data = request.get_json()
-        
         if not data or 'usuario' not in data or 'contraseña' not in data:
             return jsonify({'error': 'Faltan campos obligatorios: usuario y contraseña'}), 400
         
@@ -164,37 +822,24 @@ def registro():
         contraseña_hash = hash_password(contraseña)
         
         # Guardar en la base de datos
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(
-                "INSERT INTO usuarios (usuario, contraseña_hash) VALUES (?, ?)",
-                (usuario, contraseña_hash)
-            )
-            conn.commit()
-            
-            return jsonify({
-                'mensaje': 'Usuario registrado exitosamente',
-                'usuario': usuario,
-                'fecha_registro': datetime.datetime.now().isoformat()
-            }), 201
-            
-        except sqlite3.IntegrityError:
+        if repositorio.crear_usuario(usuario, contraseña_hash) is None:
             return jsonify({'error': 'El usuario ya existe'}), 409
         
-        finally:
-            conn.close()
+        return jsonify({
+            'mensaje': 'Usuario registrado exitosamente',
+            'usuario': usuario,
+            'fecha_registro': datetime.datetime.now().isoformat()
+        }), 201
             
     except Exception as e:
+        logger.exception("Error atendiendo %s", request.path)
         return jsonify({'error': f'Error del servidor: {str(e)}'}), 500
 
 @app.route('/login', methods=['POST'])
 def login():
     """Inicia sesión de usuario"""
+    data = request.get_json(silent=True)
     try:
-        data = request.get_json()
-        
         if not data or 'usuario' not in data or 'contraseña' not in data:
             return jsonify({'error': 'Faltan credenciales'}), 400
         
@@ -202,113 +847,464 @@ def login():
         contraseña = data['contraseña']
         
         # Buscar usuario en la base de datos
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT id, usuario, contraseña_hash FROM usuarios WHERE usuario = ?",
-            (usuario,)
-        )
-        
-        user_data = cursor.fetchone()
-        conn.close()
+        encontrado = repositorio.buscar_usuario(usuario)
         
-        if not user_data:
+        if not encontrado:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
-        user_id, db_usuario, contraseña_hash = user_data
-        
         # Verificar contraseña
-        if not verify_password(contraseña, contraseña_hash):
+        if not verify_password(contraseña, encontrado.contraseña_hash):
             return jsonify({'error': 'Contraseña incorrecta'}), 401
         
         # Crear sesión
-        session['usuario_id'] = user_id
-        session['usuario'] = db_usuario
+        session['usuario_id'] = encontrado.id
+        session['usuario'] = encontrado.usuario
+        session['version'] = encontrado.version
         
         return jsonify({
             'mensaje': 'Inicio de sesión exitoso',
-            'usuario': db_usuario,
+            'usuario': encontrado.usuario,
             'sesion_iniciada': datetime.datetime.now().isoformat()
         }), 200
         
     except Exception as e:
+        logger.exception("Error atendiendo %s", request.path)
         return jsonify({'error': f'Error del servidor: {str(e)}'}), 500
 
 @app.route('/tareas', methods=['GET'])
 @require_login
 def tareas():
     """Muestra página de bienvenida para usuarios autenticados"""
-    usuario_actual = session.get('usuario', 'Usuario')
+    usuario_actual = g.usuario.usuario
     
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Mis Tareas - Sistema de Gestión</title>
-        <style>
-            body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }
-            .container { background: #f4f4f4; padding: 20px; border-radius: 5px; }
-            .welcome { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 5px; margin-bottom: 20px; }
-            .info-box { background: white; padding: 15px; margin: 10px 0; border-radius: 3px; border-left: 4px solid #4CAF50; }
-            .logout-btn { background: #f44336; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin-top: 10px; }
-            .stats { display: flex; gap: 20px; margin: 20px 0; }
-            .stat-card { background: white; padding: 15px; border-radius: 5px; flex: 1; text-align: center; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="welcome">
-                <h1>🎉 ¡Bienvenido {{ usuario }}!</h1>
-                <p>Has iniciado sesión exitosamente en el Sistema de Gestión de Tareas.</p>
-            </div>
-            
-            <div class="info-box">
-                <h3>✅ Autenticación Exitosa</h3>
-                <p>Tu sesión está activa y puedes acceder a todas las funcionalidades del sistema.</p>
-                <p><strong>Usuario:</strong> {{ usuario }}</p>
-                <p><strong>Sesión iniciada:</strong> {{ fecha_actual }}</p>
-            </div>
-            
-            <div class="stats">
-                <div class="stat-card">
-                    <h3>🔐 Seguridad</h3>
-                    <p>Contraseña hasheada con bcrypt</p>
-                </div>
-                <div class="stat-card">
-                    <h3>💾 Base de Datos</h3>
-                    <p>SQLite persistente</p>
-                </div>
-                <div class="stat-card">
-                    <h3>🚀 API REST</h3>
-                    <p>Flask framework</p>
-                </div>
-            </div>
-            
-            <div class="info-box">
-                <h3>🔧 Funcionalidades Implementadas</h3>
-                <ul>
-                    <li>✅ Registro de usuarios con validación</li>
-                    <li>✅ Autenticación segura con hashing</li>
-                    <li>✅ Sesiones de usuario</li>
-                    <li>✅ Base de datos SQLite</li>
-                    <li>✅ API REST endpoints</li>
-                    <li>✅ Páginas HTML responsivas</li>
-                </ul>
-            </div>
-            
-            <a href="/logout" class="logout-btn">🚪 Cerrar Sesión</a>
-        </div>
-    </body>
-    </html>
-    """
+    resumen = repositorio.estadisticas_de(g.usuario.id, dias=1)
     
-    return render_template_string(
-        html_template, 
+    return render_template(
+        'tareas.html', 
         usuario=usuario_actual,
+        estadisticas=resumen,
         fecha_actual=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     )
 
+@app.route('/api/cuenta/contraseña', methods=['POST'])
+@require_login
+@idempotente
+def cambiar_contraseña():
+    """Cambia la contraseña; las demás sesiones del usuario dejan de valer"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'actual' not in data or 'nueva' not in data:
+        return jsonify({'error': 'Faltan los campos actual y nueva'}), 400
+    if len(str(data['nueva'])) < 4:
+        return jsonify({'error': 'La contraseña debe tener al menos 4 caracteres'}), 400
+    if not verify_password(str(data['actual']), g.usuario.contraseña_hash):
+        return jsonify({'error': 'Contraseña incorrecta'}), 401
+    
+    version = repositorio.cambiar_contraseña(g.usuario.id, hash_password(str(data['nueva'])))
+    usuarios_cache.invalidar(g.usuario.id)
+    if version is None:
+        session.clear()
+        return jsonify({'error': 'Usuario no encontrado'}), 404
+    
+    # La sesión actual sigue activa con la nueva versión
+    if 'usuario_id' in session:
+        session['version'] = version
+    return jsonify({'mensaje': 'Contraseña actualizada'}), 200
+
+@app.route('/api/cuenta', methods=['DELETE'])
+@require_login
+@idempotente
+def eliminar_cuenta():
+    """Da de baja al usuario autenticado con todas sus tareas"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'contraseña' not in data:
+        return jsonify({'error': 'Falta la contraseña'}), 400
+    if not verify_password(str(data['contraseña']), g.usuario.contraseña_hash):
+        return jsonify({'error': 'Contraseña incorrecta'}), 401
+    
+    repositorio.eliminar_usuario(g.usuario.id)
+    usuarios_cache.invalidar(g.usuario.id)
+    session.clear()
+    return jsonify({'mensaje': f'Cuenta {g.usuario.usuario} eliminada'}), 200
+
+@app.route('/api/tokens', methods=['POST'])
+@require_login
+def crear_token():
+    """Crea un token de API; el token completo solo se muestra en esta respuesta"""
+    data = request.get_json(silent=True) or {}
+    nombre = str(data.get('nombre', '')).strip()[:100] or None
+    token, prefijo = nuevo_token()
+    repositorio.crear_token(g.usuario.id, prefijo, hash_token(token), nombre)
+    return jsonify({'token': token, 'prefijo': prefijo, 'nombre': nombre}), 201
+
+@app.route('/api/tokens', methods=['GET'])
+@require_login
+def listar_tokens():
+    """Tokens de API del usuario (sin el secreto)"""
+    return jsonify({'tokens': [t._asdict() for t in repositorio.listar_tokens(g.usuario.id)]})
+
+@app.route('/api/tokens/<prefijo>', methods=['DELETE'])
+@require_login
+@idempotente
+def revocar_token(prefijo):
+    """Revoca un token de API propio"""
+    if not repositorio.revocar_token(g.usuario.id, prefijo):
+        return jsonify({'error': 'Token no encontrado'}), 404
+    return jsonify({'mensaje': 'Token revocado', 'prefijo': prefijo})
+
+def tarea_a_dict(tarea):
+    """Convierte una Tarea del repositorio en un diccionario serializable"""
+    return {
+        'id': tarea.id,
+        'titulo': tarea.titulo,
+        'descripcion': tarea.descripcion,
+        'completada': bool(tarea.completada),
+        'fecha_creacion': tarea.fecha_creacion,
+        'fecha_completada': tarea.fecha_completada,
+        'prioridad': tarea.prioridad or 0,
+        'vence': tarea.vence
+    }
+
+def normalizar_etiqueta(nombre):
+    """Nombre canónico de una etiqueta (sin espacios extremos y en minúsculas)"""
+    if not isinstance(nombre, str):
+        raise ErrorTarea('Las etiquetas deben ser textos')
+    nombre = nombre.strip().lower()
+    if not nombre or len(nombre) > MAX_LARGO_ETIQUETA or ',' in nombre:
+        raise ErrorTarea(f'Etiqueta inválida (1 a {MAX_LARGO_ETIQUETA} caracteres, sin comas)')
+    return nombre
+
+def agregar_etiquetas(usuario_id, tareas):
+    """Completa cada tarea (diccionario de la API) con sus nombres de etiqueta"""
+    por_tarea = repositorio.etiquetas_por_tarea(usuario_id)
+    for tarea in tareas:
+        tarea['etiquetas'] = por_tarea.get(tarea['id'], [])
+    return tareas
+
+@app.route('/api/tareas', methods=['GET'])
+@require_login
+def listar_tareas():
+    """Lista las tareas del usuario autenticado.
+    
+    Con ?etiquetas=a,b filtra por etiquetas: modo=todas (por defecto) exige
+    todas, modo=alguna acepta cualquiera.
+    """
+    usuario_id = g.usuario.id
+    
+    try:
+        filtro = [normalizar_etiqueta(e) for e in request.args.get('etiquetas', '').split(',') if e.strip()]
+    except ErrorTarea as e:
+        return jsonify({'error': e.mensaje}), e.status
+    modo = request.args.get('modo', 'todas')
+    if modo not in ('todas', 'alguna'):
+        return jsonify({'error': 'El parámetro modo debe ser "todas" o "alguna"'}), 400
+    
+    if filtro:
+        filas = repositorio.tareas_con_etiquetas(usuario_id, list(dict.fromkeys(filtro)), modo == 'todas')
+    else:
+        filas = repositorio.listar_tareas(usuario_id)
+    lista = agregar_etiquetas(usuario_id, [tarea_a_dict(fila) for fila in filas])
+    
+    # Las tareas archivadas no conservan etiquetas: no se incluyen al filtrar
+    if filtro:
+        return jsonify({'tareas': lista})
+    
+    # Las tareas archivadas solo se consultan si se piden explícitamente
+    if request.args.get('incluir_archivadas', '0').lower() in ('1', 'true', 'si', 'sí'):
+        activas = {tarea['id'] for tarea in lista}
+        for tarea in lista:
+            tarea['archivada'] = False
+        for tarea in repositorio.listar_archivadas(usuario_id):
+            if tarea.id not in activas:
+                lista.append(dict(tarea_a_dict(tarea), archivada=True, etiquetas=[]))
+    
+    return jsonify({'tareas': lista})
+
+@app.route('/api/tareas/siguientes', methods=['GET'])
+@require_login
+def listar_siguientes():
+    """Próximas tareas pendientes del usuario por vencimiento y prioridad"""
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify({'error': 'El parámetro k debe ser un entero'}), 400
+    if not 1 <= k <= MAX_SIGUIENTES:
+        return jsonify({'error': f'El parámetro k debe estar entre 1 y {MAX_SIGUIENTES}'}), 400
+    
+    filas = repositorio.siguientes_tareas(g.usuario.id, k)
+    return jsonify({'tareas': [tarea_a_dict(fila) for fila in filas]})
+
+class ErrorTarea(Exception):
+    """Error de validación o de existencia al operar sobre una tarea"""
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+def validar_tarea(data, parcial=False):
+    """Extrae y normaliza los campos editables de una tarea"""
+    if not isinstance(data, dict):
+        raise ErrorTarea('Cuerpo JSON inválido')
+    
+    campos = {k: data[k] for k in ('titulo', 'descripcion', 'completada', 'prioridad', 'vence')
+              if k in data}
+    if not parcial and not str(campos.get('titulo', '')).strip():
+        raise ErrorTarea('Falta el campo obligatorio: titulo')
+    if not campos:
+        raise ErrorTarea('No hay campos para actualizar')
+    
+    if 'titulo' in campos:
+        campos['titulo'] = str(campos['titulo']).strip()
+        if not campos['titulo']:
+            raise ErrorTarea('El título no puede estar vacío')
+    if 'descripcion' in campos and not isinstance(campos['descripcion'], (str, type(None))):
+        raise ErrorTarea('La descripción debe ser un texto')
+    if 'completada' in campos:
+        campos['completada'] = bool(campos['completada'])
+    if 'prioridad' in campos:
+        prioridad = campos['prioridad']
+        if (not isinstance(prioridad, int) or isinstance(prioridad, bool)
+                or not PRIORIDAD_MINIMA <= prioridad <= PRIORIDAD_MAXIMA):
+            raise ErrorTarea(f'La prioridad debe ser un entero de {PRIORIDAD_MINIMA} a {PRIORIDAD_MAXIMA}')
+    if 'vence' in campos:
+        campos['vence'] = normalizar_vence(campos['vence'])
+    return campos
+
+def normalizar_vence(valor):
+    """Convierte una fecha ISO 8601 al formato UTC de CURRENT_TIMESTAMP.
+
+    Con un único formato la comparación de textos en SQLite (y en el índice)
+    coincide con el orden cronológico.
+    """
+    if valor is None:
+        return None
+    try:
+        fecha = datetime.datetime.fromisoformat(str(valor))
+    except ValueError:
+        raise ErrorTarea('Fecha de vencimiento inválida (usar ISO 8601)')
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return fecha.strftime('%Y-%m-%d %H:%M:%S')
+
+def insertar_tarea(tareas, campos):
+    """Inserta una tarea validada y devuelve su representación"""
+    return tarea_a_dict(tareas.insertar(campos))
+
+def modificar_tarea(tareas, tarea_id, campos):
+    """Actualiza una tarea propia con campos validados"""
+    tarea = tareas.modificar(tarea_id, campos)
+    if tarea is None:
+        raise ErrorTarea('Tarea no encontrada', 404)
+    return tarea_a_dict(tarea)
+
+def borrar_tarea(tareas, tarea_id):
+    """Elimina una tarea propia"""
+    if not tareas.borrar(tarea_id):
+        raise ErrorTarea('Tarea no encontrada', 404)
+    return {'mensaje': 'Tarea eliminada', 'id': tarea_id}
+
+@app.route('/api/tareas', methods=['POST'])
+@require_login
+@idempotente
+def crear_tarea():
+    """Crea una tarea para el usuario autenticado"""
+    data = request.get_json(silent=True)
+    try:
+        campos = validar_tarea(data)
+        with repositorio.tareas_de(g.usuario.id) as tareas:
+            tarea = insertar_tarea(tareas, campos)
+        
+        return jsonify(tarea), 201
+        
+    except ErrorTarea as e:
+        return jsonify({'error': e.mensaje}), e.status
+    except Exception as e:
+        logger.exception("Error atendiendo %s", request.path)
+        return jsonify({'error': f'Error del servidor: {str(e)}'}), 500
+
+@app.route('/api/tareas/<int:tarea_id>', methods=['PATCH'])
+@require_login
+@idempotente
+def actualizar_tarea(tarea_id):
+    """Actualiza título, descripción o estado de una tarea propia"""
+    data = request.get_json(silent=True)
+    try:
+        campos = validar_tarea(data, parcial=True)
+        with repositorio.tareas_de(g.usuario.id) as tareas:
+            tarea = modificar_tarea(tareas, tarea_id, campos)
+        
+        return jsonify(tarea), 200
+        
+    except ErrorTarea as e:
+        return jsonify({'error': e.mensaje}), e.status
+    except Exception as e:
+        logger.exception("Error atendiendo %s", request.path)
+        return jsonify({'error': f'Error del servidor: {str(e)}'}), 500
+
+@app.route('/api/tareas/<int:tarea_id>', methods=['DELETE'])
+@require_login
+@idempotente
+def eliminar_tarea(tarea_id):
+    """Elimina una tarea propia"""
+    try:
+        with repositorio.tareas_de(g.usuario.id) as tareas:
+            resultado = borrar_tarea(tareas, tarea_id)
+    except ErrorTarea as e:
+        return jsonify({'error': e.mensaje}), e.status
+    
+    return jsonify(resultado), 200
+
+# Máximo de operaciones aceptadas en un lote
+MAX_OPERACIONES_LOTE = int(os.environ.get('LOTE_MAX_OPERACIONES', 500))
+
+@app.route('/api/estadisticas', methods=['GET'])
+@require_login
+def ver_estadisticas():
+    """Totales del usuario y tareas creadas/completadas por día (?dias=30)"""
+    try:
+        dias = int(request.args.get('dias', 30))
+    except ValueError:
+        return jsonify({'error': 'El parámetro dias debe ser un entero'}), 400
+    if not 1 <= dias <= MAX_DIAS_ESTADISTICAS:
+        return jsonify({'error': f'El parámetro dias debe estar entre 1 y {MAX_DIAS_ESTADISTICAS}'}), 400
+    
+    return jsonify(repositorio.estadisticas_de(g.usuario.id, dias))
+
+@app.route('/api/etiquetas', methods=['GET'])
+@require_login
+def listar_etiquetas():
+    """Etiquetas del usuario con la cantidad de tareas de cada una"""
+    etiquetas = repositorio.listar_etiquetas(g.usuario.id)
+    return jsonify({'etiquetas': [etiqueta._asdict() for etiqueta in etiquetas]})
+
+@app.route('/api/tareas/etiquetas', methods=['POST'])
+@require_login
+@idempotente
+def etiquetar_tareas():
+    """Agrega y/o quita etiquetas a varias tareas propias en una transacción.
+    
+    Body: {"tareas": [ids], "agregar": [nombres], "quitar": [nombres]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Cuerpo JSON inválido'}), 400
+    
+    tarea_ids = data.get('tareas')
+    agregar = data.get('agregar', [])
+    quitar = data.get('quitar', [])
+    if (not isinstance(tarea_ids, list) or not tarea_ids
+            or not isinstance(agregar, list) or not isinstance(quitar, list)):
+        return jsonify({'error': 'Se requieren "tareas" y listas "agregar" o "quitar"'}), 400
+    if len(tarea_ids) > MAX_OPERACIONES_LOTE:
+        return jsonify({'error': f'Máximo {MAX_OPERACIONES_LOTE} tareas por petición'}), 413
+    try:
+        tarea_ids = list(dict.fromkeys(int(t) for t in tarea_ids))
+        agregar = list(dict.fromkeys(normalizar_etiqueta(e) for e in agregar))
+        quitar = list(dict.fromkeys(normalizar_etiqueta(e) for e in quitar))
+    except ErrorTarea as e:
+        return jsonify({'error': e.mensaje}), e.status
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Id de tarea inválido'}), 400
+    
+    try:
+        with repositorio.tareas_de(g.usuario.id) as tareas:
+            propias, agregadas, quitadas = tareas.etiquetar(tarea_ids, agregar, quitar)
+    except Exception as e:
+        logger.exception("Error atendiendo %s", request.path)
+        return jsonify({'error': f'Error del servidor: {str(e)}'}), 500
+    
+    encontradas = set(propias)
+    return jsonify({
+        'tareas': propias,
+        'no_encontradas': [t for t in tarea_ids if t not in encontradas],
+        'agregadas': agregadas,
+        'quitadas': quitadas
+    }), 200
+
+def flujo_cuerpo():
+    """Flujo del cuerpo de la petición: el de la conexión, o el ya leído (p. ej. por idempotente)"""
+    return io.BytesIO(request.get_data()) if g.get('cuerpo_leido') else request.stream
+
+def operaciones_lote():
+    """Operaciones del cuerpo de un lote, a medida que se leen.
+
+    JSON ({"operaciones": [...]}) y NDJSON (una operación por línea) se leen por
+    bloques sin cargar el cuerpo entero; MessagePack se decodifica completo.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        return leer_ndjson(flujo_cuerpo())
+    if request.mimetype == 'application/json':
+        return leer_arreglo_json(flujo_cuerpo(), 'operaciones')
+    data = request.get_json(silent=True)
+    operaciones = data.get('operaciones') if isinstance(data, dict) else None
+    if not isinstance(operaciones, list):
+        raise ErrorCuerpo('Falta el campo obligatorio: operaciones')
+    return iter(operaciones)
+
+def preparar_operacion(operacion):
+    """Valida una operación del lote: (op, id, campos) o el resultado del error"""
+    try:
+        if not isinstance(operacion, dict):
+            raise ErrorTarea('Operación inválida')
+        tipo = operacion.get('op')
+        
+        if tipo == 'crear':
+            return ('crear', None, validar_tarea(operacion))
+        if tipo == 'actualizar':
+            return ('actualizar', int(operacion.get('id', 0)), validar_tarea(operacion, parcial=True))
+        if tipo == 'eliminar':
+            return ('eliminar', int(operacion.get('id', 0)), operacion.get('id'))
+        raise ErrorTarea(f'Operación desconocida: {tipo}')
+    
+    except ErrorTarea as e:
+        return {'status': e.status, 'error': e.mensaje}
+    except (TypeError, ValueError):
+        return {'status': 400, 'error': 'Id de tarea inválido'}
+
+@app.route('/api/tareas/lote', methods=['POST'])
+@require_login
+@idempotente
+def lote_tareas():
+    """Aplica varias operaciones sobre tareas en una sola transacción.
+    
+    Cada operación es {"op": "crear" | "actualizar" | "eliminar", ...}; el
+    resultado de cada una se informa por separado con su status HTTP. Las
+    operaciones se validan a medida que llega el cuerpo y la transacción se
+    abre al terminar de recibirlo, para que un cliente lento no bloquee el shard.
+    """
+    preparadas = []
+    try:
+        for operacion in operaciones_lote():
+            if len(preparadas) == MAX_OPERACIONES_LOTE:
+                return jsonify({'error': f'Máximo {MAX_OPERACIONES_LOTE} operaciones por lote'}), 413
+            preparadas.append(preparar_operacion(operacion))
+    except ErrorCuerpo as e:
+        return jsonify({'error': str(e)}), 400
+    
+    resultados = []
+    
+    try:
+        with repositorio.tareas_de(g.usuario.id) as tareas:
+            for preparada in preparadas:
+                if isinstance(preparada, dict):
+                    resultados.append(preparada)
+                    continue
+                tipo, tarea_id, campos = preparada
+                try:
+                    if tipo == 'crear':
+                        resultados.append({'status': 201, 'tarea': insertar_tarea(tareas, campos)})
+                    elif tipo == 'actualizar':
+                        resultados.append({'status': 200, 'tarea': modificar_tarea(tareas, tarea_id, campos)})
+                    else:
+                        borrar_tarea(tareas, tarea_id)
+                        resultados.append({'status': 200, 'id': campos})
+                except ErrorTarea as e:
+                    resultados.append({'status': e.status, 'error': e.mensaje})
+    except Exception as e:
+        logger.exception("Error atendiendo %s", request.path)
+        return jsonify({'error': f'Error del servidor: {str(e)}'}), 500
+    
+    return jsonify({'resultados': resultados}), 200
+
 @app.route('/logout', methods=['POST', 'GET'])
 def logout():
     """Cierra la sesión del usuario"""
@@ -323,35 +1319,105 @@ def logout():
 @app.route('/status')
 def status():
     """Endpoint para verificar el estado del sistema"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Contar usuarios
-    cursor.execute("SELECT COUNT(*) FROM usuarios")
-    user_count = cursor.fetchone()[0]
-    
-    # Contar tareas
-    cursor.execute("SELECT COUNT(*) FROM tareas")
-    task_count = cursor.fetchone()[0]
-    
-    conn.close()
-    
     return jsonify({
         'status': 'OK',
         'database': 'SQLite conectada',
-        'usuarios_registrados': user_count,
-        'tareas_totales': task_count,
+        'usuarios_registrados': repositorio.contar_usuarios(),
+        'tareas_totales': repositorio.contar_tareas(),
+        'lectura': 'replica' if repositorio.lectura_en_replica() else 'primaria',
         'timestamp': datetime.datetime.now().isoformat(),
         'version': '1.0'
     })
 
+@app.route('/healthz')
+def healthz():
+    """Sonda de vida: el proceso responde (no toca la base de datos)"""
+    return jsonify({'status': 'vivo'})
+
+def comprobar_disponibilidad():
+    """Comprobaciones de /readyz, reutilizadas durante SONDA_CACHE_SEGUNDOS"""
+    with lock_sonda:
+        if time.monotonic() < sonda['expira']:
+            return sonda['resultado']
+        
+        bases = {ruta: repositorio.comprobar_base(ruta, SONDA_TIEMPO_LIMITE) for ruta in bases_de_datos()}
+        hash_estado = dict(pool_hash.estado(), ok=not pool_hash.saturado())
+        resultado = {
+            'ok': all(b['ok'] for b in bases.values()) and hash_estado['ok'],
+            'bases_de_datos': bases,
+            'hash': hash_estado,
+            'comprobado': datetime.datetime.now().isoformat()
+        }
+        sonda.update(resultado=resultado, expira=time.monotonic() + SONDA_CACHE_SEGUNDOS)
+        return resultado
+
+@app.route('/readyz')
+def readyz():
+    """Sonda de disponibilidad: proceso preparado, base de datos y pool de hash"""
+    if not arranque['listo']:
+        # La preparación arranca en segundo plano con el primer sondeo
+        if not arranque['iniciado']:
+            arranque['iniciado'] = True
+            threading.Thread(target=preparar_en_segundo_plano, name='preparar', daemon=True).start()
+        return jsonify({'listo': False, 'error': arranque['error']}), 503
+    
+    comprobaciones = comprobar_disponibilidad()
+    return jsonify({
+        'listo': comprobaciones['ok'],
+        'segundos_hasta_listo': arranque['segundos_hasta_listo'],
+        'etapas_ms': arranque['etapas'],
+        'comprobaciones': comprobaciones
+    }), 200 if comprobaciones['ok'] else 503
+
+@app.route('/admin/trabajos')
+@require_admin
+def admin_trabajos():
+    """Lista los trabajos de mantenimiento y sus tiempos de ejecución"""
+    return jsonify({
+        'proceso': planificador.propietario,
+        'trabajos': planificador.estado()
+    })
+
+@app.route('/admin/admision')
+@require_admin
+def admin_admision():
+    """Peticiones en curso, admitidas y rechazadas por clase en este proceso"""
+    return jsonify({'proceso': os.getpid(), 'clases': admision.estado()})
+
+@app.route('/admin/sql')
+@require_admin
+def admin_sql():
+    """Estadísticas por sentencia SQL de este proceso y últimas sentencias lentas"""
+    orden = request.args.get('orden', 'total')
+    if orden not in ('total', 'maximo', 'llamadas', 'filas'):
+        return jsonify({'error': 'orden debe ser total, maximo, llamadas o filas'}), 400
+    try:
+        limite = int(request.args.get('limite', 50))
+    except ValueError:
+        return jsonify({'error': 'limite debe ser un entero'}), 400
+    return jsonify(dict(metricas_sql.registro.estado(orden, max(limite, 1)), proceso=os.getpid()))
+
+@app.route('/admin/sql', methods=['DELETE'])
+@require_admin
+def reiniciar_sql():
+    """Descarta las estadísticas SQL acumuladas por este proceso"""
+    metricas_sql.registro.reiniciar()
+    return jsonify({'mensaje': 'Estadísticas SQL reiniciadas'})
+
 if __name__ == '__main__':
-    # Inicializar la base de datos
-    init_db()
-    print("🚀 Iniciando servidor Flask...")
-    print("📄 Base de datos SQLite inicializada")
-    print("🔐 Sistema de autenticación con bcrypt listo")
-    print("🌐 Accede a: http://localhost:5000")
+    # Inicializar la base de datos y compilar las plantillas
+    # Registros JSON escritos desde un hilo propio; el acceso lo registra Bitacora
+    configurar_bitacora(os.environ.get('BITACORA_ARCHIVO'), os.environ.get('BITACORA_NIVEL', 'INFO'))
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    
+    preparar()
+    registrar_trabajos()
+    planificador.iniciar()
+    logger.info("Servidor iniciado", extra={
+        'etapas_ms': arranque['etapas'],
+        'segundos_hasta_listo': arranque['segundos_hasta_listo'],
+        'url': 'http://localhost:5000'
+    })
     
     # Ejecutar la aplicación
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
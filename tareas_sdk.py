@@ -0,0 +1,376 @@
+"""
+SDK de Python para la API del Sistema de Gestión de Tareas
+Cliente HTTP reutilizable (sin interfaz de consola) con pool de conexiones,
+keep-alive, reintentos con backoff exponencial y una variante asyncio
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import msgpack
+except ImportError:  # dependencia opcional, solo para formato='msgpack'
+    msgpack = None
+
+Timeout = Union[float, Tuple[float, float]]
+T = TypeVar('T')
+
+# (conexión, lectura) en segundos
+TIMEOUT_POR_DEFECTO: Timeout = (3.05, 10.0)
+
+MIMETYPE_MSGPACK = 'application/msgpack'
+
+# Estados que indican que el servidor no procesó la petición y puede repetirse
+ESTADOS_REINTENTABLES = (429, 503)
+
+class ErrorAPI(Exception):
+    """Respuesta de error de la API (status HTTP distinto al esperado)"""
+
+    def __init__(self, status: int, mensaje: str, datos: Optional[Dict[str, Any]] = None):
+        super().__init__(f"HTTP {status}: {mensaje}")
+        self.status = status
+        self.mensaje = mensaje
+        self.datos = datos or {}
+
+class ErrorConexion(Exception):
+    """No se pudo contactar al servidor (conexión rechazada o timeout)"""
+
+def crear_sesion(pool: int = 10, reintentos: int = 3, backoff: float = 0.3) -> requests.Session:
+    """Crea una sesión de requests con pool de conexiones y reintentos"""
+    retry = Retry(
+        total=reintentos,
+        connect=reintentos,
+        read=0,
+        status=reintentos,
+        backoff_factor=backoff,
+        status_forcelist=ESTADOS_REINTENTABLES,
+        allowed_methods=None,  # 429/503 se devuelven antes de procesar la petición
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+
+    sesion = requests.Session()
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    sesion.headers.update({
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    })
+    return sesion
+
+class ClienteAPI:
+    """Cliente síncrono de la API de tareas"""
+
+    def __init__(self, base_url: str = "http://localhost:5000",
+                 timeout: Timeout = TIMEOUT_POR_DEFECTO,
+                 reintentos: int = 3, backoff: float = 0.3, pool: int = 10,
+                 sesion: Optional[requests.Session] = None, token: Optional[str] = None,
+                 formato: str = 'json'):
+        if formato not in ('json', 'msgpack'):
+            raise ValueError(f"Formato desconocido: {formato!r}")
+        if formato == 'msgpack' and msgpack is None:
+            raise ValueError("El formato 'msgpack' requiere el paquete msgpack")
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.formato = formato
+        self.session = sesion or crear_sesion(pool=pool, reintentos=reintentos, backoff=backoff)
+        if token:
+            # Con un token de API no hace falta iniciar sesión
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        if formato == 'msgpack':
+            # Más chico y rápido de decodificar que JSON en listas y lotes grandes
+            self.session.headers['Accept'] = f'{MIMETYPE_MSGPACK}, application/json;q=0.5'
+
+    def __enter__(self) -> 'ClienteAPI':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cerrar()
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones del pool"""
+        self.session.close()
+
+    def solicitar(self, metodo: str, ruta: str, *, json: Any = None,
+                  params: Optional[Dict[str, Any]] = None,
+                  esperado: Tuple[int, ...] = (200,),
+                  timeout: Optional[Timeout] = None,
+                  clave_idempotencia: Optional[str] = None) -> requests.Response:
+        """Envía una petición y lanza ErrorAPI si el status no es el esperado.
+
+        Con `clave_idempotencia`, repetir la llamada con la misma clave (p. ej.
+        tras un timeout de lectura) devuelve la respuesta original del servidor
+        sin volver a ejecutar la operación.
+        """
+        headers = {'Idempotency-Key': clave_idempotencia} if clave_idempotencia else {}
+        cuerpo = None
+        if json is not None and self.formato == 'msgpack':
+            cuerpo, json = msgpack.packb(json), None
+            headers['Content-Type'] = MIMETYPE_MSGPACK
+        try:
+            respuesta = self.session.request(
+                metodo, f"{self.base_url}{ruta}", json=json, data=cuerpo, params=params,
+                headers=headers, timeout=timeout if timeout is not None else self.timeout
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise ErrorConexion(str(e)) from e
+
+        if respuesta.status_code not in esperado:
+            datos = self._decodificar(respuesta)
+            mensaje = datos.get('error', respuesta.reason or 'Error desconocido')
+            raise ErrorAPI(respuesta.status_code, mensaje, datos)
+        return respuesta
+
+    @staticmethod
+    def _decodificar(respuesta: requests.Response) -> Dict[str, Any]:
+        """Devuelve el cuerpo JSON (o MessagePack) de una respuesta o un diccionario vacío"""
+        try:
+            if msgpack is not None and respuesta.headers.get('Content-Type', '').startswith(MIMETYPE_MSGPACK):
+                datos = msgpack.unpackb(respuesta.content)
+            else:
+                datos = respuesta.json()
+        except ValueError:
+            return {}
+        return datos if isinstance(datos, dict) else {'datos': datos}
+
+    def _json(self, metodo: str, ruta: str, **kwargs: Any) -> Dict[str, Any]:
+        """Envía una petición y devuelve su cuerpo JSON"""
+        return self._decodificar(self.solicitar(metodo, ruta, **kwargs))
+
+    # Usuarios y sesión
+
+    def registrar(self, usuario: str, contraseña: str, timeout: Optional[Timeout] = None,
+                  clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Registra un usuario nuevo"""
+        return self._json('POST', '/registro', json={'usuario': usuario, 'contraseña': contraseña},
+                          esperado=(201,), timeout=timeout, clave_idempotencia=clave_idempotencia)
+
+    def iniciar_sesion(self, usuario: str, contraseña: str, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Inicia sesión; la cookie queda guardada en la sesión HTTP"""
+        return self._json('POST', '/login', json={'usuario': usuario, 'contraseña': contraseña},
+                          timeout=timeout)
+
+    def cerrar_sesion(self, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Cierra la sesión actual"""
+        return self._json('POST', '/logout', timeout=timeout)
+
+    def crear_token(self, nombre: Optional[str] = None, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Crea un token de API; el campo `token` solo se devuelve esta vez"""
+        return self._json('POST', '/api/tokens', json={'nombre': nombre}, esperado=(201,), timeout=timeout)
+
+    def listar_tokens(self, timeout: Optional[Timeout] = None) -> List[Dict[str, Any]]:
+        """Tokens de API del usuario (sin el secreto)"""
+        return self._json('GET', '/api/tokens', timeout=timeout)['tokens']
+
+    def revocar_token(self, prefijo: str, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Revoca un token de API propio"""
+        return self._json('DELETE', f'/api/tokens/{prefijo}', timeout=timeout)
+
+    def cambiar_contraseña(self, actual: str, nueva: str, timeout: Optional[Timeout] = None,
+                           clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Cambia la contraseña; las demás sesiones del usuario dejan de valer"""
+        return self._json('POST', '/api/cuenta/contraseña', json={'actual': actual, 'nueva': nueva},
+                          timeout=timeout, clave_idempotencia=clave_idempotencia)
+
+    def eliminar_cuenta(self, contraseña: str, timeout: Optional[Timeout] = None,
+                        clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Da de baja al usuario autenticado con todas sus tareas"""
+        return self._json('DELETE', '/api/cuenta', json={'contraseña': contraseña}, timeout=timeout,
+                          clave_idempotencia=clave_idempotencia)
+
+    # Sistema
+
+    def estado(self, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Estado del sistema (/status)"""
+        return self._json('GET', '/status', timeout=timeout)
+
+    def disponible(self, timeout: Optional[Timeout] = None) -> bool:
+        """Indica si el servidor responde"""
+        try:
+            self.estado(timeout=timeout)
+            return True
+        except (ErrorAPI, ErrorConexion):
+            return False
+
+    def pagina_tareas(self, timeout: Optional[Timeout] = None) -> str:
+        """HTML de la página de tareas (requiere sesión)"""
+        return self.solicitar('GET', '/tareas', timeout=timeout).text
+
+    # Tareas
+
+    def listar_tareas(self, incluir_archivadas: bool = False,
+                      etiquetas: Optional[List[str]] = None, modo: str = 'todas',
+                      timeout: Optional[Timeout] = None) -> List[Dict[str, Any]]:
+        """Tareas del usuario autenticado, opcionalmente filtradas por etiquetas.
+
+        modo='todas' exige todas las etiquetas; modo='alguna' acepta cualquiera.
+        """
+        params: Dict[str, Any] = {}
+        if incluir_archivadas:
+            params['incluir_archivadas'] = 1
+        if etiquetas:
+            params.update(etiquetas=','.join(etiquetas), modo=modo)
+        return self._json('GET', '/api/tareas', params=params or None, timeout=timeout)['tareas']
+
+    def listar_etiquetas(self, timeout: Optional[Timeout] = None) -> List[Dict[str, Any]]:
+        """Etiquetas del usuario con la cantidad de tareas de cada una"""
+        return self._json('GET', '/api/etiquetas', timeout=timeout)['etiquetas']
+
+    def etiquetar(self, tareas: List[int], agregar: Optional[List[str]] = None,
+                  quitar: Optional[List[str]] = None,
+                  timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Agrega y/o quita etiquetas a varias tareas en una petición"""
+        return self._json('POST', '/api/tareas/etiquetas',
+                          json={'tareas': tareas, 'agregar': agregar or [], 'quitar': quitar or []},
+                          timeout=timeout)
+
+    def siguientes_tareas(self, k: int = 10, timeout: Optional[Timeout] = None) -> List[Dict[str, Any]]:
+        """Las k tareas pendientes más urgentes (por vencimiento y prioridad)"""
+        return self._json('GET', '/api/tareas/siguientes', params={'k': k}, timeout=timeout)['tareas']
+
+    def crear_tarea(self, titulo: str, descripcion: Optional[str] = None,
+                    prioridad: int = 0, vence: Optional[str] = None,
+                    timeout: Optional[Timeout] = None,
+                    clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Crea una tarea (vence en formato ISO 8601)"""
+        datos = {'titulo': titulo, 'descripcion': descripcion, 'prioridad': prioridad, 'vence': vence}
+        return self._json('POST', '/api/tareas', json=datos, esperado=(201,), timeout=timeout,
+                          clave_idempotencia=clave_idempotencia)
+
+    def actualizar_tarea(self, tarea_id: int, timeout: Optional[Timeout] = None,
+                         **campos: Any) -> Dict[str, Any]:
+        """Actualiza titulo, descripcion, completada, prioridad o vence de una tarea"""
+        return self._json('PATCH', f'/api/tareas/{tarea_id}', json=campos, timeout=timeout)
+
+    def eliminar_tarea(self, tarea_id: int, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        """Elimina una tarea"""
+        return self._json('DELETE', f'/api/tareas/{tarea_id}', timeout=timeout)
+
+    def lote_tareas(self, operaciones: List[Dict[str, Any]],
+                    timeout: Optional[Timeout] = None,
+                    clave_idempotencia: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Aplica varias operaciones (crear/actualizar/eliminar) en una petición"""
+        return self._json('POST', '/api/tareas/lote', json={'operaciones': operaciones},
+                          timeout=timeout, clave_idempotencia=clave_idempotencia)['resultados']
+
+class ClienteAPIAsync:
+    """Variante asyncio del cliente para llamadores con mucha concurrencia.
+
+    Las llamadas se ejecutan en un pool de hilos del mismo tamaño que el pool
+    de conexiones HTTP, de modo que cada hilo reutiliza una conexión keep-alive.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:5000",
+                 timeout: Timeout = TIMEOUT_POR_DEFECTO,
+                 reintentos: int = 3, backoff: float = 0.3, concurrencia: int = 20,
+                 token: Optional[str] = None, formato: str = 'json'):
+        self._cliente = ClienteAPI(base_url, timeout=timeout, reintentos=reintentos,
+                                   backoff=backoff, pool=concurrencia, token=token, formato=formato)
+        self._ejecutor = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix='tareas-sdk')
+
+    async def __aenter__(self) -> 'ClienteAPIAsync':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.cerrar()
+
+    async def cerrar(self) -> None:
+        """Cierra el pool de hilos y las conexiones"""
+        self._ejecutor.shutdown(wait=True)
+        self._cliente.cerrar()
+
+    async def _en_hilo(self, funcion: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Ejecuta una llamada bloqueante del cliente síncrono en el pool de hilos"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ejecutor, functools.partial(funcion, *args, **kwargs))
+
+    async def registrar(self, usuario: str, contraseña: str,
+                        clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Registra un usuario nuevo"""
+        return await self._en_hilo(self._cliente.registrar, usuario, contraseña,
+                                   clave_idempotencia=clave_idempotencia)
+
+    async def iniciar_sesion(self, usuario: str, contraseña: str) -> Dict[str, Any]:
+        """Inicia sesión; la cookie queda guardada en la sesión HTTP"""
+        return await self._en_hilo(self._cliente.iniciar_sesion, usuario, contraseña)
+
+    async def cerrar_sesion(self) -> Dict[str, Any]:
+        """Cierra la sesión actual"""
+        return await self._en_hilo(self._cliente.cerrar_sesion)
+
+    async def crear_token(self, nombre: Optional[str] = None) -> Dict[str, Any]:
+        """Crea un token de API; el campo `token` solo se devuelve esta vez"""
+        return await self._en_hilo(self._cliente.crear_token, nombre)
+
+    async def listar_tokens(self) -> List[Dict[str, Any]]:
+        """Tokens de API del usuario (sin el secreto)"""
+        return await self._en_hilo(self._cliente.listar_tokens)
+
+    async def revocar_token(self, prefijo: str) -> Dict[str, Any]:
+        """Revoca un token de API propio"""
+        return await self._en_hilo(self._cliente.revocar_token, prefijo)
+
+    async def cambiar_contraseña(self, actual: str, nueva: str,
+                                 clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Cambia la contraseña; las demás sesiones del usuario dejan de valer"""
+        return await self._en_hilo(self._cliente.cambiar_contraseña, actual, nueva,
+                                   clave_idempotencia=clave_idempotencia)
+
+    async def eliminar_cuenta(self, contraseña: str,
+                              clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Da de baja al usuario autenticado con todas sus tareas"""
+        return await self._en_hilo(self._cliente.eliminar_cuenta, contraseña,
+                                   clave_idempotencia=clave_idempotencia)
+
+    async def estado(self) -> Dict[str, Any]:
+        """Estado del sistema (/status)"""
+        return await self._en_hilo(self._cliente.estado)
+
+    async def listar_tareas(self, incluir_archivadas: bool = False,
+                            etiquetas: Optional[List[str]] = None,
+                            modo: str = 'todas') -> List[Dict[str, Any]]:
+        """Tareas del usuario autenticado, opcionalmente filtradas por etiquetas"""
+        return await self._en_hilo(self._cliente.listar_tareas, incluir_archivadas, etiquetas, modo)
+
+    async def listar_etiquetas(self) -> List[Dict[str, Any]]:
+        """Etiquetas del usuario con la cantidad de tareas de cada una"""
+        return await self._en_hilo(self._cliente.listar_etiquetas)
+
+    async def etiquetar(self, tareas: List[int], agregar: Optional[List[str]] = None,
+                        quitar: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Agrega y/o quita etiquetas a varias tareas en una petición"""
+        return await self._en_hilo(self._cliente.etiquetar, tareas, agregar, quitar)
+
+    async def siguientes_tareas(self, k: int = 10) -> List[Dict[str, Any]]:
+        """Las k tareas pendientes más urgentes (por vencimiento y prioridad)"""
+        return await self._en_hilo(self._cliente.siguientes_tareas, k)
+
+    async def crear_tarea(self, titulo: str, descripcion: Optional[str] = None,
+                          prioridad: int = 0, vence: Optional[str] = None,
+                          clave_idempotencia: Optional[str] = None) -> Dict[str, Any]:
+        """Crea una tarea (vence en formato ISO 8601)"""
+        return await self._en_hilo(self._cliente.crear_tarea, titulo, descripcion, prioridad, vence,
+                                   clave_idempotencia=clave_idempotencia)
+
+    async def actualizar_tarea(self, tarea_id: int, **campos: Any) -> Dict[str, Any]:
+        """Actualiza titulo, descripcion, completada, prioridad o vence de una tarea"""
+        return await self._en_hilo(self._cliente.actualizar_tarea, tarea_id, **campos)
+
+    async def eliminar_tarea(self, tarea_id: int) -> Dict[str, Any]:
+        """Elimina una tarea"""
+        return await self._en_hilo(self._cliente.eliminar_tarea, tarea_id)
+
+    async def lote_tareas(self, operaciones: List[Dict[str, Any]],
+                          clave_idempotencia: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Aplica varias operaciones (crear/actualizar/eliminar) en una petición"""
+        return await self._en_hilo(self._cliente.lote_tareas, operaciones,
+                                   clave_idempotencia=clave_idempotencia)
@@ -1,328 +1,1007 @@
 #!/usr/bin/env python3
 """
-Script de pruebas automatizadas para el Sistema de Gestión de Tareas
-Ejecuta una serie de tests para verificar el funcionamiento de la API
+Pruebas automatizadas para el Sistema de Gestión de Tareas
+Se ejecutan en proceso con el cliente de pruebas de Flask, sin servidor:
+
+    pytest -q            # secuencial
+    pytest -q -n auto    # en paralelo (pytest-xdist)
 """
 
-import requests
+import asyncio
+import datetime
+import gzip
+import io
 import json
-import time
+import logging
+import socket
+import sqlite3
 import sys
-from typing import Dict, Any
-
-class TestAPI:
-    def __init__(self, base_url: str = "http://localhost:5000"):
-        self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        self.session.headers.update({'Content-Type': 'application/json'})
-        self.test_user = f"testuser_{int(time.time())}"  # Usuario único
-        self.test_password = "test1234"
-        self.tests_passed = 0
-        self.tests_failed = 0
-    
-    def log_test(self, test_name: str, success: bool, message: str = ""):
-        """Registra el resultado de un test"""
-        status = "✅ PASS" if success else "❌ FAIL"
-        print(f"{status} {test_name}")
-        if message:
-            print(f"    └─ {message}")
-        
-        if success:
-            self.tests_passed += 1
-        else:
-            self.tests_failed += 1
-    
-    def test_server_status(self) -> bool:
-        """Test 1: Verificar que el servidor esté disponible"""
-        try:
-            response = self.session.get(f"{self.base_url}/status")
-            success = response.status_code == 200
-            
-            if success:
-                data = response.json()
-                message = f"Status: {data.get('status', 'Unknown')}, DB: {data.get('database', 'Unknown')}"
-            else:
-                message = f"HTTP {response.status_code}"
-            
-            self.log_test("Servidor disponible", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Servidor disponible", False, f"Error de conexión: {e}")
-            return False
-    
-    def test_user_registration(self) -> bool:
-        """Test 2: Registro de usuario exitoso"""
-        data = {
-            "usuario": self.test_user,
-            "contraseña": self.test_password
-        }
-        
-        try:
-            response = self.session.post(f"{self.base_url}/registro", json=data)
-            success = response.status_code == 201
-            
-            if success:
-                result = response.json()
-                message = f"Usuario '{result.get('usuario')}' registrado"
-            else:
-                error_data = response.json() if response.headers.get('content-type') == 'application/json' else {}
-                message = f"HTTP {response.status_code}: {error_data.get('error', 'Error desconocido')}"
-            
-            self.log_test("Registro de usuario", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Registro de usuario", False, f"Error: {e}")
-            return False
-    
-    def test_duplicate_registration(self) -> bool:
-        """Test 3: Verificar que no se permitan usuarios duplicados"""
-        data = {
-            "usuario": self.test_user,
-            "contraseña": "different_password"
-        }
-        
-        try:
-            response = self.session.post(f"{self.base_url}/registro", json=data)
-            success = response.status_code == 409  # Esperamos conflict
-            
-            if success:
-                message = "Duplicado correctamente rechazado"
-            else:
-                message = f"HTTP {response.status_code} (se esperaba 409)"
-            
-            self.log_test("Prevención de usuarios duplicados", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Prevención de usuarios duplicados", False, f"Error: {e}")
-            return False
-    
-    def test_invalid_registration(self) -> bool:
-        """Test 4: Verificar validación en registro"""
-        invalid_cases = [
-            ({"usuario": "ab", "contraseña": "1234"}, "Usuario muy corto"),
-            ({"usuario": "validuser", "contraseña": "123"}, "Contraseña muy corta"),
-            ({"usuario": "", "contraseña": "1234"}, "Usuario vacío"),
-            ({"contraseña": "1234"}, "Campo usuario faltante"),
-            ({"usuario": "validuser"}, "Campo contraseña faltante")
-        ]
-        
-        all_passed = True
-        
-        for data, description in invalid_cases:
-            try:
-                response = self.session.post(f"{self.base_url}/registro", json=data)
-                success = response.status_code == 400  # Esperamos bad request
-                
-                if not success:
-                    all_passed = False
-                    self.log_test(f"Validación: {description}", False, f"HTTP {response.status_code} (se esperaba 400)")
-                
-            except Exception as e:
-                all_passed = False
-                self.log_test(f"Validación: {description}", False, f"Error: {e}")
-        
-        if all_passed:
-            self.log_test("Validaciones de registro", True, "Todas las validaciones correctas")
-        
-        return all_passed
-    
-    def test_login_success(self) -> bool:
-        """Test 5: Login exitoso"""
-        data = {
-            "usuario": self.test_user,
-            "contraseña": self.test_password
-        }
-        
-        try:
-            response = self.session.post(f"{self.base_url}/login", json=data)
-            success = response.status_code == 200
-            
-            if success:
-                result = response.json()
-                message = f"Login exitoso para '{result.get('usuario')}'"
-            else:
-                error_data = response.json() if response.headers.get('content-type') == 'application/json' else {}
-                message = f"HTTP {response.status_code}: {error_data.get('error', 'Error desconocido')}"
-            
-            self.log_test("Login exitoso", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Login exitoso", False, f"Error: {e}")
-            return False
-    
-    def test_login_invalid_credentials(self) -> bool:
-        """Test 6: Login con credenciales incorrectas"""
-        invalid_cases = [
-            ({"usuario": self.test_user, "contraseña": "wrongpass"}, 401, "Contraseña incorrecta"),
-            ({"usuario": "nonexistentuser", "contraseña": self.test_password}, 404, "Usuario inexistente"),
-            ({"usuario": self.test_user}, 400, "Campo contraseña faltante"),
-            ({"contraseña": self.test_password}, 400, "Campo usuario faltante")
-        ]
-        
-        all_passed = True
-        
-        for data, expected_status, description in invalid_cases:
-            try:
-                response = self.session.post(f"{self.base_url}/login", json=data)
-                success = response.status_code == expected_status
-                
-                if success:
-                    self.log_test(f"Login inválido: {description}", True, f"Correctamente rechazado (HTTP {expected_status})")
-                else:
-                    all_passed = False
-                    self.log_test(f"Login inválido: {description}", False, f"HTTP {response.status_code} (se esperaba {expected_status})")
-                
-            except Exception as e:
-                all_passed = False
-                self.log_test(f"Login inválido: {description}", False, f"Error: {e}")
-        
-        return all_passed
-    
-    def test_protected_endpoint_without_auth(self) -> bool:
-        """Test 7: Acceso a endpoint protegido sin autenticación"""
-        # Crear una nueva sesión sin autenticación
-        new_session = requests.Session()
-        
-        try:
-            response = new_session.get(f"{self.base_url}/tareas")
-            success = response.status_code == 401  # Esperamos unauthorized
-            
-            if success:
-                message = "Acceso correctamente denegado"
-            else:
-                message = f"HTTP {response.status_code} (se esperaba 401)"
-            
-            self.log_test("Protección sin autenticación", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Protección sin autenticación", False, f"Error: {e}")
-            return False
-    
-    def test_protected_endpoint_with_auth(self) -> bool:
-        """Test 8: Acceso a endpoint protegido con autenticación"""
+import threading
+import time
+
+import pytest
+
+import servidor
+import bitacora
+import metricas_sql
+from benchmarks import comparar
+from cache_cliente import CacheCliente
+from cliente import ModoScript
+from planificador import Cron
+from tareas_sdk import ClienteAPI, ClienteAPIAsync, ErrorAPI, ErrorConexion
+
+def crear_tarea(cliente, titulo="Tarea de prueba", **extra):
+    """Crea una tarea y devuelve su representación"""
+    respuesta = cliente.post('/api/tareas', json=dict(extra, titulo=titulo))
+    assert respuesta.status_code == 201
+    return respuesta.get_json()
+
+# Estado del sistema
+
+def test_server_status(cliente):
+    """Test 1: El endpoint de estado responde"""
+    respuesta = cliente.get('/status')
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    assert datos['status'] == 'OK'
+    assert datos['usuarios_registrados'] == 0
+
+# Registro
+
+def test_user_registration(cliente):
+    """Test 2: Registro de usuario exitoso"""
+    respuesta = cliente.post('/registro', json={"usuario": "nuevo", "contraseña": "1234"})
+    assert respuesta.status_code == 201
+    assert respuesta.get_json()['usuario'] == "nuevo"
+
+def test_duplicate_registration(cliente, usuario):
+    """Test 3: No se permiten usuarios duplicados"""
+    respuesta = cliente.post('/registro', json=dict(usuario, contraseña="otra_clave"))
+    assert respuesta.status_code == 409
+
+@pytest.mark.parametrize("datos", [
+    {"usuario": "ab", "contraseña": "1234"},
+    {"usuario": "validuser", "contraseña": "123"},
+    {"usuario": "", "contraseña": "1234"},
+    {"contraseña": "1234"},
+    {"usuario": "validuser"},
+], ids=["usuario-corto", "contraseña-corta", "usuario-vacio", "sin-usuario", "sin-contraseña"])
+def test_invalid_registration(cliente, datos):
+    """Test 4: Validación de los datos de registro"""
+    assert cliente.post('/registro', json=datos).status_code == 400
+
+# Login
+
+def test_login_success(cliente, usuario):
+    """Test 5: Login exitoso"""
+    respuesta = cliente.post('/login', json=usuario)
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['usuario'] == usuario['usuario']
+
+@pytest.mark.parametrize("datos, esperado", [
+    ({"usuario": "testuser", "contraseña": "wrongpass"}, 401),
+    ({"usuario": "nonexistentuser", "contraseña": "test1234"}, 404),
+    ({"usuario": "testuser"}, 400),
+    ({"contraseña": "test1234"}, 400),
+], ids=["contraseña-incorrecta", "usuario-inexistente", "sin-contraseña", "sin-usuario"])
+def test_login_invalid_credentials(cliente, usuario, datos, esperado):
+    """Test 6: Login con credenciales incorrectas"""
+    assert cliente.post('/login', json=datos).status_code == esperado
+
+# Sesión
+
+def test_protected_endpoint_without_auth(cliente):
+    """Test 7: Acceso a endpoint protegido sin autenticación"""
+    assert cliente.get('/tareas').status_code == 401
+
+def test_protected_endpoint_with_auth(sesion):
+    """Test 8: Acceso a endpoint protegido con autenticación"""
+    respuesta = sesion.get('/tareas')
+    assert respuesta.status_code == 200
+    assert b'testuser' in respuesta.data
+
+def test_logout(sesion):
+    """Test 9: Logout de usuario"""
+    respuesta = sesion.post('/logout')
+    assert respuesta.status_code == 200
+    assert 'testuser' in respuesta.get_json()['mensaje']
+
+def test_access_after_logout(sesion):
+    """Test 10: No se puede acceder después del logout"""
+    sesion.post('/logout')
+    assert sesion.get('/tareas').status_code == 401
+
+def test_authenticated_requests_skip_user_queries(sesion, monkeypatch):
+    """Con la caché caliente, las peticiones autenticadas no consultan usuarios"""
+    monkeypatch.setattr(servidor.usuarios_cache, 'intervalo_sello', 60)
+    sesion.get('/api/tareas')
+    metricas_sql.registro.reiniciar()
+    for _ in range(3):
+        assert sesion.get('/api/tareas').status_code == 200
+    sentencias = [s['sentencia'] for s in metricas_sql.registro.estado()['sentencias']]
+    assert not any('usuarios' in sentencia for sentencia in sentencias)
+
+def test_password_change_invalidates_other_sessions(app, sesion, usuario):
+    """Cambiar la contraseña mantiene la sesión actual y cierra las demás"""
+    otra = app.test_client()
+    otra.post('/login', json=usuario)
+    assert otra.get('/api/tareas').status_code == 200
+
+    assert sesion.post('/api/cuenta/contraseña', json={"actual": "x", "nueva": "nueva123"}).status_code == 401
+    cambio = {"actual": "test1234", "nueva": "nueva123"}
+    clave = {'Idempotency-Key': 'cambio-1'}
+    respuesta = sesion.post('/api/cuenta/contraseña', json=cambio, headers=clave)
+    assert respuesta.status_code == 200
+    # El reintento con la misma clave repite la respuesta aunque "actual" ya no valga
+    repetida = sesion.post('/api/cuenta/contraseña', json=cambio, headers=clave)
+    assert repetida.status_code == 200 and repetida.headers.get('Idempotent-Replayed') == 'true'
+    assert sesion.get('/api/tareas').status_code == 200
+    assert otra.get('/api/tareas').status_code == 401
+    assert otra.post('/login', json=usuario).status_code == 401
+    assert otra.post('/login', json={"usuario": "testuser", "contraseña": "nueva123"}).status_code == 200
+
+def test_version_stamp_invalidates_cache_across_processes(sesion, monkeypatch):
+    """Un cambio hecho por otro proceso se detecta con el sello de versión"""
+    monkeypatch.setattr(servidor.usuarios_cache, 'intervalo_sello', 0)
+    assert sesion.get('/api/tareas').status_code == 200
+    conn = sqlite3.connect(servidor.DB_NAME)
+    conn.execute("UPDATE usuarios SET version = version + 1")
+    conn.execute("UPDATE secuencias SET valor = valor + 1 WHERE nombre = 'version_usuarios'")
+    conn.commit()
+    conn.close()
+
+    assert sesion.get('/api/tareas').status_code == 401
+
+def test_delete_account(sesion, usuario):
+    """La baja borra al usuario y sus tareas"""
+    crear_tarea(sesion, "Se va")
+    assert sesion.delete('/api/cuenta', json={"contraseña": "otra"}).status_code == 401
+    assert sesion.delete('/api/cuenta', json={"contraseña": "test1234"}).status_code == 200
+    assert sesion.get('/api/tareas').status_code == 401
+    assert sesion.post('/login', json=usuario).status_code == 404
+
+    conn = sqlite3.connect(servidor.DB_NAME)
+    assert conn.execute("SELECT COUNT(*) FROM tareas").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM estadisticas_usuario").fetchone()[0] == 0
+    conn.close()
+
+def test_api_tokens(app, sesion, monkeypatch):
+    """Los tokens de API autentican sin cookie y sin pasar por bcrypt"""
+    creado = sesion.post('/api/tokens', json={"nombre": "integración"})
+    assert creado.status_code == 201
+    token = creado.get_json()['token']
+    crear_tarea(sesion, "Desde la sesión")
+
+    def sin_bcrypt(*args):
+        raise AssertionError("los tokens no deben usar bcrypt")
+    monkeypatch.setattr(servidor, 'verify_password', sin_bcrypt)
+    monkeypatch.setattr(servidor, 'hash_password', sin_bcrypt)
+
+    maquina = app.test_client()
+    cabecera = {'Authorization': f'Bearer {token}'}
+    tareas = maquina.get('/api/tareas', headers=cabecera).get_json()['tareas']
+    assert [t['titulo'] for t in tareas] == ["Desde la sesión"]
+    assert maquina.get('/api/tareas', headers={'Authorization': f'Bearer {token}x'}).status_code == 401
+    assert maquina.get('/api/tareas', headers={'Authorization': 'Bearer tgt_nada_x'}).status_code == 401
+
+    listados = sesion.get('/api/tokens').get_json()['tokens']
+    assert [t['nombre'] for t in listados] == ["integración"] and 'hash' not in listados[0]
+    assert sesion.delete(f"/api/tokens/{listados[0]['prefijo']}").status_code == 200
+    assert maquina.get('/api/tareas', headers=cabecera).status_code == 401
+
+# Tareas
+
+def test_task_crud(sesion):
+    """Crear, listar, completar y eliminar una tarea"""
+    tarea = crear_tarea(sesion, "Comprar pan", descripcion="integral")
+    assert tarea['completada'] is False
+
+    respuesta = sesion.patch(f"/api/tareas/{tarea['id']}", json={"completada": True})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['fecha_completada'] is not None
+
+    tareas = sesion.get('/api/tareas').get_json()['tareas']
+    assert [t['titulo'] for t in tareas] == ["Comprar pan"]
+
+    assert sesion.delete(f"/api/tareas/{tarea['id']}").status_code == 200
+    assert sesion.delete(f"/api/tareas/{tarea['id']}").status_code == 404
+    assert sesion.post('/api/tareas', json={"titulo": "  "}).status_code == 400
+
+def test_tasks_are_private(cliente, sesion):
+    """Un usuario no ve ni modifica tareas ajenas"""
+    tarea = crear_tarea(sesion)
+    sesion.post('/logout')
+
+    cliente.post('/registro', json={"usuario": "otro", "contraseña": "1234"})
+    cliente.post('/login', json={"usuario": "otro", "contraseña": "1234"})
+    assert cliente.get('/api/tareas').get_json()['tareas'] == []
+    assert cliente.patch(f"/api/tareas/{tarea['id']}", json={"titulo": "x"}).status_code == 404
+
+def test_repository_reuses_connections(sesion):
+    """El repositorio reutiliza la conexión del hilo y devuelve filas con nombre"""
+    repositorio = servidor.repositorio
+    tarea_id = crear_tarea(sesion, "Reutilizada")['id']
+    usuario_id = repositorio.buscar_usuario("testuser").id
+    conn = repositorio.conexion(servidor.DB_NAME)
+
+    tareas = repositorio.listar_tareas(usuario_id)
+    assert [(t.id, t.titulo) for t in tareas] == [(tarea_id, "Reutilizada")]
+    assert repositorio.conexion(servidor.DB_NAME) is conn
+    assert not conn.in_transaction
+
+def test_repository_pool_reused_across_request_threads(url_servidor, usuario):
+    """Con un hilo por petición, las conexiones vuelven al pool y la siguiente las reutiliza"""
+    with ClienteAPI(url_servidor) as api:
+        api.iniciar_sesion(**usuario)
+        api.crear_tarea("Primera")
+        abiertas = servidor.repositorio.estado()['abiertas']
+        for i in range(5):
+            api.crear_tarea(f"Tarea {i}")
+            assert len(api.listar_tareas()) == i + 2
+    estado = servidor.repositorio.estado()
+    assert estado['abiertas'] == abiertas
+    assert estado['libres'][servidor.DB_NAME] >= 1
+
+def test_repository_routes_users_to_pinned_shard(tmp_path, app):
+    """Con varios shards, la ubicación fijada en el directorio decide el shard del usuario"""
+    shards = [str(tmp_path / 'tareas.db'), str(tmp_path / 'shard_b.db')]
+    servidor.configurar_bd(shards[0], rutas_shards=shards, ruta_archivo=str(tmp_path / 'archivo.db'))
+    servidor.preparar()
+    repositorio = servidor.repositorio
+    usuario_id = repositorio.crear_usuario("fijado", "hash")
+    otro = next(s for s in shards if s != servidor.shards.shard_segun_anillo(usuario_id))
+    with repositorio.transaccion(shards[0]) as conn:
+        conn.execute("INSERT INTO ubicaciones (usuario_id, shard) VALUES (?, ?)", (usuario_id, otro))
+
+    abiertas = repositorio.estado()['abiertas']
+    assert repositorio.shard_de(usuario_id) == otro
+    assert repositorio.estado()['abiertas'] == abiertas
+
+def test_task_batch(sesion):
+    """El lote aplica varias operaciones e informa un status por cada una"""
+    existente = crear_tarea(sesion)
+    respuesta = sesion.post('/api/tareas/lote', json={"operaciones": [
+        {"op": "crear", "titulo": "Nueva"},
+        {"op": "actualizar", "id": existente['id'], "completada": True},
+        {"op": "eliminar", "id": 999999},
+        {"op": "desconocida"},
+        {"op": "crear", "titulo": "Descripción inválida", "descripcion": ["no", "texto"]},
+    ]})
+    assert respuesta.status_code == 200
+    assert [r['status'] for r in respuesta.get_json()['resultados']] == [201, 200, 404, 400, 400]
+    assert len(sesion.get('/api/tareas').get_json()['tareas']) == 2
+
+def test_idempotency_key_replays_stored_response(cliente, sesion, monkeypatch):
+    """Un reintento con la misma Idempotency-Key recibe la respuesta guardada sin repetir la operación"""
+    clave = {'Idempotency-Key': 'crear-1'}
+    primera = sesion.post('/api/tareas', json={"titulo": "Una vez"}, headers=clave)
+    repetida = sesion.post('/api/tareas', json={"titulo": "Una vez"}, headers=clave)
+    assert repetida.status_code == 201 and repetida.headers['Idempotent-Replayed'] == 'true'
+    assert repetida.get_json() == primera.get_json()
+    assert len(sesion.get('/api/tareas').get_json()['tareas']) == 1
+    assert sesion.post('/api/tareas', json={"titulo": "Otra"}, headers=clave).status_code == 422
+
+    # Sin sesión el ámbito es común y la clave debe ser un UUID; el reintento no
+    # vuelve a calcular bcrypt
+    hashes = []
+    monkeypatch.setattr(servidor, 'hash_password', lambda p: hashes.append(p) or 'x')
+    datos = {"usuario": "movil", "contraseña": "1234"}
+    assert cliente.post('/registro', json=datos, headers={'Idempotency-Key': 'alta'}).status_code == 400
+    alta = {'Idempotency-Key': '0b0b8c8e-3f6a-4a7e-9a53-5c1d2f4e6a70'}
+    for _ in range(2):
+        assert cliente.post('/registro', json=datos, headers=alta).status_code == 201
+    assert len(hashes) == 1
+
+    # Las respuestas vencidas se borran y la clave vuelve a ejecutarse
+    monkeypatch.setattr(servidor.idempotencia, 'ttl', -1)
+    sesion.post('/api/tareas', json={"titulo": "Vence"}, headers={'Idempotency-Key': 'v'})
+    assert servidor.idempotencia.limpiar() == 1
+    sesion.post('/api/tareas', json={"titulo": "Vence"}, headers={'Idempotency-Key': 'v'})
+    assert len(sesion.get('/api/tareas').get_json()['tareas']) == 3
+
+def test_body_limits_and_streamed_batch(cliente, sesion):
+    """Los cuerpos grandes se rechazan con 413 y el lote se lee por bloques (JSON o NDJSON)"""
+    grande = {"usuario": "x" * 5000, "contraseña": "1234"}
+    respuesta = cliente.post('/registro', json=grande)
+    assert respuesta.status_code == 413 and 'error' in respuesta.get_json()
+
+    # Sin Content-Length (chunked), el límite se aplica al leer
+    cuerpo = io.BytesIO(json.dumps(grande).encode())
+    respuesta = cliente.post('/login', input_stream=cuerpo, content_type='application/json',
+                             environ_overrides={'wsgi.input_terminated': True})
+    assert respuesta.status_code == 413
+
+    ndjson = b'{"op": "crear", "titulo": "Uno"}\n\n{"op": "crear", "titulo": "Dos"}\n'
+    respuesta = sesion.post('/api/tareas/lote', data=ndjson, content_type='application/x-ndjson')
+    assert [r['status'] for r in respuesta.get_json()['resultados']] == [201, 201]
+
+    # Un cuerpo cortado no aplica ninguna operación
+    respuesta = sesion.post('/api/tareas/lote', data=b'{"operaciones": [{"op": "crear", "titulo": "Tres"},',
+                            content_type='application/json')
+    assert respuesta.status_code == 400
+    assert len(sesion.get('/api/tareas').get_json()['tareas']) == 2
+
+def test_next_tasks_order(sesion):
+    """Las siguientes tareas salen por vencimiento, prioridad y luego sin vencimiento"""
+    crear_tarea(sesion, "Sin fecha baja", prioridad=0)
+    crear_tarea(sesion, "Sin fecha urgente", prioridad=3)
+    crear_tarea(sesion, "Vence pronto", vence="2030-01-01")
+    crear_tarea(sesion, "Vence después", vence="2030-02-01T10:00:00+00:00", prioridad=1)
+    crear_tarea(sesion, "Vence pronto urgente", vence="2030-01-01", prioridad=3)
+    hecha = crear_tarea(sesion, "Hecha", vence="2029-01-01")
+    sesion.patch(f"/api/tareas/{hecha['id']}", json={"completada": True})
+
+    tareas = sesion.get('/api/tareas/siguientes?k=4').get_json()['tareas']
+    assert [t['titulo'] for t in tareas] == [
+        "Vence pronto urgente", "Vence pronto", "Vence después", "Sin fecha urgente"
+    ]
+    assert tareas[2]['vence'] == "2030-02-01 10:00:00"
+    assert sesion.get('/api/tareas/siguientes?k=0').status_code == 400
+
+@pytest.mark.parametrize("datos", [
+    {"titulo": "x", "prioridad": 7},
+    {"titulo": "x", "prioridad": "alta"},
+    {"titulo": "x", "vence": "mañana"},
+    {"titulo": "x", "descripcion": {"texto": "y"}},
+], ids=["prioridad-fuera-de-rango", "prioridad-texto", "vence-invalido", "descripcion-objeto"])
+def test_invalid_priority_or_due_date(sesion, datos):
+    """La prioridad y el vencimiento se validan"""
+    assert sesion.post('/api/tareas', json=datos).status_code == 400
+
+def test_next_tasks_use_partial_index(sesion):
+    """Las consultas de siguientes tareas recorren el índice parcial sin ordenar"""
+    conn = sqlite3.connect(servidor.DB_NAME)
+    for sql in ("SELECT id FROM tareas WHERE usuario_id = 1 AND completada = 0 "
+                "AND vence IS NOT NULL ORDER BY vence, prioridad DESC LIMIT 10",
+                "SELECT id FROM tareas WHERE usuario_id = 1 AND completada = 0 "
+                "AND vence IS NULL ORDER BY prioridad DESC LIMIT 10"):
+        plan = ' '.join(fila[3] for fila in conn.execute("EXPLAIN QUERY PLAN " + sql))
+        assert 'idx_tareas_siguientes' in plan
+        assert 'TEMP B-TREE' not in plan
+    conn.close()
+
+# Etiquetas
+
+def etiquetas_de(sesion):
+    """Cantidad de tareas por etiqueta del usuario"""
+    return {e['nombre']: e['cantidad'] for e in sesion.get('/api/etiquetas').get_json()['etiquetas']}
+
+def test_bulk_tagging_and_counts(sesion):
+    """Etiquetar y desetiquetar en bloque mantiene los contadores"""
+    ids = [crear_tarea(sesion, f"Tarea {i}")['id'] for i in range(3)]
+    respuesta = sesion.post('/api/tareas/etiquetas', json={
+        "tareas": ids + [999999], "agregar": ["Trabajo", "urgente"]
+    })
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['agregadas'] == 6
+    assert respuesta.get_json()['no_encontradas'] == [999999]
+    assert etiquetas_de(sesion) == {"trabajo": 3, "urgente": 3}
+
+    sesion.post('/api/tareas/etiquetas', json={"tareas": ids[:2], "quitar": ["urgente"]})
+    sesion.delete(f"/api/tareas/{ids[2]}")
+    assert etiquetas_de(sesion) == {"trabajo": 2, "urgente": 0}
+
+    tareas = sesion.get('/api/tareas').get_json()['tareas']
+    assert [t['etiquetas'] for t in tareas] == [["trabajo"], ["trabajo"]]
+    assert sesion.post('/api/tareas/etiquetas', json={"tareas": ids, "agregar": ["a,b"]}).status_code == 400
+
+def test_tag_filters(sesion):
+    """Filtrado por etiquetas con modo todas (Y) y alguna (O)"""
+    a, b, c = (crear_tarea(sesion, titulo)['id'] for titulo in "ABC")
+    sesion.post('/api/tareas/etiquetas', json={"tareas": [a, b], "agregar": ["casa"]})
+    sesion.post('/api/tareas/etiquetas', json={"tareas": [b, c], "agregar": ["compras"]})
+
+    def titulos(consulta):
+        return [t['titulo'] for t in sesion.get('/api/tareas?' + consulta).get_json()['tareas']]
+
+    assert titulos('etiquetas=casa,compras') == ["B"]
+    assert titulos('etiquetas=casa,compras&modo=alguna') == ["A", "B", "C"]
+    assert titulos('etiquetas=casa,inexistente') == []
+    assert titulos('etiquetas=inexistente&modo=alguna') == []
+    assert sesion.get('/api/tareas?etiquetas=casa&modo=xor').status_code == 400
+
+    conn = sqlite3.connect(servidor.DB_NAME)
+    plan = ' '.join(fila[3] for fila in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM tareas WHERE id IN ("
+        "SELECT tarea_id FROM tarea_etiquetas WHERE etiqueta_id = 1 INTERSECT "
+        "SELECT tarea_id FROM tarea_etiquetas WHERE etiqueta_id = 2) AND usuario_id = 1"))
+    conn.close()
+    assert 'SCAN tarea_etiquetas' not in plan and 'SCAN tareas' not in plan
+
+# Estadísticas
+
+def test_statistics_maintained_incrementally(sesion):
+    """Los agregados siguen cada cambio y coinciden con una reconstrucción completa"""
+    ids = [crear_tarea(sesion, f"Tarea {i}")['id'] for i in range(4)]
+    crear_tarea(sesion, "Ya hecha", completada=True)
+    sesion.patch(f"/api/tareas/{ids[0]}", json={"completada": True})
+    sesion.patch(f"/api/tareas/{ids[1]}", json={"completada": True})
+    sesion.patch(f"/api/tareas/{ids[1]}", json={"completada": False})
+    sesion.patch(f"/api/tareas/{ids[2]}", json={"titulo": "Renombrada"})
+    sesion.delete(f"/api/tareas/{ids[3]}")
+
+    datos = sesion.get('/api/estadisticas').get_json()
+    assert (datos['total'], datos['completadas'], datos['pendientes']) == (4, 2, 2)
+    assert [(d['creadas'], d['completadas']) for d in datos['por_dia']] == [(4, 2)]
+    assert b'<p>4</p>' in sesion.get('/tareas').data
+
+    servidor.estadisticas.reconstruir()
+    assert sesion.get('/api/estadisticas').get_json() == datos
+
+def test_statistics_keep_archived_tasks(sesion):
+    """Archivar o mover de shard no cambia las estadísticas del usuario"""
+    vieja = crear_tarea(sesion, "Vieja")
+    crear_tarea(sesion, "Actual")
+    sesion.patch(f"/api/tareas/{vieja['id']}", json={"completada": True})
+    conn = sqlite3.connect(servidor.DB_NAME)
+    conn.execute("UPDATE tareas SET fecha_completada = datetime('now', '-90 days') WHERE id = ?",
+                 (vieja['id'],))
+    conn.commit()
+    conn.close()
+    antes = sesion.get('/api/estadisticas?dias=365').get_json()
+
+    assert servidor.archivador.archivar() == 1
+    despues = sesion.get('/api/estadisticas?dias=365').get_json()
+    assert despues == dict(antes, archivadas=1)
+    assert (despues['total'], despues['completadas'], despues['pendientes']) == (2, 1, 1)
+
+    servidor.estadisticas.reconstruir()
+    assert sesion.get('/api/estadisticas?dias=365').get_json() == despues
+    assert sesion.get('/api/estadisticas?dias=0').status_code == 400
+
+# Compresión
+
+def test_gzip_compression(cliente):
+    """Las páginas grandes se comprimen cuando el cliente acepta gzip"""
+    plano = cliente.get('/').data
+    respuesta = cliente.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert respuesta.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(respuesta.data) == plano
+    assert 'Accept-Encoding' in respuesta.headers['Vary']
+
+def test_small_responses_not_compressed(cliente):
+    """Las respuestas por debajo del umbral se envían sin comprimir"""
+    respuesta = cliente.get('/status', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in respuesta.headers
+
+def test_msgpack_negotiation(sesion):
+    """Con Accept/Content-Type MessagePack, las rutas leen y responden en ese formato"""
+    msgpack = pytest.importorskip('msgpack')
+    accept = {'Accept': 'application/msgpack'}
+
+    respuesta = sesion.post('/api/tareas/lote', data=msgpack.packb({"operaciones": [
+        {"op": "crear", "titulo": "Binaria"},
+    ]}), content_type='application/msgpack', headers=accept)
+    assert respuesta.mimetype == 'application/msgpack' and 'Accept' in respuesta.headers['Vary']
+    assert [r['status'] for r in msgpack.unpackb(respuesta.data)['resultados']] == [201]
+
+    tareas = msgpack.unpackb(sesion.get('/api/tareas', headers=accept).data)['tareas']
+    assert tareas == sesion.get('/api/tareas').get_json()['tareas']
+    assert sesion.get('/api/tareas', headers={'Accept': '*/*'}).mimetype == 'application/json'
+
+    error = sesion.post('/api/tareas', data=b'\xc1', content_type='application/msgpack', headers=accept)
+    assert error.status_code == 400 and 'error' in msgpack.unpackb(error.data)
+
+# Particionado, réplica y archivado
+
+def test_shard_routing_and_rebalance(tmp_path, cliente, sesion):
+    """Las tareas viven en el shard del usuario y se mueven al rebalancear"""
+    tarea = crear_tarea(sesion)
+    sesion.post('/api/tareas/etiquetas', json={"tareas": [tarea['id']], "agregar": ["movida"]})
+    directorio = servidor.DB_NAME
+    nuevo = str(tmp_path / 'tareas_1.db')
+    usuario_id = 1
+
+    # Fijar, agregar un shard y mover al usuario a un destino explícito
+    servidor.shards.fijar_ubicaciones([directorio, nuevo])
+    servidor.configurar_bd(directorio, rutas_shards=[directorio, nuevo],
+                           ruta_archivo=str(tmp_path / 'tareas_archivo.db'))
+    servidor.init_db()
+    assert servidor.shards.mover_usuario(usuario_id, nuevo) == 1
+
+    assert servidor.shards.shard_de(usuario_id) == nuevo
+    assert sesion.get('/api/tareas').get_json()['tareas'][0]['id'] == tarea['id']
+    assert sesion.get('/status').get_json()['tareas_totales'] == 1
+    assert etiquetas_de(sesion) == {"movida": 1}
+    assert sesion.get('/api/estadisticas').get_json()['total'] == 1
+    assert sesion.get('/api/tareas?etiquetas=movida').get_json()['tareas'][0]['id'] == tarea['id']
+    conn = sqlite3.connect(directorio)
+    assert conn.execute("SELECT COUNT(*) FROM tareas").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM etiquetas").fetchone()[0] == 0
+    conn.close()
+
+def test_interrupted_move_resumes_and_writers_follow(tmp_path, cliente, sesion, monkeypatch):
+    """Un movimiento cortado tras la copia se retoma, y quien escribe sigue al usuario"""
+    crear_tarea(sesion, "Antes")
+    directorio = servidor.DB_NAME
+    nuevo = str(tmp_path / 'tareas_1.db')
+    servidor.shards.fijar_ubicaciones([directorio, nuevo])
+    servidor.configurar_bd(directorio, rutas_shards=[directorio, nuevo],
+                           ruta_archivo=str(tmp_path / 'tareas_archivo.db'))
+    servidor.init_db()
+
+    # Cortar después de copiar al destino: el usuario sigue en el origen
+    def cortar(*args):
+        raise RuntimeError("corte")
+    with monkeypatch.context() as m:
+        m.setattr(servidor.shards, '_ubicar', cortar)
+        with pytest.raises(RuntimeError):
+            servidor.shards.mover_usuario(1, nuevo)
+    assert servidor.shards.shard_de(1) == directorio
+    crear_tarea(sesion, "Durante")
+
+    assert servidor.shards.mover_usuario(1, nuevo) == 2
+    assert servidor.shards.shard_de(1) == nuevo
+    assert sesion.get('/api/estadisticas').get_json()['total'] == 2
+
+    # Un escritor que consultó la ubicación antes del movimiento reintenta en el nuevo shard
+    real = servidor.repositorio.shard_de
+    vistas = iter([directorio])
+    monkeypatch.setattr(servidor.repositorio, 'shard_de', lambda u: next(vistas, None) or real(u))
+    crear_tarea(sesion, "Después")
+    monkeypatch.undo()
+    titulos = [t['titulo'] for t in sesion.get('/api/tareas').get_json()['tareas']]
+    assert titulos == ["Antes", "Durante", "Después"]
+    conn = sqlite3.connect(directorio)
+    assert conn.execute("SELECT COUNT(*) FROM tareas").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM movimientos").fetchone()[0] == 0
+    conn.close()
+
+    # De vuelta, con el directorio como destino
+    assert servidor.shards.mover_usuario(1, directorio) == 3
+    assert len(sesion.get('/api/tareas').get_json()['tareas']) == 3
+    assert sesion.get('/api/estadisticas').get_json()['total'] == 3
+    conn = sqlite3.connect(nuevo)
+    assert conn.execute("SELECT COUNT(*) FROM tareas").fetchone()[0] == 0
+    conn.close()
+
+def test_status_reads_replica(monkeypatch, cliente, usuario):
+    """Con la réplica habilitada, /status lee la copia instantánea"""
+    monkeypatch.setattr(servidor.replicas, 'habilitada', True)
+    servidor.replicas.refrescar()
+    cliente.post('/registro', json={"usuario": "posterior", "contraseña": "1234"})
+
+    datos = cliente.get('/status').get_json()
+    assert datos['lectura'] == 'replica'
+    assert datos['usuarios_registrados'] == 1
+
+def test_concurrent_counts_share_one_query(monkeypatch, cliente, usuario):
+    """Los conteos pedidos a la vez se calculan una sola vez y se comparten"""
+    repositorio = servidor.repositorio
+    liberar = threading.Event()
+    consultas = []
+    contar = repositorio._contar
+
+    def contar_lento(ruta, tabla):
+        consultas.append(tabla)
+        liberar.wait(5)
+        return contar(ruta, tabla)
+
+    monkeypatch.setattr(repositorio, '_contar', contar_lento)
+    previas = repositorio.vuelos.compartidas
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(repositorio.contar_usuarios()))
+             for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    limite = time.monotonic() + 5
+    while repositorio.vuelos.compartidas - previas < 7 and time.monotonic() < limite:
+        time.sleep(0.001)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join()
+
+    assert consultas == ['usuarios'] and resultados == [1] * 8
+    assert cliente.get('/status').get_json()['usuarios_registrados'] == 1
+    assert repositorio.vuelos.estado()['en_curso'] == 0
+
+def test_archived_tasks(sesion):
+    """Las tareas completadas antiguas pasan al archivo y se consultan a pedido"""
+    vieja = crear_tarea(sesion, "Vieja")
+    crear_tarea(sesion, "Actual")
+    sesion.patch(f"/api/tareas/{vieja['id']}", json={"completada": True})
+
+    conn = sqlite3.connect(servidor.DB_NAME)
+    conn.execute("UPDATE tareas SET fecha_completada = datetime('now', '-90 days')")
+    conn.commit()
+    conn.close()
+
+    assert servidor.archivador.archivar() == 1
+    assert [t['titulo'] for t in sesion.get('/api/tareas').get_json()['tareas']] == ["Actual"]
+    todas = sesion.get('/api/tareas?incluir_archivadas=1').get_json()['tareas']
+    assert {t['titulo']: t['archivada'] for t in todas} == {"Actual": False, "Vieja": True}
+
+def test_archiving_returns_free_pages(sesion):
+    """El VACUUM incremental del archivado devuelve las páginas liberadas"""
+    crear_tarea(sesion, "Actual")
+    conn = sqlite3.connect(servidor.DB_NAME)
+    conn.executemany(
+        "INSERT INTO tareas (usuario_id, titulo, descripcion, completada, fecha_completada) "
+        "VALUES (1, ?, ?, 1, datetime('now', '-90 days'))",
+        [(f"Vieja {i}", "x" * 2000) for i in range(300)]
+    )
+    conn.commit()
+
+    assert servidor.archivador.archivar() == 300
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    conn.close()
+
+# Arranque
+
+def test_readyz_reports_warm_process(cliente):
+    """/readyz informa cuándo el proceso terminó de prepararse"""
+    datos = cliente.get('/readyz').get_json()
+    assert datos['listo'] is True
+    assert set(datos['etapas_ms']) == {'init_db', 'plantillas'}
+
+def test_healthz_does_not_touch_database(tmp_path, app):
+    """/healthz responde aunque el proceso no esté preparado"""
+    servidor.configurar_bd(str(tmp_path / 'no_creada.db'))
+    respuesta = app.test_client().get('/healthz')
+    assert respuesta.status_code == 200
+    assert not (tmp_path / 'no_creada.db').exists()
+
+def test_readyz_checks_are_cached(cliente):
+    """Las comprobaciones de /readyz se reutilizan durante el intervalo configurado"""
+    primera = cliente.get('/readyz').get_json()['comprobaciones']
+    segunda = cliente.get('/readyz').get_json()['comprobaciones']
+    assert primera['comprobado'] == segunda['comprobado']
+    assert all(base['ok'] for base in primera['bases_de_datos'].values())
+
+def test_readyz_fails_when_hash_pool_saturated(monkeypatch, cliente):
+    """Con el pool de bcrypt saturado el proceso no acepta más tráfico"""
+    monkeypatch.setattr(servidor, 'SONDA_CACHE_SEGUNDOS', 0)
+    monkeypatch.setattr(servidor.pool_hash, 'esperando', servidor.pool_hash.capacidad)
+    respuesta = cliente.get('/readyz')
+    assert respuesta.status_code == 503
+    assert respuesta.get_json()['comprobaciones']['hash']['ok'] is False
+
+def test_readyz_warms_up_in_background(tmp_path, app):
+    """Un proceso sin preparar responde 503 y se prepara en segundo plano"""
+    servidor.configurar_bd(str(tmp_path / 'otra.db'), rutas_shards=[str(tmp_path / 'otra.db')],
+                           ruta_archivo=str(tmp_path / 'otra_archivo.db'))
+    cliente = app.test_client()
+    assert cliente.get('/readyz').status_code == 503
+
+    limite = time.time() + 5
+    while cliente.get('/readyz').status_code != 200:
+        assert time.time() < limite
+        time.sleep(0.01)
+
+def test_readyz_retries_failed_warm_up(tmp_path, app, monkeypatch, caplog):
+    """Si la preparación falla, /readyz informa el error y el siguiente sondeo la reintenta"""
+    servidor.configurar_bd(str(tmp_path / 'otra.db'), rutas_shards=[str(tmp_path / 'otra.db')],
+                           ruta_archivo=str(tmp_path / 'otra_archivo.db'))
+    init_db = servidor.init_db
+    fallos = [sqlite3.OperationalError('disco lleno')]
+    def init_db_que_falla():
+        if fallos:
+            raise fallos.pop()
+        init_db()
+    monkeypatch.setattr(servidor, 'init_db', init_db_que_falla)
+
+    cliente = app.test_client()
+    errores = set()
+    limite = time.time() + 5
+    while (respuesta := cliente.get('/readyz')).status_code != 200:
+        errores.add(respuesta.get_json()['error'])
+        assert time.time() < limite
+        time.sleep(0.01)
+    assert 'OperationalError: disco lleno' in errores
+    assert 'Falló la preparación del proceso' in caplog.text
+
+def test_init_db_upgrades_legacy_database(tmp_path):
+    """Una base creada antes del registro de versiones se migra y queda al día"""
+    ruta = str(tmp_path / 'legado.db')
+    conn = sqlite3.connect(ruta)
+    conn.execute("CREATE TABLE usuarios (id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT UNIQUE NOT NULL, "
+                 "contraseña_hash TEXT NOT NULL, fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("CREATE TABLE tareas (id INTEGER PRIMARY KEY AUTOINCREMENT, usuario_id INTEGER, "
+                 "titulo TEXT NOT NULL, descripcion TEXT, completada BOOLEAN DEFAULT FALSE, "
+                 "fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("INSERT INTO tareas (usuario_id, titulo, completada) VALUES (1, 'Hecha', 1)")
+    conn.commit()
+    conn.close()
+
+    servidor.configurar_bd(ruta, rutas_shards=[ruta], ruta_archivo=str(tmp_path / 'archivo.db'))
+    servidor.init_db()
+
+    conn = sqlite3.connect(ruta)
+    versiones = dict(conn.execute("SELECT componente, version FROM esquema"))
+    assert versiones == {'directorio': len(servidor.MIGRACIONES_DIRECTORIO),
+                         'tareas': len(servidor.MIGRACIONES_TAREAS)}
+    assert conn.execute("SELECT fecha_completada IS NOT NULL FROM tareas").fetchone()[0] == 1
+    assert conn.execute("SELECT total, completadas FROM estadisticas_usuario").fetchone() == (1, 1)
+    conn.close()
+
+# Control de admisión
+
+def test_admission_sheds_excess_auth_requests(app, cliente, sesion, usuario, admin, monkeypatch):
+    """Con la clase de autenticación llena, /login responde 503 y el resto sigue"""
+    monkeypatch.setitem(app.config, 'ADMISION_LIMITES', {'autenticacion': 1})
+    assert servidor.admision.entrar('autenticacion')
+    try:
+        respuesta = cliente.post('/login', json=usuario)
+        assert respuesta.status_code == 503
+        assert respuesta.headers['Retry-After'] == str(app.config['ADMISION_REINTENTO'])
+        assert cliente.get('/healthz').status_code == 200
+        assert sesion.get('/api/tareas').status_code == 200
+    finally:
+        servidor.admision.salir('autenticacion')
+
+    assert cliente.post('/login', json=usuario).status_code == 200
+    cliente.post('/login', json=admin)
+    clases = cliente.get('/admin/admision').get_json()['clases']
+    assert clases['autenticacion']['rechazadas'] >= 1
+    assert clases['autenticacion']['en_curso'] == 0 and clases['lectura']['admitidas'] >= 1
+
+# Registro estructurado
+
+def test_structured_access_log(tmp_path, app, sesion, monkeypatch):
+    """Las líneas JSON llevan el X-Request-ID; las exitosas se muestrean y los errores no"""
+    ruta = tmp_path / 'servidor.log'
+    raiz = logging.getLogger()
+    nivel = raiz.level
+    oyente = bitacora.configurar(str(ruta))
+    try:
+        monkeypatch.setitem(app.config, 'BITACORA_MUESTREO', 0.0)
+        monkeypatch.setattr(metricas_sql.registro, 'umbral_lento', 0.0)
+        respuesta = sesion.get('/api/tareas', headers={'X-Request-ID': 'pedido-1'})
+        assert respuesta.headers['X-Request-ID'] == 'pedido-1'
+        monkeypatch.setattr(metricas_sql.registro, 'umbral_lento', 1.0)
+        generado = sesion.patch('/api/tareas/999', json={"titulo": "x"}).headers['X-Request-ID']
+    finally:
+        bitacora.detener(oyente)
+        raiz.setLevel(nivel)
+
+    lineas = [json.loads(linea) for linea in ruta.read_text(encoding='utf-8').splitlines()]
+    accesos = [l for l in lineas if l['logger'] == 'acceso']
+    assert [(l['id_peticion'], l['estado']) for l in accesos] == [(generado, 404)]
+    assert accesos[0]['metodo'] == 'PATCH' and accesos[0]['usuario_id'] and accesos[0]['ms'] >= 0
+    assert any(l['logger'] == 'sql' and l['id_peticion'] == 'pedido-1' for l in lineas)
+
+# Administración y planificador
+
+def test_admin_jobs_requires_admin(cliente, sesion, admin):
+    """Solo los administradores ven los trabajos de mantenimiento"""
+    assert sesion.get('/admin/trabajos').status_code == 403
+
+    cliente.post('/login', json=admin)
+    servidor.registrar_trabajos()
+    nombres = {t['nombre'] for t in cliente.get('/admin/trabajos').get_json()['trabajos']}
+    assert {'checkpoint_wal', 'optimizar', 'archivado'} <= nombres
+
+def test_admin_sql_statistics(cliente, sesion, monkeypatch, admin):
+    """Las sentencias se agrupan normalizadas y las lentas guardan su plan"""
+    assert sesion.get('/admin/sql').status_code == 403
+    assert metricas_sql.normalizar("SELECT * FROM t WHERE id IN (?, ?,  ?) AND x = 'a''b' AND n = 42") == \
+        "SELECT * FROM t WHERE id IN (...) AND x = ? AND n = ?"
+
+    cliente.post('/login', json=admin)
+    assert cliente.delete('/admin/sql').status_code == 200
+    monkeypatch.setattr(metricas_sql.registro, 'umbral_lento', 0.0)
+    for i in range(3):
+        crear_tarea(cliente, f'Tarea {i}')
+    assert len(cliente.get('/api/tareas').get_json()['tareas']) == 3
+
+    datos = cliente.get('/admin/sql?orden=llamadas').get_json()
+    insercion = next(s for s in datos['sentencias'] if s['sentencia'].startswith('INSERT INTO tareas'))
+    assert insercion['llamadas'] == 3 and insercion['modificadas'] == 3
+    lectura = next(s for s in datos['sentencias'] if 'FROM tareas WHERE usuario_id' in s['sentencia'])
+    assert lectura['filas'] >= 3 and lectura['maximo_ms'] >= 0
+    assert any(l['plan'] and 'EXPLAIN' not in l['sentencia'] for l in datos['lentas'])
+    assert cliente.get('/admin/sql?orden=otro').status_code == 400
+
+def test_cron_next_run():
+    """Las expresiones cron calculan la próxima ejecución"""
+    cron = Cron('30 3 * * 1')
+    assert cron.siguiente(datetime.datetime(2026, 10, 19, 4, 0)) == datetime.datetime(2026, 10, 26, 3, 30)
+    assert Cron('5/15 * * * *').minutos == {5, 20, 35, 50}
+    assert Cron('10-20/5 * * * *').minutos == {10, 15, 20}
+    for expresion in ('20-10 * * * *', '*/0 * * * *', '5/-1 * * * *', '60 * * * *'):
+        with pytest.raises(ValueError):
+            Cron(expresion)
+
+# Benchmarks
+
+def test_benchmark_comparison():
+    """El control de regresiones tolera el ruido y detecta empeoramientos reales"""
+    base = {'mediana': 1.0, 'mad': 0.02}
+    assert comparar(base, {'mediana': 1.05, 'mad': 0.02})['veredicto'] == 'igual'
+    assert comparar(base, {'mediana': 1.30, 'mad': 0.50})['veredicto'] == 'igual'
+    assert comparar(base, {'mediana': 1.30, 'mad': 0.02})['veredicto'] == 'regresion'
+    assert comparar(base, {'mediana': 0.50, 'mad': 0.02})['veredicto'] == 'mejora'
+
+# SDK
+
+def test_sdk_maps_errors(url_servidor, usuario):
+    """Las respuestas de error llegan como ErrorAPI y los fallos de red como ErrorConexion"""
+    with ClienteAPI(url_servidor) as api:
+        with pytest.raises(ErrorAPI) as error:
+            api.iniciar_sesion(usuario['usuario'], 'otra')
+        assert error.value.status == 401 and error.value.mensaje == 'Contraseña incorrecta'
+        assert api.iniciar_sesion(**usuario)['usuario'] == usuario['usuario']
+        assert api.crear_tarea("Desde el SDK")['titulo'] == "Desde el SDK"
+
+    with socket.socket() as libre:
+        libre.bind(('127.0.0.1', 0))
+        puerto = libre.getsockname()[1]
+    with ClienteAPI(f'http://127.0.0.1:{puerto}', reintentos=0) as api:
+        with pytest.raises(ErrorConexion):
+            api.estado()
+        assert api.disponible() is False
+
+def test_sdk_retries_503_with_backoff(app, url_servidor, usuario, monkeypatch):
+    """Los 503 se reintentan con backoff exponencial antes de llegar como ErrorAPI"""
+    monkeypatch.setitem(app.config, 'ADMISION_LIMITES', {'autenticacion': 1})
+    monkeypatch.setitem(app.config, 'ADMISION_REINTENTO', 0)
+    assert servidor.admision.entrar('autenticacion')
+    try:
+        rechazadas = servidor.admision.clases['autenticacion'].rechazadas
+        inicio = time.perf_counter()
+        with ClienteAPI(url_servidor, reintentos=3, backoff=0.05) as api:
+            with pytest.raises(ErrorAPI) as error:
+                api.iniciar_sesion(**usuario)
+        # Un intento y tres reintentos; esperas de 0, 0.1 y 0.2 segundos
+        assert error.value.status == 503
+        assert servidor.admision.clases['autenticacion'].rechazadas - rechazadas == 4
+        assert time.perf_counter() - inicio >= 0.3
+    finally:
+        servidor.admision.salir('autenticacion')
+
+def test_async_sdk_runs_calls_concurrently(url_servidor, usuario):
+    """El cliente asyncio reparte las llamadas en su pool y comparte la sesión"""
+    async def escenario():
+        async with ClienteAPIAsync(url_servidor, concurrencia=4) as api:
+            await api.iniciar_sesion(**usuario)
+            creadas = await asyncio.gather(*(api.crear_tarea(f"Tarea {i}") for i in range(8)))
+            return creadas, await api.listar_tareas()
+
+    creadas, tareas = asyncio.run(escenario())
+    assert len({t['id'] for t in creadas}) == 8
+    assert sorted(t['titulo'] for t in tareas) == sorted(f"Tarea {i}" for i in range(8))
+
+# Cliente en modo script
+
+def test_script_mode_runs_per_user_in_parallel(tmp_path, url_servidor, capsys):
+    """Cada usuario ejecuta el script con sus credenciales; las llaves ajenas quedan literales"""
+    script = tmp_path / 'acciones.txt'
+    script.write_text(
+        '# Alta y primeras tareas\n'
+        'registro {usuario} {contraseña}\n'
+        'login {usuario} {contraseña}\n'
+        'crear "{0} {"\n'
+        'crear "Fix {config} de {usuario}" "Detalle"\n'
+        'completar $ultima\n'
+        'crear\n'
+        'listar\n', encoding='utf-8')
+    modo = ModoScript.desde_archivo(str(script), url_servidor)
+
+    assert modo.ejecutar([('ana', '1234'), ('bruno', '5678')], paralelo=2) is False
+    assert modo.errores == {'crear': 2}
+    assert len(modo.tiempos['crear']) == 6 and len(modo.tiempos['listar']) == 2
+    salida = capsys.readouterr().out
+    assert "❌ [ana] crear → Error: 'crear' requiere 1 argumento(s)" in salida
+
+    with ClienteAPI(url_servidor) as api:
+        api.iniciar_sesion('bruno', '5678')
+        tareas = {t['titulo']: t['completada'] for t in api.listar_tareas()}
+    assert tareas == {"{0} {": False, "Fix {config} de bruno": True}
+
+def test_script_mode_stops_on_first_error(tmp_path, url_servidor):
+    """Sin usuarios el script corre una vez; con detener_en_error corta en la línea fallida"""
+    script = tmp_path / 'acciones.txt'
+    script.write_text('status\ncompletar abc\nstatus\n', encoding='utf-8')
+    modo = ModoScript.desde_archivo(str(script), url_servidor, detener_en_error=True)
+    assert modo.ejecutar() is False
+    assert {c: len(t) for c, t in modo.tiempos.items()} == {'status': 1, 'completar': 1}
+
+    script.write_text('crear "sin cerrar\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='Línea 1'):
+        ModoScript.desde_archivo(str(script), url_servidor)
+
+# Caché y cola del cliente
+
+def esperar(condicion, segundos=5.0):
+    """Espera a que condicion() sea verdadera (trabajos en hilos de fondo)"""
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite, "la condición no se cumplió a tiempo"
+        time.sleep(0.02)
+
+def test_client_cache_serves_stale_and_revalidates(tmp_path):
+    """Una copia vencida se devuelve al instante y se recarga en segundo plano"""
+    cargas = []
+    def cargar():
+        cargas.append(1)
+        return len(cargas)
+
+    cache = CacheCliente(ClienteAPI('http://127.0.0.1:1'), ruta=str(tmp_path / 'cache.db'), ttl=0)
+    try:
+        assert cache.obtener('clave', cargar) == (1, False)
+        assert cache.obtener('clave', cargar) == (1, True)
+        esperar(lambda: cache.obtener('clave', cargar)[0] == 2)
+    finally:
+        cache.cerrar()
+
+def test_client_queue_batches_writes(tmp_path, url_servidor, usuario):
+    """Las escrituras se combinan en la cola local y llegan al servidor en un lote"""
+    with ClienteAPI(url_servidor) as api:
+        api.iniciar_sesion(**usuario)
+        cache = CacheCliente(api, ruta=str(tmp_path / 'cache.db'), intervalo_envio=60)
         try:
-            response = self.session.get(f"{self.base_url}/tareas")
-            success = response.status_code == 200
-            
-            if success:
-                message = "Acceso autorizado exitoso"
-            else:
-                message = f"HTTP {response.status_code}"
-            
-            self.log_test("Acceso con autenticación", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Acceso con autenticación", False, f"Error: {e}")
-            return False
-    
-    def test_logout(self) -> bool:
-        """Test 9: Logout de usuario"""
+            cache.usar_usuario(usuario['usuario'])
+            # El hilo de envío espera mientras se arma la cola
+            with cache._envio:
+                temporal = cache.crear_tarea("Comprar pan")
+                cache.actualizar_tarea(temporal, completada=True)
+                descartada = cache.crear_tarea("Descartada")
+                cache.eliminar_tarea(descartada)
+                assert temporal < 0 and cache.cantidad_pendientes() == 1
+                vista, _ = cache.tareas()
+                assert [(t['titulo'], t['completada'], t['pendiente']) for t in vista] == \
+                    [("Comprar pan", True, True)]
+
+            cache.vaciar()
+            assert cache.cantidad_pendientes() == 0 and not cache.errores
+            assert [(t['titulo'], t['completada']) for t in api.listar_tareas()] == [("Comprar pan", True)]
+        finally:
+            cache.cerrar()
+
+def test_client_queue_retried_flush_is_not_duplicated(tmp_path, url_servidor, usuario, monkeypatch):
+    """Un lote aplicado cuya respuesta se perdió se reenvía con su clave, también tras reiniciar"""
+    with ClienteAPI(url_servidor) as api:
+        api.iniciar_sesion(**usuario)
+        lote_tareas = api.lote_tareas
+        claves = []
+        def sin_respuesta(operaciones, clave_idempotencia=None):
+            # El servidor aplica el lote pero la respuesta no llega (timeout de lectura)
+            claves.append(clave_idempotencia)
+            lote_tareas(operaciones, clave_idempotencia=clave_idempotencia)
+            raise ErrorConexion('Read timed out')
+        monkeypatch.setattr(api, 'lote_tareas', sin_respuesta)
+
+        ruta = str(tmp_path / 'cache.db')
+        cache = CacheCliente(api, ruta=ruta, intervalo_envio=60)
+        cache.usar_usuario(usuario['usuario'])
+        cache.crear_tarea("Una sola vez")
+        cache.vaciar()
+        assert cache.cantidad_pendientes() == 1
+        cache.cerrar()
+
+        monkeypatch.setattr(api, 'lote_tareas', lote_tareas)
+        cache = CacheCliente(api, ruta=ruta, intervalo_envio=60)
         try:
-            response = self.session.post(f"{self.base_url}/logout")
-            success = response.status_code == 200
-            
-            if success:
-                result = response.json()
-                message = f"Logout exitoso: {result.get('mensaje', 'OK')}"
-            else:
-                message = f"HTTP {response.status_code}"
-            
-            self.log_test("Logout de usuario", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Logout de usuario", False, f"Error: {e}")
-            return False
-    
-    def test_access_after_logout(self) -> bool:
-        """Test 10: Verificar que no se pueda acceder después del logout"""
+            cache.usar_usuario(usuario['usuario'])
+            cache.vaciar()
+            assert cache.cantidad_pendientes() == 0 and not cache.errores
+        finally:
+            cache.cerrar()
+
+        assert claves and len(set(claves)) == 1
+        assert [t['titulo'] for t in api.listar_tareas()] == ["Una sola vez"]
+
+def test_client_queue_sets_aside_rejected_batch(tmp_path, url_servidor, usuario, monkeypatch):
+    """Un lote rechazado con un 4xx definitivo se aparta y no traba al resto de la cola"""
+    monkeypatch.setitem(servidor.LIMITE_CUERPO_POR_ENDPOINT, 'lote_tareas', 400)
+    with ClienteAPI(url_servidor) as api:
+        api.iniciar_sesion(**usuario)
+        cache = CacheCliente(api, ruta=str(tmp_path / 'cache.db'), intervalo_envio=60, lote=1)
         try:
-            response = self.session.get(f"{self.base_url}/tareas")
-            success = response.status_code == 401  # Esperamos unauthorized
-            
-            if success:
-                message = "Acceso correctamente denegado después del logout"
-            else:
-                message = f"HTTP {response.status_code} (se esperaba 401)"
-            
-            self.log_test("Protección después de logout", success, message)
-            return success
-            
-        except Exception as e:
-            self.log_test("Protección después de logout", False, f"Error: {e}")
-            return False
-    
-    def run_all_tests(self):
-        """Ejecuta todos los tests"""
-        print("🧪 INICIANDO TESTS AUTOMATIZADOS")
-        print("=" * 50)
-        
-        # Lista de tests a ejecutar
-        tests = [
-            self.test_server_status,
-            self.test_user_registration,
-            self.test_duplicate_registration,
-            self.test_invalid_registration,
-            self.test_login_success,
-            self.test_login_invalid_credentials,
-            self.test_protected_endpoint_without_auth,
-            self.test_protected_endpoint_with_auth,
-            self.test_logout,
-            self.test_access_after_logout
-        ]
-        
-        # Ejecutar tests
-        for i, test in enumerate(tests, 1):
-            print(f"\n[{i:2d}/10] ", end="")
-            test()
-            time.sleep(0.5)  # Pequeña pausa entre tests
-        
-        # Resumen final
-        print("\n" + "=" * 50)
-        print("📊 RESUMEN DE TESTS")
-        print("=" * 50)
-        print(f"✅ Tests pasados: {self.tests_passed}")
-        print(f"❌ Tests fallidos: {self.tests_failed}")
-        print(f"📊 Total tests: {self.tests_passed + self.tests_failed}")
-        
-        success_rate = (self.tests_passed / (self.tests_passed + self.tests_failed)) * 100
-        print(f"🎯 Tasa de éxito: {success_rate:.1f}%")
-        
-        if self.tests_failed == 0:
-            print("\n🎉 ¡TODOS LOS TESTS PASARON!")
-            print("✨ El sistema está funcionando correctamente")
-            return True
-        else:
-            print(f"\n⚠️  {self.tests_failed} test(s) fallaron")
-            print("🔧 Revisar los errores antes de continuar")
-            return False
-
-def main():
-    """Función principal"""
-    print("🚀 Sistema de Gestión de Tareas - Test Suite")
-    print("Verificando API en http://localhost:5000")
-    print("=" * 50)
-    
-    tester = TestAPI()
-    
-    # Verificar conexión inicial
-    if not tester.test_server_status():
-        print("\n❌ No se puede conectar al servidor")
-        print("💡 Asegúrate de que el servidor esté ejecutándose:")
-        print("   python servidor.py")
-        sys.exit(1)
-    
-    # Ejecutar todos los tests
-    success = tester.run_all_tests()
-    
-    # Código de salida
-    sys.exit(0 if success else 1)
+            cache.usar_usuario(usuario['usuario'])
+            with cache._envio:
+                cache.crear_tarea("Enorme", "x" * 1000)
+                cache.crear_tarea("Pequeña")
+            cache.vaciar()
+            cache.vaciar()
+            assert cache.cantidad_pendientes() == 0
+            assert len(cache.errores) == 1 and '(413)' in cache.errores[0]
+            assert [t['titulo'] for t in api.listar_tareas()] == ["Pequeña"]
+            rechazadas = sqlite3.connect(str(tmp_path / 'cache.db')).execute(
+                "SELECT op, json_extract(datos, '$.titulo') FROM rechazadas").fetchall()
+            assert rechazadas == [('crear', "Enorme")]
+        finally:
+            cache.cerrar()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(pytest.main([__file__, "-q"]))
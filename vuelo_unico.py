@@ -0,0 +1,69 @@
+"""
+Coalescencia de lecturas concurrentes idénticas (single-flight)
+Cuando varios hilos piden a la vez el mismo cálculo, solo el primero lo
+ejecuta; los demás esperan y reciben su resultado (o su excepción). No es una
+caché: en cuanto el cálculo termina, la siguiente llamada vuelve a ejecutarlo.
+"""
+
+import threading
+
+class _Vuelo:
+    """Cálculo en curso de una clave y su resultado"""
+
+    __slots__ = ('listo', 'resultado', 'error')
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+class VueloUnico:
+    """Grupo de cálculos en curso por clave.
+
+    El resultado se comparte entre todos los que esperaban, así que no debe
+    modificarse. Solo sirve para lecturas: un hilo que llega durante el cálculo
+    recibe un valor que pudo empezar a calcularse antes de su propia escritura.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vuelos = {}
+        self.ejecuciones = 0
+        self.compartidas = 0
+
+    def hacer(self, clave, funcion, *args):
+        """Resultado de funcion(*args), compartido con las llamadas simultáneas de la misma clave"""
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.ejecuciones += 1
+            else:
+                self.compartidas += 1
+
+        if not lider:
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion(*args)
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+            vuelo.listo.set()
+
+    def estado(self):
+        """Cálculos ejecutados, resultados compartidos y claves en curso"""
+        with self._lock:
+            return {
+                'ejecuciones': self.ejecuciones,
+                'compartidas': self.compartidas,
+                'en_curso': len(self._vuelos)
+            }